@@ -0,0 +1,159 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import metrics
+import pipeline
+import query_translator
+import schema_loader
+import table_summarizer
+from catalog import Catalog, load_catalog
+from fake_backends import FaultInjector, installed
+from sql_parser import extract_tables_and_columns, iter_sql_statements
+
+TABLE_FILE_PATH = "spider_tables.json"
+SQL_FILE_PATH = "./metadata/spider.sql"
+OPENSEARCH_CONFIG_PATH = "./metadata/opensearch.yml"
+
+# scripts in pipeline order, with the stage whose throughput is reported
+THROUGHPUT_STAGES = {
+    "schema_loader": "describe_tables",
+    "query_translator": "translate_queries",
+    "table_summarizer": "summarize_tables",
+    "pipeline": "translate_queries",
+}
+SEQUENTIAL_SCRIPTS = ("schema_loader", "query_translator", "table_summarizer")
+# pipeline.py replaces query_translator and table_summarizer
+STREAMING_SCRIPTS = ("schema_loader", "pipeline")
+
+def select_inputs(max_tables=None):
+    """
+    Returns (Catalog, SQL statements) for the benchmark. With `max_tables`, whole databases are
+    taken in the order spider.sql first uses them, and only the statements on those tables are kept.
+    """
+    tables = load_catalog(TABLE_FILE_PATH)
+    with open(SQL_FILE_PATH, 'r', encoding='utf-8') as file:
+        statements = list(iter_sql_statements(file))
+    if not max_tables:
+        return tables, statements
+
+    lookup = tables.column_lookup()
+    schemas = [extract_tables_and_columns(sql, lookup) for sql in statements]
+
+    selected_dbs = []
+    selected_tables = 0
+    for schema in schemas:
+        for table in (schema or {}).get("table", []):
+            db_id = tables.get(table).db_id
+            if db_id not in selected_dbs and selected_tables < max_tables:
+                selected_dbs.append(db_id)
+                selected_tables += len(tables.database(db_id))
+
+    statements = [sql for sql, schema in zip(statements, schemas)
+                  if schema is not None and all(tables.get(table).db_id in selected_dbs for table in schema["table"])]
+    return Catalog(table for table in tables if table.db_id in selected_dbs), statements
+
+def prepare_workdir(workdir, tables, statements):
+    os.makedirs(os.path.join(workdir, "metadata"), exist_ok=True)
+    with open(os.path.join(workdir, TABLE_FILE_PATH), 'w', encoding='utf-8') as file:
+        json.dump({table.name: table.to_dict() for table in tables}, file, indent=4, ensure_ascii=False)
+    with open(os.path.join(workdir, SQL_FILE_PATH), 'w', encoding='utf-8') as file:
+        file.write("".join(sql + ";\n" for sql in statements))
+    shutil.copy(OPENSEARCH_CONFIG_PATH, os.path.join(workdir, OPENSEARCH_CONFIG_PATH))
+
+def run_script(script, args):
+    """Runs the script's main() in the current directory and returns a summary of its run report."""
+    mains = {
+        "schema_loader": lambda: schema_loader.main(max_in_flight=args.max_in_flight, token_budget=args.batch_token_budget),
+        "query_translator": query_translator.main,
+        "table_summarizer": table_summarizer.main,
+        "pipeline": pipeline.main,
+    }
+    error = None
+    try:
+        metrics.run(script, mains[script], report_dir="./reports")
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        print(f"{script} failed: {error}")
+
+    with open(os.path.join("reports", f"{script}.json"), 'r', encoding='utf-8') as file:
+        report = json.load(file)
+    stage = next((s for s in report["stages"] if s["stage"] == THROUGHPUT_STAGES[script]), {"items": 0, "seconds": 0.0, "items_per_second": 0.0})
+    calls = report["calls"]
+    return {
+        "script": script,
+        "stage": THROUGHPUT_STAGES[script],
+        "items": stage["items"],
+        "stage_seconds": stage["seconds"],
+        "items_per_second": stage["items_per_second"],
+        "total_seconds": report["seconds"],
+        "calls": sum(call["count"] for call in calls.values()),
+        "retries": sum(call["retries"] for call in calls.values()),
+        "errors": sum(call["errors"] for call in calls.values()),
+        "error": error,
+        "report": report,
+    }
+
+def run(args):
+    tables, statements = select_inputs(args.tables)
+    print(f"Benchmarking with {len(tables)} tables and {len(statements)} SQL statements")
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="pipeline-benchmark-")
+    prepare_workdir(workdir, tables, statements)
+
+    faults = {
+        "chat": FaultInjector(args.chat_latency, args.throttle_rate, args.error_rate, args.seed),
+        "embedding": FaultInjector(args.embedding_latency, args.throttle_rate, args.error_rate, args.seed + 10),
+        "opensearch": FaultInjector(args.bulk_latency, args.throttle_rate, args.error_rate, args.seed + 20),
+    }
+
+    cwd = os.getcwd()
+    results = []
+    os.chdir(workdir)
+    try:
+        with installed(faults["chat"], faults["embedding"], faults["opensearch"], args.output_token_ms / 1000):
+            for script in STREAMING_SCRIPTS if args.streaming else SEQUENTIAL_SCRIPTS:
+                results.append(run_script(script, args))
+                if results[-1]["error"]:
+                    break
+    finally:
+        os.chdir(cwd)
+        if not args.workdir and not args.keep:
+            shutil.rmtree(workdir)
+        else:
+            print(f"Pipeline outputs and run reports are in {workdir}")
+
+    print(f"{'script':<18} {'stage':<18} {'items':>6} {'seconds':>9} {'items/s':>9} {'total s':>9} {'calls':>6} {'retries':>8} {'errors':>7}")
+    for result in results:
+        print(f"{result['script']:<18} {result['stage']:<18} {result['items']:>6} {result['stage_seconds']:>9.2f} "
+              f"{result['items_per_second']:>9.2f} {result['total_seconds']:>9.2f} {result['calls']:>6} {result['retries']:>8} {result['errors']:>7}")
+    print(f"End to end: {sum(result['total_seconds'] for result in results):.2f}s")
+
+    if args.output:
+        settings = {key: value for key, value in vars(args).items() if key not in ("output", "workdir", "keep")}
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump({"settings": settings, "results": results}, file, indent=4)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end throughput of the pipeline against local Bedrock/OpenSearch stand-ins.")
+    parser.add_argument("--tables", type=int, default=100, help="approximate number of tables (whole databases); 0 for all")
+    parser.add_argument("--chat-latency", default="lognormal:200:0.5",
+                        help='chat latency in ms: "fixed:MS", "uniform:MIN:MAX" or "lognormal:MEDIAN:SIGMA"')
+    parser.add_argument("--output-token-ms", type=float, default=0.0, help="added chat latency per output token")
+    parser.add_argument("--embedding-latency", default="lognormal:20:0.3")
+    parser.add_argument("--bulk-latency", default="fixed:10")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of calls/bulk items that are throttled")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls/bulk items that fail")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-in-flight", type=int, default=schema_loader.MAX_IN_FLIGHT, help="schema_loader concurrency")
+    parser.add_argument("--streaming", action="store_true", help="run pipeline.py instead of query_translator and table_summarizer")
+    parser.add_argument("--batch-token-budget", type=int, default=schema_loader.BATCH_TOKEN_BUDGET, help="schema_loader batch size (0: one table per request)")
+    parser.add_argument("--workdir", help="run in this directory and keep it (default: a temporary directory)")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary directory")
+    parser.add_argument("--output", help="write the results and run reports as JSON")
+    run(parser.parse_args())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import argparse
+import itertools
+import json
+import time
+import numpy as np
+from retriever import (
+    QUERY_FILE_PATH, QUERY_VECTOR_PATH, SCHEMA_FILE_PATH,
+    LocalRetriever, load_schema_retriever,
+)
+from catalog import load_catalog
+from json_stream import read_records
+from opensearch_utils import create_os_client, load_opensearch_config
+from sql_parser import extract_tables_and_columns
+from vector_store import load_vectors
+
+SCHEMA_INDEX_NAME = "schema_descriptions"
+
+def load_benchmark():
+    """
+    Builds (query vector, relevant table names) pairs: every translated query in
+    QUERY_FILE_PATH is labeled with the tables its SQL references.
+    """
+    tables = load_catalog(SCHEMA_FILE_PATH)
+    catalog = tables.column_lookup()
+
+    query_vectors = load_vectors(QUERY_VECTOR_PATH)
+    cases = []
+    skipped = 0
+    for data in read_records(QUERY_FILE_PATH):
+        schema = extract_tables_and_columns(data['query'], catalog)
+        if schema is None or data['fingerprint'] not in query_vectors:
+            skipped += 1
+            continue
+        relevant = {tables.get(table).name for table in schema["table"]}
+        cases.append((np.array(query_vectors.get(data['fingerprint'])), relevant))
+
+    print(f"Loaded {len(cases)} labeled queries ({skipped} skipped: unresolved tables or missing vectors)")
+    return cases
+
+def evaluate(search, cases, k):
+    """`search(vector, k)` returns ranked table names. Returns recall@k, MRR and latency percentiles."""
+    recalls = []
+    reciprocal_ranks = []
+    latencies = []
+    for vector, relevant in cases:
+        start = time.perf_counter()
+        ranked = search(vector, k)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        recalls.append(len(relevant.intersection(ranked)) / len(relevant))
+        rank = next((i for i, table_name in enumerate(ranked, 1) if table_name in relevant), None)
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        f"recall@{k}": float(np.mean(recalls)),
+        "mrr": float(np.mean(reciprocal_ranks)),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+    }
+
+def local_search(retriever, **search_params):
+    def search(vector, k):
+        return [hit["_id"] for hit in retriever.search(vector, k, **search_params)]
+    return search
+
+def opensearch_search(os_client, ef_search):
+    def search(vector, k):
+        # the index setting index.knn.algo_param.ef_search only applies to nmslib; faiss takes it per query
+        knn = {"vector": vector.tolist(), "k": k, "method_parameters": {"ef_search": ef_search}}
+        body = {"size": k, "_source": False, "query": {"knn": {"table_summary_v": knn}}}
+        response = os_client.search(index=SCHEMA_INDEX_NAME, body=body)
+        return [hit["_id"] for hit in response["hits"]["hits"]]
+    return search
+
+def run(args):
+    cases = load_benchmark()
+    results = []
+
+    def record(name, params, metrics):
+        results.append({"backend": name, **params, **metrics})
+        settings = " ".join(f"{key}={value}" for key, value in params.items())
+        print(f"{name:<10} {settings:<40} recall@{args.k}={metrics[f'recall@{args.k}']:.3f} mrr={metrics['mrr']:.3f} "
+              f"p50={metrics['p50_ms']:.2f}ms p95={metrics['p95_ms']:.2f}ms p99={metrics['p99_ms']:.2f}ms")
+
+    if "exact" in args.backend:
+        retriever = load_schema_retriever("exact")
+        record("exact", {}, evaluate(local_search(retriever), cases, args.k))
+
+    if "hnsw" in args.backend:
+        exact = load_schema_retriever("exact")
+        for m, ef_construction in itertools.product(args.m, args.ef_construction):
+            start = time.perf_counter()
+            retriever = LocalRetriever(exact.ids, exact.index.vectors, exact.documents, "hnsw",
+                                       m=m, ef_construction=ef_construction)
+            build_seconds = time.perf_counter() - start
+            for ef_search in args.ef_search:
+                params = {"m": m, "ef_construction": ef_construction, "ef_search": ef_search}
+                metrics = evaluate(local_search(retriever, ef_search=ef_search), cases, args.k)
+                record("hnsw", params, {**metrics, "build_s": build_seconds})
+
+    if "opensearch" in args.backend:
+        # m / ef_construction are fixed when the index is built; ef_search is passed with every query
+        os_client = create_os_client(load_opensearch_config())
+        for ef_search in args.ef_search:
+            record("opensearch", {"ef_search": ef_search}, evaluate(opensearch_search(os_client, ef_search), cases, args.k))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=4)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Schema retrieval quality/latency benchmark built from spider.sql.")
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--backend", nargs="+", choices=["exact", "hnsw", "opensearch"], default=["exact", "hnsw"])
+    parser.add_argument("--m", type=int, nargs="+", default=[16])
+    parser.add_argument("--ef-construction", type=int, nargs="+", default=[512])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[512])
+    parser.add_argument("--output", help="write the results as JSON")
+    run(parser.parse_args())
+
+if __name__ == "__main__":
+    main()
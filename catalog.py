@@ -0,0 +1,236 @@
+import argparse
+import hashlib
+import json
+import marshal
+import os
+import sys
+import time
+from json_stream import CHUNK_SIZE, iter_json_object, read_records
+
+# Snapshots of parsed table files, reused while the file is unchanged
+SNAPSHOT_DIR = "./.cache/catalog"
+# bump when the snapshot layout changes
+SNAPSHOT_VERSION = 1
+
+class Column:
+    __slots__ = ("name", "format", "desc", "pk")
+
+    def __init__(self, name, format=None, desc=None, pk=None):
+        self.name = name
+        self.format = format
+        self.desc = desc
+        self.pk = pk
+
+    def to_dict(self):
+        data = {"col": self.name}
+        if self.format is not None:
+            data["format"] = self.format
+        if self.desc is not None:
+            data["col_desc"] = self.desc
+        if self.pk is not None:
+            data["pk"] = self.pk
+        return data
+
+class ForeignKey:
+    __slots__ = ("col", "ref_table", "ref_col")
+
+    def __init__(self, col, ref_table, ref_col):
+        self.col = col
+        self.ref_table = ref_table
+        self.ref_col = ref_col
+
+class Table:
+    """
+    One table of spider_tables.json (db_id, columns with format and pk, foreign keys) or of a
+    description file written by schema_loader / table_summarizer (descriptions, summary, fingerprint).
+    Fields a file does not have are None.
+    """
+    __slots__ = ("name", "db_id", "desc", "summary", "fingerprint", "columns", "foreign_keys", "_columns")
+
+    def __init__(self, name, db_id=None, desc=None, summary=None, fingerprint=None, columns=(), foreign_keys=()):
+        self.name = name
+        self.db_id = db_id
+        self.desc = desc
+        self.summary = summary
+        self.fingerprint = fingerprint
+        self.columns = list(columns)
+        self.foreign_keys = list(foreign_keys)
+        self._columns = None
+
+    @classmethod
+    def from_dict(cls, name, data):
+        return cls(
+            name, data.get("db_id"), data.get("table_desc"), data.get("table_summary"), data.get("fingerprint"),
+            [Column(col["col"], col.get("format"), col.get("col_desc"), col.get("pk")) for col in data.get("cols", [])],
+            [ForeignKey(fk["col"], fk["ref_table"], fk["ref_col"]) for fk in data.get("foreign_keys", [])],
+        )
+
+    def column(self, name):
+        """Column by case-insensitive name, or None."""
+        if self._columns is None:
+            self._columns = {}
+            for column in self.columns:
+                self._columns.setdefault(column.name.lower(), column)
+        return self._columns.get(name.lower())
+
+    def column_names(self):
+        return [column.name for column in self.columns]
+
+    def to_dict(self):
+        """The table in the JSON shape of the file it was read from."""
+        cols = [column.to_dict() for column in self.columns]
+        if self.db_id is not None:
+            return {"db_id": self.db_id, "cols": cols, "table_desc": self.desc,
+                    "foreign_keys": [{"col": fk.col, "ref_table": fk.ref_table, "ref_col": fk.ref_col} for fk in self.foreign_keys]}
+        data = {}
+        if self.desc is not None:
+            data["table_desc"] = self.desc
+        data["cols"] = cols
+        if self.summary is not None:
+            data["table_summary"] = self.summary
+        if self.fingerprint is not None:
+            data["fingerprint"] = self.fingerprint
+        return data
+
+class Catalog:
+    """Tables in file order, indexed by table name, db_id and column name (all case-insensitive)."""
+    def __init__(self, tables):
+        self.tables = list(tables)
+        self.positions = {}
+        self.databases = {}
+        for position, table in enumerate(self.tables):
+            self.positions.setdefault(table.name.lower(), position)
+            self.databases.setdefault(table.db_id, []).append(table)
+        self._by_column = None
+
+    def __len__(self):
+        return len(self.tables)
+
+    def __iter__(self):
+        return iter(self.tables)
+
+    def __contains__(self, table_name):
+        return table_name.lower() in self.positions
+
+    def get(self, table_name):
+        position = self.positions.get(table_name.lower())
+        return None if position is None else self.tables[position]
+
+    def position(self, table_name):
+        return self.positions[table_name.lower()]
+
+    def table_names(self):
+        return [table.name for table in self.tables]
+
+    def database(self, db_id):
+        return self.databases.get(db_id, [])
+
+    def tables_with_column(self, column_name):
+        if self._by_column is None:
+            self._by_column = {}
+            for table in self.tables:
+                for name in {column.name.lower() for column in table.columns}:
+                    self._by_column.setdefault(name, []).append(table)
+        return self._by_column.get(column_name.lower(), [])
+
+    def column_lookup(self):
+        """{table: {column: column name}} with lower-cased keys, the catalog sql_parser resolves against."""
+        return {table.name.lower(): {column.name.lower(): column.name for column in table.columns} for table in self.tables}
+
+def iter_table_items(file_path):
+    """
+    (table name, table data) pairs of a table file: a JSON object keyed by table name
+    (spider_tables.json) or {table: data} records (JSONL or a JSON array).
+    """
+    with open(file_path, 'r', encoding='utf-8') as file:
+        head = file.read(CHUNK_SIZE).lstrip()
+        file.seek(0)
+        first_line = file.readline()
+    try:
+        # an empty file is an empty JSONL file, e.g. the descriptions of a shard without tables
+        records = not head or head.startswith('[') or isinstance(json.loads(first_line), dict)
+    except ValueError:
+        records = False
+
+    if records:
+        for record in read_records(file_path):
+            yield from record.items()
+    else:
+        with open(file_path, 'r', encoding='utf-8') as file:
+            yield from iter_json_object(file)
+
+def parse_catalog(file_path):
+    return Catalog(Table.from_dict(table_name, table_data) for table_name, table_data in iter_table_items(file_path))
+
+def snapshot_path(file_path, snapshot_dir=SNAPSHOT_DIR):
+    key = hashlib.sha256(os.path.abspath(file_path).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(snapshot_dir, f"{os.path.basename(file_path)}.{key}.catalog")
+
+def snapshot_header(file_path):
+    stat = os.stat(file_path)
+    # marshal's format may change between Python versions
+    return (SNAPSHOT_VERSION, tuple(sys.version_info[:2]), stat.st_mtime_ns, stat.st_size)
+
+def save_snapshot(catalog, file_path, snapshot_dir=SNAPSHOT_DIR):
+    rows = tuple(
+        (table.name, table.db_id, table.desc, table.summary, table.fingerprint,
+         tuple((column.name, column.format, column.desc, column.pk) for column in table.columns),
+         tuple((fk.col, fk.ref_table, fk.ref_col) for fk in table.foreign_keys))
+        for table in catalog
+    )
+    path = snapshot_path(file_path, snapshot_dir)
+    os.makedirs(snapshot_dir, exist_ok=True)
+    with open(path + ".tmp", 'wb') as file:
+        file.write(marshal.dumps((snapshot_header(file_path), rows)))
+    os.replace(path + ".tmp", path)
+
+def load_snapshot(file_path, snapshot_dir=SNAPSHOT_DIR):
+    """The catalog stored for `file_path`, or None if there is none or the file changed since."""
+    path = snapshot_path(file_path, snapshot_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as file:
+            header, rows = marshal.loads(file.read())
+    except (ValueError, EOFError, TypeError):
+        return None
+    if header != snapshot_header(file_path):
+        return None
+    return Catalog(
+        Table(name, db_id, desc, summary, fingerprint,
+              [Column(*column) for column in columns], [ForeignKey(*fk) for fk in foreign_keys])
+        for name, db_id, desc, summary, fingerprint, columns, foreign_keys in rows
+    )
+
+def load_catalog(file_path, snapshot_dir=SNAPSHOT_DIR):
+    """
+    Parses a table file into a Catalog. The result is also stored as a binary snapshot in
+    `snapshot_dir` and loaded from there while the file is unchanged; None disables snapshots.
+    """
+    if snapshot_dir is None:
+        return parse_catalog(file_path)
+    catalog = load_snapshot(file_path, snapshot_dir)
+    if catalog is None:
+        catalog = parse_catalog(file_path)
+        save_snapshot(catalog, file_path, snapshot_dir)
+    return catalog
+
+def main():
+    parser = argparse.ArgumentParser(description="Load table files and show their size and load times.")
+    parser.add_argument("files", nargs="+")
+    args = parser.parse_args()
+
+    for file_path in args.files:
+        start = time.perf_counter()
+        catalog = parse_catalog(file_path)
+        parsed = time.perf_counter() - start
+        save_snapshot(catalog, file_path)
+        start = time.perf_counter()
+        load_snapshot(file_path)
+        loaded = time.perf_counter() - start
+        columns = sum(len(table.columns) for table in catalog)
+        print(f"{file_path}: {len(catalog)} tables, {columns} columns, {len(catalog.databases)} databases; "
+              f"JSON {parsed * 1000:.1f} ms, snapshot {loaded * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import argparse
+import os
+import time
+from catalog import load_catalog
+
+TABLE_FILE_PATH = "spider_tables.json"
+SCHEMA_FILE_PATH = "./metadata/spider_schemas.json"
+OUTPUT_FILE_PATH = "metadata/table_DDLs.sql"
+
+# Spider column types; dates are stored in many textual formats, so they stay strings
+COLUMN_TYPES = {
+    "mysql": {"number": "DOUBLE", "text": "VARCHAR(255)", "time": "VARCHAR(255)", "boolean": "BOOLEAN", "others": "VARCHAR(255)"},
+    "sqlite": {"number": "NUMERIC", "text": "TEXT", "time": "TEXT", "boolean": "BOOLEAN", "others": "TEXT"},
+}
+
+# MySQL limits on COMMENT lengths
+MAX_COLUMN_COMMENT = 1024
+MAX_TABLE_COMMENT = 2048
+
+def quote(dialect, name):
+    if dialect == "mysql":
+        return "`" + name.replace("`", "``") + "`"
+    return '"' + name.replace('"', '""') + '"'
+
+def quote_string(value):
+    return "'" + value.replace("\\", "\\\\").replace("'", "''") + "'"
+
+def load_descriptions(file_path=SCHEMA_FILE_PATH):
+    """Catalog of the table and column descriptions written by schema_loader."""
+    return load_catalog(file_path)
+
+def table_order(catalog):
+    """
+    Table names in dependency order: every table comes after the tables it references.
+    Tables in a reference cycle follow in file order.
+    """
+    depends_on = {
+        table.name: {catalog.get(fk.ref_table).name for fk in table.foreign_keys if fk.ref_table in catalog} - {table.name}
+        for table in catalog
+    }
+    order = []
+    done = set()
+    while len(done) < len(catalog):
+        level = [table.name for table in catalog if table.name not in done and depends_on[table.name] <= done]
+        if not level:
+            break
+        order.extend(level)
+        done.update(level)
+    order.extend(table.name for table in catalog if table.name not in done)
+    return order
+
+def column_formats(catalog):
+    """
+    {(table, column) (lower-cased): format}. A foreign key column takes the format of the column
+    it references, so that both sides of the constraint have the same type.
+    """
+    formats = {(table.name.lower(), column.name.lower()): column.format for table in catalog for column in table.columns}
+    references = {
+        (table.name.lower(), fk.col.lower()): (fk.ref_table.lower(), fk.ref_col.lower())
+        for table in catalog for fk in table.foreign_keys
+    }
+
+    def resolve(key, seen):
+        target = references.get(key)
+        if target is None or target not in formats or target in seen:
+            return formats[key]
+        return resolve(target, seen | {key})
+
+    return {key: resolve(key, {key}) for key in formats}
+
+def create_table(dialect, table, formats, catalog, created, indexed_columns, descriptions=None):
+    """Returns (CREATE TABLE statement, foreign keys to add once the referenced table exists)."""
+    table_key = table.name.lower()
+    described = descriptions.get(table.name) if descriptions is not None else None
+    types = COLUMN_TYPES[dialect]
+
+    lines = []
+    for column in table.columns:
+        line = f"{quote(dialect, column.name)} {types.get(formats[(table_key, column.name.lower())], types['others'])}"
+        described_column = described.column(column.name) if described is not None else None
+        if dialect == "mysql" and described_column is not None and described_column.desc:
+            line += f" COMMENT {quote_string(described_column.desc[:MAX_COLUMN_COMMENT])}"
+        lines.append(line)
+
+    primary_key = [column.name for column in table.columns if column.pk]
+    if primary_key:
+        lines.append(f"PRIMARY KEY ({', '.join(quote(dialect, col) for col in primary_key)})")
+
+    # MySQL needs an index that starts with every referenced column
+    if dialect == "mysql":
+        leading = primary_key[0].lower() if primary_key else None
+        for column in table.columns:
+            if column.name.lower() in indexed_columns.get(table_key, ()) and column.name.lower() != leading:
+                lines.append(f"KEY ({quote(dialect, column.name)})")
+
+    deferred = []
+    seen = set()
+    for fk in table.foreign_keys:
+        ref_table = catalog.get(fk.ref_table)
+        key = (fk.col.lower(), fk.ref_table.lower(), fk.ref_col.lower())
+        if ref_table is None or key in seen:
+            continue
+        seen.add(key)
+        constraint = f"FOREIGN KEY ({quote(dialect, fk.col)}) REFERENCES {quote(dialect, ref_table.name)} ({quote(dialect, fk.ref_col)})"
+        # SQLite resolves references when rows are written, MySQL when the table is created
+        if dialect == "mysql" and ref_table.name != table.name and ref_table.name not in created:
+            deferred.append(f"ALTER TABLE {quote(dialect, table.name)} ADD {constraint};")
+        else:
+            lines.append(constraint)
+
+    statement = f"CREATE TABLE {quote(dialect, table.name)} (\n    " + ",\n    ".join(lines) + "\n)"
+    if dialect == "mysql" and described is not None and described.desc:
+        statement += f" COMMENT={quote_string(described.desc[:MAX_TABLE_COMMENT])}"
+    return statement + ";", deferred
+
+def generate_ddl(catalog, dialect="mysql", descriptions=None):
+    """Yields one DDL statement per table in dependency order, followed by foreign keys of reference cycles."""
+    formats = column_formats(catalog)
+    indexed_columns = {}
+    for table in catalog:
+        for fk in table.foreign_keys:
+            indexed_columns.setdefault(fk.ref_table.lower(), set()).add(fk.ref_col.lower())
+
+    created = set()
+    deferred = []
+    for table_name in table_order(catalog):
+        statement, table_deferred = create_table(dialect, catalog.get(table_name), formats, catalog,
+                                                 created, indexed_columns, descriptions)
+        created.add(table_name)
+        deferred.extend(table_deferred)
+        yield statement
+    yield from deferred
+
+def main():
+    parser = argparse.ArgumentParser(description="Write CREATE TABLE statements for the preprocessed Spider catalog.")
+    parser.add_argument("--dialect", choices=sorted(COLUMN_TYPES), default="mysql")
+    parser.add_argument("--descriptions", action="store_true",
+                        help="add the table and column descriptions written by schema_loader as comments (MySQL)")
+    parser.add_argument("--output", default=OUTPUT_FILE_PATH)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    catalog = load_catalog(TABLE_FILE_PATH)
+    descriptions = load_descriptions() if args.descriptions and os.path.exists(SCHEMA_FILE_PATH) else None
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    count = 0
+    with open(args.output, 'w', encoding='utf-8') as file:
+        for statement in generate_ddl(catalog, args.dialect, descriptions):
+            file.write(statement + "\n\n")
+            count += 1
+    print(f"Wrote {count} statements for {len(catalog)} tables to {args.output} in {time.perf_counter() - start:.3f}s")
+
+if __name__ == "__main__":
+    main()
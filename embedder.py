@@ -0,0 +1,47 @@
+import hashlib
+from array import array
+from langchain_core.runnables import RunnableLambda
+from llm_cache import DiskCache
+from llm_executor import invoke_all
+import metrics
+
+EMBEDDING_CACHE_PATH = "./.cache/embedding_cache.db"
+MAX_CACHE_BYTES = 2 * 1024 * 1024 * 1024
+MAX_IN_FLIGHT = 8
+
+def embedding_key(emb_model, text):
+    model_id = getattr(emb_model, "model_id", type(emb_model).__name__)
+    dimensions = (getattr(emb_model, "model_kwargs", None) or {}).get("dimensions")
+    text_hash = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    return DiskCache.make_key(model_id, str(dimensions), text_hash)
+
+def embed_texts(emb_model, texts, store=None, max_in_flight=MAX_IN_FLIGHT):
+    """
+    Returns one embedding per entry of `texts`. Duplicate texts are embedded once,
+    cached vectors are reused, and the remaining texts are embedded concurrently.
+    """
+    if store is None:
+        store = DiskCache(EMBEDDING_CACHE_PATH, MAX_CACHE_BYTES)
+        try:
+            return embed_texts(emb_model, texts, store, max_in_flight)
+        finally:
+            store.close()
+
+    vectors = {}
+    missing = []
+    for text in dict.fromkeys(texts):
+        cached = store.get(embedding_key(emb_model, text))
+        if cached is None:
+            missing.append(text)
+        else:
+            vectors[text] = array('d', cached).tolist()
+
+    metrics.increment("embedding_cache_hits", len(vectors))
+    metrics.increment("embedding_requests", len(missing))
+    print(f"Embedding {len(missing)} texts ({len(texts)} requested, {len(vectors)} cached)")
+    embed = RunnableLambda(emb_model.embed_query)
+    for text, vector in zip(missing, invoke_all(embed, missing, max_in_flight=max_in_flight, call="embedding")):
+        store.put(embedding_key(emb_model, text), array('d', vector).tobytes())
+        vectors[text] = vector
+
+    return [vectors[text] for text in texts]
@@ -0,0 +1,380 @@
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from retriever import ExactIndex, l2_score
+
+CHARS_PER_TOKEN = 4
+
+TABLE_INFO_PATTERN = re.compile(r"<table_info>\s*Table Name: (.*?)\s*Column Names: (.*?)\s*</table_info>", re.S)
+
+class FakeBackendError(Exception):
+    pass
+
+class Latency:
+    """
+    Call latency distribution, in milliseconds:
+    "fixed:MS", "uniform:MIN:MAX" or "lognormal:MEDIAN:SIGMA".
+    """
+    def __init__(self, spec="fixed:0", seed=0):
+        kind, *params = spec.split(":")
+        if kind not in ("fixed", "uniform", "lognormal") or len(params) != {"fixed": 1}.get(kind, 2):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+        self.spec = spec
+        self.kind = kind
+        self.params = [float(param) for param in params]
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def sample(self):
+        """One latency in seconds."""
+        with self.lock:
+            if self.kind == "fixed":
+                ms = self.params[0]
+            elif self.kind == "uniform":
+                ms = self.rng.uniform(*self.params)
+            else:
+                ms = self.params[0] * self.rng.lognormvariate(0, self.params[1])
+        return ms / 1000
+
+class FaultInjector:
+    """Delays every call by a sampled latency and decides whether it is throttled or fails."""
+    def __init__(self, latency="fixed:0", throttle_rate=0.0, error_rate=0.0, seed=0):
+        self.latency = Latency(latency, seed)
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.rng = random.Random(seed + 1)
+        self.lock = threading.Lock()
+
+    def delay(self, extra_seconds=0.0):
+        time.sleep(self.latency.sample() + extra_seconds)
+
+    def outcome(self):
+        """None, "throttle" or "error"."""
+        with self.lock:
+            value = self.rng.random()
+        if value < self.throttle_rate:
+            return "throttle"
+        if value < self.throttle_rate + self.error_rate:
+            return "error"
+        return None
+
+    def call(self, service, extra_seconds=0.0):
+        self.delay(extra_seconds)
+        outcome = self.outcome()
+        # same error codes as Bedrock, so that llm_executor retries throttled calls only
+        if outcome == "throttle":
+            raise FakeBackendError(f"ThrottlingException: {service} rate exceeded")
+        if outcome == "error":
+            raise FakeBackendError(f"ModelErrorException: injected {service} failure")
+
+def respond(system, prompt):
+    """
+    Canned response shaped like what each pipeline prompt expects: table descriptions for
+    schema_loader, an (unresolved) table/column list for query_translator's extraction prompt,
+    and a short text echoing the SQL or the prompt otherwise.
+    """
+    tables = TABLE_INFO_PATTERN.findall(prompt)
+    if tables:
+        return json.dumps({
+            table: {
+                "table_desc": f"Stores {table} records.",
+                "cols": [{"col": col, "col_desc": f"The {col} of a {table} record."} for col in (col.strip() for col in columns.split(",")) if col],
+            }
+            for table, columns in tables
+        })
+    if '"table": [' in system:
+        return json.dumps({"table": [], "column": []})
+    if "SQL:" in prompt:
+        return "Request for " + prompt.rsplit("SQL:", 1)[1].strip()
+    return "Summary " + hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:16] + ". " + " ".join(prompt.split()[:200])
+
+def count_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+class FakeChatModel(BaseChatModel):
+    """Stand-in for ChatBedrock. Each output token adds `output_token_seconds` to the sampled latency."""
+    model_id: str = "fake-chat"
+    system: str = ""
+    faults: Any = None
+    output_token_seconds: float = 0.0
+
+    @property
+    def _llm_type(self):
+        return "fake-bedrock-chat"
+
+    @property
+    def _identifying_params(self):
+        return {"model_id": self.model_id, "system": self.system}
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        prompt = "\n".join(str(message.content) for message in messages)
+        text = respond(self.system, prompt)
+        input_tokens, output_tokens = count_tokens(self.system + prompt), count_tokens(text)
+        if self.faults is not None:
+            self.faults.call("chat", output_tokens * self.output_token_seconds)
+        usage = {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text, usage_metadata=usage))])
+
+class FakeEmbeddings(Embeddings):
+    """Stand-in for BedrockEmbeddings: unit vectors derived from a hash of the text."""
+    def __init__(self, model_id="fake-embedding", dimensions=1024, faults=None):
+        self.model_id = model_id
+        self.model_kwargs = {"dimensions": dimensions}
+        self.faults = faults
+
+    def embed_query(self, text):
+        if self.faults is not None:
+            self.faults.call("embedding")
+        seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.model_kwargs["dimensions"])
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+class FakeIndices:
+    def __init__(self, client):
+        self.client = client
+
+    def exists(self, index, **kwargs):
+        return index in self.client.indexes
+
+    def create(self, index, body=None, **kwargs):
+        with self.client.lock:
+            self.client.indexes[index] = {"body": body or {}, "docs": {}}
+        return {"acknowledged": True, "index": index}
+
+    def delete(self, index, **kwargs):
+        with self.client.lock:
+            self.client.indexes.pop(index, None)
+        return {"acknowledged": True}
+
+    def get_mapping(self, index=None, **kwargs):
+        return {index: {"mappings": self.client.indexes[index]["body"].get("mappings", {})}}
+
+    def put_settings(self, body, index=None, **kwargs):
+        return {"acknowledged": True}
+
+class FakeOpenSearch:
+    """
+    In-memory stand-in for the OpenSearch client calls the loaders make: index management,
+    bulk, match_all scans (helpers.scan) and exact kNN queries. A throttled bulk item is
+    rejected with 429 and retried by opensearch_utils; a failed item returns 400.
+    """
+    def __init__(self, faults=None):
+        self.faults = faults
+        self.indexes = {}
+        self.lock = threading.Lock()
+        self.indices = FakeIndices(self)
+
+    def _docs(self, index):
+        with self.lock:
+            return self.indexes.setdefault(index, {"body": {}, "docs": {}})["docs"]
+
+    def bulk(self, body, **kwargs):
+        if self.faults is not None:
+            self.faults.delay()
+        lines = iter(body.splitlines())
+        items = []
+        for line in lines:
+            action = json.loads(line)
+            operation, meta = next(iter(action.items()))
+            source = json.loads(next(lines)) if operation != "delete" else None
+            outcome = self.faults.outcome() if self.faults is not None else None
+            if outcome == "throttle":
+                result = {"status": 429, "error": {"type": "es_rejected_execution_exception", "reason": "bulk queue is full"}}
+            elif outcome == "error":
+                result = {"status": 400, "error": {"type": "mapper_parsing_exception", "reason": "injected bulk failure"}}
+            else:
+                docs = self._docs(meta["_index"])
+                with self.lock:
+                    if operation == "delete":
+                        found = docs.pop(meta["_id"], None) is not None
+                        result = {"status": 200 if found else 404, "result": "deleted" if found else "not_found"}
+                    else:
+                        docs[meta["_id"]] = source
+                        result = {"status": 201, "result": "created"}
+            items.append({operation: {"_index": meta["_index"], "_id": meta["_id"], **result}})
+        return {"took": 0, "errors": any(next(iter(item.values()))["status"] >= 300 for item in items), "items": items}
+
+    def search(self, body=None, index=None, scroll=None, size=None, _source=None, **kwargs):
+        if self.faults is not None:
+            self.faults.delay()
+        body = body or {}
+        query = body.get("query", {"match_all": {}})
+        docs = self._docs(index)
+        with self.lock:
+            entries = list(docs.items())
+
+        if "knn" in query:
+            field, params = next(iter(query["knn"].items()))
+            entries = [(doc_id, doc) for doc_id, doc in entries if field in doc]
+            found = ExactIndex([doc[field] for _, doc in entries]).search(params["vector"], params["k"]) if entries else []
+            hits = [(entries[row], l2_score(distance)) for row, distance in found][:body.get("size", params["k"])]
+        else:
+            hits = [(entry, 1.0) for entry in entries]
+            if scroll is None:
+                hits = hits[:body.get("size", size or 10)]
+
+        fields = body.get("_source", _source)
+        response_hits = []
+        for (doc_id, doc), score in hits:
+            hit = {"_index": index, "_id": doc_id, "_score": score}
+            if fields is not False:
+                hit["_source"] = {key: value for key, value in doc.items() if key in fields} if isinstance(fields, list) else doc
+            response_hits.append(hit)
+
+        response = {"took": 0, "timed_out": False, "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+                    "hits": {"total": {"value": len(response_hits), "relation": "eq"}, "hits": response_hits}}
+        if scroll is not None:
+            # everything is returned in the first page; the next scroll call ends the scan
+            response["_scroll_id"] = "fake-scroll"
+        return response
+
+    def scroll(self, body=None, **kwargs):
+        return {"_scroll_id": "fake-scroll", "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0}, "hits": {"hits": []}}
+
+    def clear_scroll(self, body=None, **kwargs):
+        return {"succeeded": True}
+
+class OpenSearchHandler(BaseHTTPRequestHandler):
+    """
+    REST front of a FakeOpenSearch for the calls the loaders make through opensearch-py:
+    index exists/create/delete, _mapping, _settings, _bulk and search/scroll.
+    """
+    def _reply(self, status, payload=None):
+        data = json.dumps(payload).encode('utf-8') if payload is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(data)
+
+    def _route(self):
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        parts = [part for part in url.path.split("/") if part]
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode('utf-8')
+        client = self.server.os_client
+        indices = client.indices
+
+        if parts and parts[-1] == "_bulk":
+            self.server.bulk_requests.append(body)
+            if self.server.unavailable > 0:
+                self.server.unavailable -= 1
+                return 503, {"error": {"type": "unavailable", "reason": "injected 503"}, "status": 503}
+            return 200, client.bulk(body=body)
+        if parts[:2] == ["_search", "scroll"]:
+            return 200, client.clear_scroll() if self.command == "DELETE" else client.scroll()
+        if len(parts) == 2 and parts[1] == "_search":
+            size = int(params["size"]) if "size" in params else None
+            return 200, client.search(body=json.loads(body or "{}"), index=parts[0], scroll=params.get("scroll"), size=size)
+        if len(parts) == 2 and parts[1] == "_mapping":
+            if not indices.exists(parts[0]):
+                return 404, {"error": {"type": "index_not_found_exception"}, "status": 404}
+            return 200, indices.get_mapping(index=parts[0])
+        if len(parts) == 2 and parts[1] == "_settings":
+            return 200, indices.put_settings(json.loads(body or "{}"), index=parts[0])
+        if len(parts) == 1 and self.command == "HEAD":
+            return (200 if indices.exists(parts[0]) else 404), None
+        if len(parts) == 1 and self.command == "PUT":
+            return 200, indices.create(parts[0], json.loads(body or "{}"))
+        if len(parts) == 1 and self.command == "DELETE":
+            return 200, indices.delete(parts[0])
+        return 400, {"error": {"type": "unsupported", "reason": f"{self.command} {url.path}"}, "status": 400}
+
+    def _handle(self):
+        self._reply(*self._route())
+
+    do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = _handle
+
+    def log_message(self, format, *args):
+        pass
+
+@contextmanager
+def serving(os_client=None, host="127.0.0.1", port=0):
+    """
+    Serves `os_client` (a new FakeOpenSearch by default) over HTTP on a background thread and
+    yields the server: `server.endpoint` is an http:// domain_endpoint for opensearch.yml,
+    `server.bulk_requests` the bodies of the _bulk requests received, and setting
+    `server.unavailable = n` answers the next n _bulk requests with 503.
+    """
+    server = ThreadingHTTPServer((host, port), OpenSearchHandler)
+    server.os_client = os_client or FakeOpenSearch()
+    server.bulk_requests = []
+    server.unavailable = 0
+    server.endpoint = f"http://{host}:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+@contextmanager
+def installed(chat=None, embedding=None, opensearch=None, output_token_seconds=0.0):
+    """
+    Points the init functions of schema_loader, query_translator and table_summarizer at the fakes
+    by swapping the ChatBedrock, BedrockEmbeddings and create_os_client names those modules use.
+    `chat`, `embedding` and `opensearch` are FaultInjectors (None for no latency or faults).
+    Yields the FakeOpenSearch shared by the indexing scripts; the originals are restored on exit.
+    """
+    import query_translator
+    import schema_loader
+    import table_summarizer
+
+    os_client = FakeOpenSearch(opensearch)
+
+    def chat_model(model_id, model_kwargs=None, callbacks=None, **kwargs):
+        return FakeChatModel(model_id=model_id, system=(model_kwargs or {}).get("system", ""), faults=chat,
+                             output_token_seconds=output_token_seconds, callbacks=callbacks)
+
+    def embedding_model(model_id, model_kwargs=None, **kwargs):
+        return FakeEmbeddings(model_id, (model_kwargs or {}).get("dimensions", 1024), embedding)
+
+    replacements = {
+        schema_loader: {"ChatBedrock": chat_model},
+        query_translator: {"ChatBedrock": chat_model, "BedrockEmbeddings": embedding_model, "create_os_client": lambda config: os_client},
+        table_summarizer: {"ChatBedrock": chat_model, "BedrockEmbeddings": embedding_model, "create_os_client": lambda config: os_client},
+    }
+    originals = {module: {name: getattr(module, name) for name in names} for module, names in replacements.items()}
+    for module, names in replacements.items():
+        for name, value in names.items():
+            setattr(module, name, value)
+    try:
+        yield os_client
+    finally:
+        for module, names in originals.items():
+            for name, value in names.items():
+                setattr(module, name, value)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve an in-memory OpenSearch stand-in over HTTP.")
+    parser.add_argument("--port", type=int, default=9200)
+    parser.add_argument("--latency", default="fixed:0", help="per-request latency distribution (see Latency)")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of bulk items rejected with 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of bulk items failed with 400")
+    args = parser.parse_args()
+
+    faults = FaultInjector(args.latency, args.throttle_rate, args.error_rate)
+    with serving(FakeOpenSearch(faults), port=args.port) as server:
+        print(f"Serving an OpenSearch stand-in; set domain_endpoint to {server.endpoint} in opensearch.yml")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
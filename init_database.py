@@ -1,7 +1,32 @@
 import os
+import re
 import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
 import mysql.connector
 from mysql.connector import Error
+from sql_parser import iter_sql_statements, tokenize
+import metrics
+
+DATABASE_NAME = "logis_admin"
+DDL_FILE_PATH = "metadata/table_DDLs.sql"
+DML_FILE_PATH = "metadata/table_DMLs.sql"
+SQLITE_FILE_PATH = "metadata/logis_admin.db"
+
+# Rows folded into one multi-row INSERT, and an upper bound on its size in bytes
+BATCH_SIZE = 500
+MAX_BATCH_BYTES = 1024 * 1024
+# Statements (after batching) per transaction; 0 commits once per file
+COMMIT_EVERY = 100
+# Connections used to create tables that do not depend on each other
+DDL_WORKERS = 4
+
+INSERT_PATTERN = re.compile(r"^\s*(INSERT\s+INTO\s+[^\s(]+\s*(?:\([^)]*\))?\s*VALUES)\s*(\(.*\))\s*$", re.IGNORECASE | re.DOTALL)
+CREATE_TABLE_PATTERN = re.compile(r"^\s*CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?[`\"]?([\w.]+)", re.IGNORECASE)
+REFERENCES_PATTERN = re.compile(r"\bREFERENCES\s+[`\"]?([\w.]+)", re.IGNORECASE)
+# statements that change the state of the connection, replayed on every DDL worker connection
+SESSION_PATTERN = re.compile(r"^\s*(?:SET|USE)\b", re.IGNORECASE)
+DB_ERRORS = (Error, sqlite3.Error)
 
 def create_connection(host_name, user_name, user_password, db_name=None):
     connection = None
@@ -25,6 +50,34 @@ def create_connection(host_name, user_name, user_password, db_name=None):
         return None
     return connection
 
+def create_sqlite_connection(db_path):
+    try:
+        connection = sqlite3.connect(db_path, check_same_thread=False)
+        print("Connection to SQLite DB successful")
+    except sqlite3.Error as e:
+        print(f"The error '{e}' occurred")
+        return None
+    return connection
+
+def connect(db_credentials, db_name=None):
+    if db_credentials.get('backend') == 'sqlite':
+        return create_sqlite_connection(db_credentials.get('database', SQLITE_FILE_PATH))
+    return create_connection(db_credentials['host'], db_credentials['user'], db_credentials['password'], db_name)
+
+def close_connection(connection):
+    if isinstance(connection, sqlite3.Connection):
+        connection.close()
+    elif connection is not None and connection.is_connected():
+        connection.close()
+
+def print_warnings(connection, cursor):
+    if isinstance(connection, sqlite3.Connection):
+        return
+    cursor.execute('SHOW WARNINGS;')
+    warnings = cursor.fetchall()
+    if warnings:
+        print(warnings)
+
 def execute_query(connection, query):
     if connection is not None:
         cursor = connection.cursor()
@@ -32,57 +85,238 @@ def execute_query(connection, query):
             cursor.execute(query)
             connection.commit()
             print("Query executed successfully")
-        except Error as e:
+        except DB_ERRORS as e:
             print(f"The error '{e}' occurred in {query}")
-            cursor.execute('SHOW WARNINGS;')
-            warnings = cursor.fetchall()
-            if warnings:
-                print(warnings)
+            print_warnings(connection, cursor)
     else:
         print("No connection to the database.")
 
+def is_value_list(text):
+    """True if `text` is nothing but comma-separated value tuples, e.g. `(1, 'a'), (2, 'b')`."""
+    depth = 0
+    expect_tuple = True
+    for _, value in tokenize(text):
+        if depth == 0:
+            if expect_tuple and value == "(":
+                expect_tuple = False
+            elif not expect_tuple and value == ",":
+                expect_tuple = True
+                continue
+            else:
+                return False
+        if value == "(":
+            depth += 1
+        elif value == ")":
+            depth -= 1
+    return depth == 0 and not expect_tuple
+
+def batch_inserts(statements, batch_size=BATCH_SIZE, max_batch_bytes=MAX_BATCH_BYTES):
+    """
+    Folds consecutive single-table INSERT ... VALUES statements into multi-row INSERTs.
+    Yields (statement, original statements) so that a failed batch can be replayed row by row.
+    """
+    prefix = None
+    rows = []
+    originals = []
+    size = 0
+
+    def flush():
+        if len(originals) == 1:
+            return originals[0], originals
+        return f"{prefix} {','.join(rows)}", originals
+
+    for statement in statements:
+        if not statement.strip():
+            continue
+        match = INSERT_PATTERN.match(statement)
+        # clauses after the values (ON CONFLICT, ON DUPLICATE KEY UPDATE, ...) can't be folded
+        if match and not is_value_list(match.group(2)):
+            match = None
+        statement_prefix = re.sub(r"\s+", " ", match.group(1)) if match else None
+
+        if originals and (statement_prefix != prefix or len(rows) >= batch_size
+                          or size + len(statement) > max_batch_bytes):
+            yield flush()
+            rows, originals, size = [], [], 0
+
+        if match is None:
+            yield statement, [statement]
+            continue
+
+        prefix = statement_prefix
+        rows.append(match.group(2))
+        originals.append(statement)
+        size += len(statement)
+
+    if originals:
+        yield flush()
+
+def execute_statements(connection, statements, batch_size=BATCH_SIZE, commit_every=COMMIT_EVERY):
+    """Executes statements with INSERT batching, committing every `commit_every` statements."""
+    if connection is None:
+        print("No connection to the database.")
+        return 0, 0
+
+    cursor = connection.cursor()
+    executed = 0
+    failed = 0
+    pending = 0
+
+    for statement, originals in batch_inserts(statements, batch_size):
+        try:
+            with metrics.timer("db_execute"):
+                cursor.execute(statement)
+            executed += len(originals)
+        except DB_ERRORS as e:
+            if len(originals) == 1:
+                print(f"The error '{e}' occurred in {statement}")
+                print_warnings(connection, cursor)
+                failed += 1
+            else:
+                # replay the batch row by row so that only the offending rows are lost
+                ok, bad = execute_statements(connection, originals, batch_size=1, commit_every=0)
+                executed += ok
+                failed += bad
+        pending += 1
+        if commit_every and pending >= commit_every:
+            connection.commit()
+            pending = 0
+
+    connection.commit()
+    return executed, failed
+
+def statement_groups(statements):
+    """
+    Splits statements into ("create", [CREATE TABLE statements]) runs and ("other", statement)
+    barriers, in file order.
+    """
+    creates = []
+    for statement in statements:
+        if not statement.strip():
+            continue
+        if CREATE_TABLE_PATTERN.match(statement):
+            creates.append(statement)
+            continue
+        if creates:
+            yield "create", creates
+            creates = []
+        yield "other", statement
+    if creates:
+        yield "create", creates
+
+def dependency_levels(statements):
+    """
+    Groups CREATE TABLE statements into levels: every table only references tables in earlier levels,
+    so the statements within a level can run concurrently. Tables in a reference cycle form the last level.
+    """
+    tables = {}
+    for statement in statements:
+        tables[CREATE_TABLE_PATTERN.match(statement).group(1).lower()] = statement
+
+    depends_on = {
+        name: {ref.lower() for ref in REFERENCES_PATTERN.findall(statement)} & tables.keys() - {name}
+        for name, statement in tables.items()
+    }
+
+    levels = []
+    done = set()
+    while len(done) < len(tables):
+        level = [name for name in tables if name not in done and depends_on[name] <= done]
+        if not level:
+            break
+        levels.append([tables[name] for name in level])
+        done.update(level)
+
+    remaining = [tables[name] for name in tables if name not in done]
+    if remaining:
+        levels.append(remaining)
+    return levels
+
+def create_tables(db_credentials, statements, workers=DDL_WORKERS):
+    """
+    Runs a DDL file in file order. Consecutive CREATE TABLE statements are created level by level,
+    each level in parallel; any other statement is a barrier that runs alone on the main connection.
+    """
+    # SQLite serializes writers on a single file, so parallel connections would only contend for the lock
+    if db_credentials.get('backend') == 'sqlite':
+        workers = 1
+
+    connection = connect(db_credentials, DATABASE_NAME)
+    session = []
+
+    def run(slice_):
+        worker_connection = connect(db_credentials, DATABASE_NAME)
+        try:
+            if worker_connection is not None:
+                cursor = worker_connection.cursor()
+                for statement in session:
+                    cursor.execute(statement)
+            return execute_statements(worker_connection, slice_)
+        finally:
+            close_connection(worker_connection)
+
+    executed = failed = 0
+    try:
+        for kind, group in statement_groups(statements):
+            if kind == "other":
+                ok, bad = execute_statements(connection, [group])
+                if SESSION_PATTERN.match(group):
+                    session.append(group)
+                executed += ok
+                failed += bad
+                continue
+            for level in dependency_levels(group):
+                slices = [level[i::workers] for i in range(workers) if level[i::workers]]
+                if len(slices) == 1:
+                    ok, bad = execute_statements(connection, slices[0])
+                    executed += ok
+                    failed += bad
+                    continue
+                with ThreadPoolExecutor(max_workers=len(slices)) as executor:
+                    for ok, bad in executor.map(run, slices):
+                        executed += ok
+                        failed += bad
+    finally:
+        close_connection(connection)
+    print(f"Created tables: {executed} statements succeeded, {failed} failed")
+    return executed, failed
+
+def read_statements(file_path):
+    with open(file_path, 'r') as file:
+        yield from iter_sql_statements(file)
+
 def main():
     with open('db_cred.json', 'r') as file:
         db_credentials = json.load(file)
 
-    host = db_credentials['host']
-    user = db_credentials['user']
-    password = db_credentials['password']
-    
-    connection = create_connection(host, user, password)
-    
-    drop_query = "DROP DATABASE IF EXISTS logis_admin;"
-    create_query = "CREATE DATABASE logis_admin;"
-    execute_query(connection, drop_query)
-    execute_query(connection, create_query)
-
-    if connection.is_connected():
-        connection.close()
+    if db_credentials.get('backend') == 'sqlite':
+        db_path = db_credentials.get('database', SQLITE_FILE_PATH)
+        if os.path.exists(db_path):
+            os.remove(db_path)
+    else:
+        connection = connect(db_credentials)
 
-    connection = create_connection(host, user, password, "logis_admin")
-    
-    with open('metadata/table_DDLs.sql', 'r') as file:
-        sql_file = file.read()
-        sql_commands = sql_file.split(';') 
+        drop_query = f"DROP DATABASE IF EXISTS {DATABASE_NAME};"
+        create_query = f"CREATE DATABASE {DATABASE_NAME};"
+        execute_query(connection, drop_query)
+        execute_query(connection, create_query)
 
-    for command in sql_commands:
-        if command.strip():
-            execute_query(connection, command)
+        close_connection(connection)
 
-    if os.path.exists('metadata/table_DMLs.sql'):
-        with open('metadata/table_DMLs.sql', 'r') as file:
-            sql_file = file.read()
-            sql_commands = sql_file.split(';') 
+    with metrics.stage("create_tables") as stage:
+        executed, _ = create_tables(db_credentials, read_statements(DDL_FILE_PATH))
+        stage.add(executed)
 
-        for command in sql_commands:
-            if command.strip():
-                execute_query(connection, command)
+    if os.path.exists(DML_FILE_PATH):
+        connection = connect(db_credentials, DATABASE_NAME)
+        with metrics.stage("load_data") as stage:
+            executed, failed = execute_statements(connection, read_statements(DML_FILE_PATH))
+            stage.add(executed)
+        print(f"Loaded data: {executed} statements succeeded, {failed} failed")
+        close_connection(connection)
+        print("Database connection is closed")
     else:
-        print("File 'metadata/table_DMLs.sql' does not exist.")
-
-    if connection and connection.is_connected():
-        connection.close()
-        print("MySQL connection is closed")
+        print(f"File '{DML_FILE_PATH}' does not exist.")
 
 if __name__ == "__main__":
-    main()
+    metrics.run("init_database", main)
@@ -0,0 +1,132 @@
+import json
+import os
+
+CHUNK_SIZE = 64 * 1024
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\r\n"
+
+def _value_complete(buffer, end, eof, closing):
+    # a scalar cut at the chunk boundary (e.g. 12|.5e3) decodes successfully but too early,
+    # so a value only counts once the character after it is known to end it
+    return eof or (end < len(buffer) and buffer[end] in _WHITESPACE + "," + closing)
+
+def _iter_values(file, opening, closing, separators, chunk_size):
+    """
+    Yields the values between `opening` and the matching `closing` at the top level of a JSON
+    text file object, skipping whitespace and `separators` between them.
+    """
+    kind = "array" if opening == "[" else "object"
+    buffer = ""
+    pos = 0
+    eof = False
+    started = False
+
+    while True:
+        while pos < len(buffer) and buffer[pos] in _WHITESPACE + (separators if started else ""):
+            pos += 1
+
+        if pos < len(buffer):
+            if not started:
+                if buffer[pos] != opening:
+                    raise ValueError(f"Expected a JSON {kind}")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == closing:
+                return
+            try:
+                value, end = _decoder.raw_decode(buffer, pos)
+                if _value_complete(buffer, end, eof, closing):
+                    yield value
+                    pos = end
+                    continue
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+
+        if eof:
+            raise ValueError(f"Unexpected end of JSON {kind}")
+        chunk = file.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+def iter_json_array(file, chunk_size=CHUNK_SIZE):
+    """
+    Incrementally parses a top-level JSON array from a text file object and yields its
+    elements one at a time, keeping only the current element (plus one chunk) in memory.
+    """
+    yield from _iter_values(file, "[", "]", ",", chunk_size)
+
+def iter_json_object(file, chunk_size=CHUNK_SIZE):
+    """
+    Incrementally parses a top-level JSON object from a text file object and yields its
+    (key, value) pairs one at a time, like iter_json_array does for array elements.
+    """
+    key = None
+    for value in _iter_values(file, "{", "}", ",:", chunk_size):
+        if key is None:
+            if not isinstance(value, str):
+                raise ValueError("Expected a string key")
+            key = value
+        else:
+            yield key, value
+            key = None
+    if key is not None:
+        raise ValueError(f"Missing value for key '{key}'")
+
+def read_records(file_path):
+    """
+    Lazily yields the records of a JSONL artifact. Files written by older runs as a single
+    JSON array are read element by element instead.
+    """
+    with open(file_path, 'r', encoding='utf-8') as file:
+        head = file.read(CHUNK_SIZE).lstrip()
+        file.seek(0)
+        if head.startswith('['):
+            yield from iter_json_array(file)
+            return
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+def write_record(file, record):
+    if not isinstance(record, dict):
+        raise TypeError(f"Records must be JSON objects, got {type(record).__name__}")
+    # json.dumps escapes newlines inside strings, so every record is exactly one line
+    file.write(json.dumps(record, ensure_ascii=False) + "\n")
+    file.flush()
+
+def _accepted(line, keep):
+    # a line without its newline was cut off when a run crashed
+    if not line.endswith(b"\n"):
+        return False
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return False
+    return isinstance(record, dict) and (keep is None or keep(record))
+
+def resume_records(file_path, keep=None):
+    """
+    Opens a JSONL artifact for appending. Complete records are kept if `keep(record)` accepts
+    them; the others (e.g. outdated records, a line cut off when a run crashed, or an array
+    written by an older run) are dropped by rewriting the file through a temporary file.
+    Returns (file, number of records kept).
+    """
+    kept = 0
+    if os.path.exists(file_path):
+        dropped = False
+        with open(file_path, 'rb') as file, open(file_path + ".tmp", 'wb') as output_file:
+            for line in file:
+                if _accepted(line, keep):
+                    output_file.write(line)
+                    kept += 1
+                else:
+                    dropped = True
+        if dropped:
+            os.replace(file_path + ".tmp", file_path)
+        else:
+            os.remove(file_path + ".tmp")
+    return open(file_path, 'a', encoding='utf-8'), kept
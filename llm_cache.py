@@ -0,0 +1,160 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from langchain_core.caches import BaseCache
+from langchain_core.globals import set_llm_cache
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration
+
+CACHE_PATH = "./.cache/llm_cache.db"
+MAX_CACHE_BYTES = 1024 * 1024 * 1024
+# Cache hits whose access time is buffered before it is written; LRU order only needs to be approximate
+ACCESS_FLUSH_EVERY = 1000
+
+class DiskCache:
+    """
+    Content-addressed key/value store in a single SQLite file.
+    When the stored values exceed `max_bytes`, the least recently used entries are evicted.
+    The total size is kept in memory, so writes don't scan the table.
+    """
+    def __init__(self, path=CACHE_PATH, max_bytes=MAX_CACHE_BYTES):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # with WAL, a commit is durable against crashes of the process without an fsync
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self.conn.commit()
+        self.total = self._stored_bytes()
+        self.accessed = {}
+
+    @staticmethod
+    def make_key(*parts):
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(part.encode('utf-8') if isinstance(part, str) else part)
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self.accessed[key] = time.time()
+            if len(self.accessed) >= ACCESS_FLUSH_EVERY:
+                self._flush_accessed()
+                self.conn.commit()
+            return row[0]
+
+    def put(self, key, value):
+        with self.lock:
+            row = self.conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, len(value), time.time())
+            )
+            self.accessed.pop(key, None)
+            self._flush_accessed()
+            self.conn.commit()
+            self.total += len(value) - (row[0] if row else 0)
+            if self.total > self.max_bytes:
+                self._evict()
+
+    def _stored_bytes(self):
+        return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def _flush_accessed(self):
+        if self.accessed:
+            self.conn.executemany("UPDATE entries SET accessed_at = ? WHERE key = ?",
+                                  [(accessed_at, key) for key, accessed_at in self.accessed.items()])
+            self.accessed = {}
+
+    def _evict(self):
+        # other processes may share the file, so the running total is resynchronized before evicting
+        self.total = self._stored_bytes()
+        if self.total <= self.max_bytes:
+            return
+        # Trim to 90% of the limit so that eviction does not run on every write
+        target = self.max_bytes * 0.9
+        rows = self.conn.execute("SELECT key, size FROM entries ORDER BY accessed_at").fetchall()
+        evicted = []
+        for key, size in rows:
+            if self.total <= target:
+                break
+            evicted.append((key,))
+            self.total -= size
+        self.conn.executemany("DELETE FROM entries WHERE key = ?", evicted)
+        self.conn.commit()
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM entries")
+            self.conn.commit()
+            self.conn.execute("VACUUM")
+            self.total = 0
+            self.accessed = {}
+
+    def close(self):
+        with self.lock:
+            self._flush_accessed()
+            self.conn.commit()
+            self.conn.close()
+
+    def stats(self):
+        with self.lock:
+            count, total = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {"entries": count, "bytes": total, "max_bytes": self.max_bytes}
+
+class LLMResponseCache(BaseCache):
+    """
+    LangChain cache backed by DiskCache. `llm_string` already contains the model id,
+    the system prompt and the sampling parameters of ChatBedrock, and `prompt` is the
+    rendered message list, so the key changes whenever any of them changes.
+    """
+    def __init__(self, store):
+        self.store = store
+
+    def lookup(self, prompt, llm_string):
+        value = self.store.get(DiskCache.make_key(llm_string, prompt))
+        if value is None:
+            return None
+        return [ChatGeneration(message=AIMessage(content=text)) for text in json.loads(value)]
+
+    def update(self, prompt, llm_string, return_val):
+        texts = [generation.text for generation in return_val]
+        self.store.put(DiskCache.make_key(llm_string, prompt), json.dumps(texts, ensure_ascii=False).encode('utf-8'))
+
+    def clear(self, **kwargs):
+        self.store.clear()
+
+def enable_llm_cache(path=CACHE_PATH, max_bytes=MAX_CACHE_BYTES):
+    store = DiskCache(path, max_bytes)
+    set_llm_cache(LLMResponseCache(store))
+    return store
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or invalidate the Bedrock response cache.")
+    parser.add_argument("--path", default=CACHE_PATH)
+    parser.add_argument("--clear", action="store_true", help="remove every cached response")
+    args = parser.parse_args()
+
+    store = DiskCache(args.path)
+    if args.clear:
+        store.clear()
+        print(f"Cleared the response cache at {args.path}")
+    print(store.stats())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+
+# Error codes Bedrock returns when the account is over its request/token quota
+THROTTLING_ERRORS = (
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceUnavailableException",
+    "ModelNotReadyException",
+)
+
+def is_throttling_error(error):
+    # botocore's ClientError and LangChain's wrapped ValueError both carry the code in the message
+    text = f"{type(error).__name__} {error}"
+    return any(name in text for name in THROTTLING_ERRORS)
+
+class AdaptiveLimiter:
+    """
+    Caps the number of in-flight requests. The cap is halved whenever a request
+    is throttled and grows back by one after every `recovery` successful calls.
+    """
+    def __init__(self, max_in_flight, recovery=10):
+        self.max_in_flight = max_in_flight
+        self.limit = max_in_flight
+        self.recovery = recovery
+        self.in_flight = 0
+        self.successes = 0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        with self.cond:
+            while self.in_flight >= self.limit:
+                self.cond.wait()
+            self.in_flight += 1
+
+    def release(self, throttled=False):
+        with self.cond:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(1, self.limit // 2)
+                self.successes = 0
+            else:
+                self.successes += 1
+                if self.successes >= self.recovery and self.limit < self.max_in_flight:
+                    self.limit += 1
+                    self.successes = 0
+            self.cond.notify_all()
+
+def invoke_with_backoff(chain, inputs, limiter, max_retries=8, base_delay=1.0, max_delay=60.0, call="llm"):
+    attempt = 0
+    while True:
+        limiter.acquire()
+        start = time.perf_counter()
+        try:
+            response = chain.invoke(inputs)
+        except Exception as e:
+            metrics.observe(call, time.perf_counter() - start)
+            throttled = is_throttling_error(e)
+            limiter.release(throttled=throttled)
+            if not throttled or attempt >= max_retries:
+                metrics.record_error(call)
+                raise
+            metrics.record_retry(call)
+            delay = min(max_delay, base_delay * (2 ** attempt)) * random.uniform(0.5, 1.0)
+            print(f"Throttled, retrying in {delay:.1f}s (limit={limiter.limit})")
+            time.sleep(delay)
+            attempt += 1
+            continue
+        metrics.observe(call, time.perf_counter() - start)
+        limiter.release()
+        return response
+
+def invoke_all(chain, inputs_list, max_in_flight=8, max_retries=8, call="llm"):
+    """
+    Runs `chain.invoke` over `inputs_list` with at most `max_in_flight` concurrent
+    requests and yields the responses in the same order as the inputs.
+    Latencies and retries are recorded in `metrics` under `call`.
+    """
+    limiter = AdaptiveLimiter(max_in_flight)
+    executor = ThreadPoolExecutor(max_workers=max_in_flight)
+    try:
+        futures = [
+            executor.submit(invoke_with_backoff, chain, inputs, limiter, max_retries, call=call)
+            for inputs in inputs_list
+        ]
+        for future in futures:
+            yield future.result()
+    finally:
+        # on an error (or when the caller stops early) the queued requests are dropped instead of sent
+        executor.shutdown(wait=False, cancel_futures=True)
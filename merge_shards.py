@@ -0,0 +1,149 @@
+import argparse
+import os
+import preprocess
+import query_translator
+import schema_loader
+import table_summarizer
+from catalog import iter_table_items, load_catalog
+from json_stream import iter_json_array, read_records, write_record
+from sharding import all_shards, statement_shard, table_databases
+from sql_parser import iter_sql_statements
+from vector_store import load_vectors, save_vectors, vector_paths
+
+def shard_files(file_path, shards, exists=os.path.exists):
+    """Paths of `file_path` for every shard, or None if no shard wrote it."""
+    paths = [shard.path(file_path) for shard in shards]
+    found = [exists(path) for path in paths]
+    if not any(found):
+        return None
+    if not all(found):
+        missing = [path for path, ok in zip(paths, found) if not ok]
+        raise FileNotFoundError(f"Shard outputs are missing: {', '.join(missing)}")
+    return paths
+
+def shard_vector_files(base_path, shards):
+    return shard_files(base_path, shards, exists=lambda path: os.path.exists(vector_paths(path)[0]))
+
+def keyed_records(paths, key=lambda record: next(iter(record))):
+    """{key: record} of the records of all shards; a key may only occur in one shard."""
+    records = {}
+    for path in paths:
+        for record in read_records(path):
+            record_key = key(record)
+            if record_key in records:
+                raise ValueError(f"'{record_key}' is in more than one shard ({path})")
+            records[record_key] = record
+    return records
+
+def write_in_order(file_path, records, order):
+    """
+    Writes `records` ({key: record}) in the order of `order`; records whose key is not in it
+    follow in shard order. Returns the keys in the order written.
+    """
+    keys = [key for key in order if key in records]
+    listed = set(keys)
+    keys += [key for key in records if key not in listed]
+    with open(file_path + ".tmp", 'w', encoding='utf-8') as output_file:
+        for key in keys:
+            write_record(output_file, records[key])
+    os.replace(file_path + ".tmp", file_path)
+    return keys
+
+def merge_vectors(base_path, shards, ids):
+    """Saves the vectors of `ids`, each taken from the shard that has it, to `base_path`."""
+    stores = [load_vectors(path) for path in shard_vector_files(base_path, shards)]
+    vectors = []
+    for doc_id in ids:
+        store = next((store for store in stores if doc_id in store), None)
+        if store is None:
+            raise ValueError(f"No shard has a vector for '{doc_id}'")
+        vectors.append(store.get(doc_id))
+    save_vectors(base_path, ids, vectors)
+
+def merge_tables(shards):
+    """spider_tables.json with the databases in the order of the Spider export, like an unsharded preprocess.py run."""
+    paths = shard_files(preprocess.OUTPUT_FILE_PATH, shards)
+    if paths is None:
+        return None
+    databases = {}
+    for shard, path in zip(shards, paths):
+        for table_key, table in iter_table_items(path):
+            if not shard.owns(table["db_id"]):
+                raise ValueError(f"{path} was not written for shard {shard}")
+            databases.setdefault(table["db_id"], []).append((table_key, table))
+
+    with open(preprocess.INPUT_FILE_PATH, 'r') as infile:
+        order = [db['db_id'] for db in iter_json_array(infile)]
+    order += sorted(databases.keys() - set(order))
+    count = preprocess.write_tables(preprocess.OUTPUT_FILE_PATH,
+                                    (item for db_id in order for item in databases.get(db_id, [])))
+    print(f"Merged {count} tables into {preprocess.OUTPUT_FILE_PATH}")
+    return count
+
+def merge_schemas(shards):
+    """Table descriptions in the order of spider_tables.json."""
+    paths = shard_files(schema_loader.OUTPUT_FILE_PATH, shards)
+    if paths is None:
+        return None
+    records = keyed_records(paths, key=lambda record: next(iter(record)).lower())
+    order = [table_name.lower() for table_name in load_catalog(schema_loader.TABLE_FILE_PATH).table_names()]
+    table_names = write_in_order(schema_loader.OUTPUT_FILE_PATH, records, order)
+    print(f"Merged {len(table_names)} table descriptions into {schema_loader.OUTPUT_FILE_PATH}")
+    return len(table_names)
+
+def merge_translations(shards):
+    """Translations in the order of spider.sql, and their vectors."""
+    paths = shard_files(query_translator.FILE_PATH_1, shards)
+    if paths is None:
+        return None
+    readers = [read_records(path) for path in paths]
+    databases = table_databases(load_catalog(query_translator.TABLE_FILE))
+
+    count = 0
+    fingerprints = {}
+    file_path = query_translator.FILE_PATH_1
+    with open(file_path + ".tmp", 'w', encoding='utf-8') as output_file, open(query_translator.SQL_FILE, 'r') as file:
+        for sql in iter_sql_statements(file):
+            index = statement_shard(sql, databases, len(shards))
+            data = next(readers[index], None)
+            if data is None or data["query"] != sql.strip():
+                raise ValueError(f"{paths[index]} does not match {query_translator.SQL_FILE}; rerun the shard")
+            write_record(output_file, data)
+            fingerprints[data["fingerprint"]] = None
+            count += 1
+    for path, reader in zip(paths, readers):
+        if next(reader, None) is not None:
+            raise ValueError(f"{path} has statements that are not in {query_translator.SQL_FILE}; rerun the shard")
+    os.replace(file_path + ".tmp", file_path)
+
+    merge_vectors(query_translator.VECTOR_PATH, shards, list(fingerprints))
+    print(f"Merged {count} translations into {file_path}")
+    return count
+
+def merge_summaries(shards):
+    """Table summaries in the order of the table descriptions, and their vectors."""
+    paths = shard_files(table_summarizer.OUTPUT_FILE_PATH2, shards)
+    if paths is None:
+        return None
+    records = keyed_records(paths)
+    order = [next(iter(record)) for record in read_records(table_summarizer.SCHEMA_FILE_PATH)]
+    table_names = write_in_order(table_summarizer.OUTPUT_FILE_PATH2, records, order)
+    merge_vectors(table_summarizer.OUTPUT_VECTOR_PATH, shards, table_names)
+    print(f"Merged {len(table_names)} table summaries into {table_summarizer.OUTPUT_FILE_PATH2}")
+    return len(table_names)
+
+def main():
+    parser = argparse.ArgumentParser(description="Combine the outputs of --shard i/N runs into the files of an unsharded run.")
+    parser.add_argument("--shards", type=int, required=True, help="N, the number of shards")
+    args = parser.parse_args()
+    if args.shards < 1:
+        parser.error("--shards must be at least 1")
+
+    shards = all_shards(args.shards)
+    # in pipeline order: each step orders its records by the merged output of the step before
+    merged = [merge(shards) for merge in (merge_tables, merge_schemas, merge_translations, merge_summaries)]
+    if all(count is None for count in merged):
+        print(f"No outputs of {args.shards} shards found")
+
+if __name__ == "__main__":
+    main()
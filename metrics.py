@@ -0,0 +1,229 @@
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from langchain_core.callbacks import BaseCallbackHandler
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Run reports (<script>.json, <script>.prom) are written here; point a node_exporter
+# textfile collector at the directory to scrape the .prom files
+REPORT_DIR = os.environ.get("PIPELINE_REPORT_DIR", "./reports")
+# PIPELINE_PROFILE=1 additionally runs the script under cProfile and writes <script>.prof
+PROFILE = os.environ.get("PIPELINE_PROFILE") == "1"
+
+# Prometheus histogram buckets for per-call latencies, in seconds
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_lock = threading.Lock()
+_calls = defaultdict(lambda: {"latencies": [], "retries": 0, "errors": 0})
+_counters = defaultdict(float)
+_stages = []
+
+def reset():
+    with _lock:
+        _calls.clear()
+        _counters.clear()
+        _stages.clear()
+
+def peak_memory_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def observe(call, seconds):
+    """Records the latency of one call (an LLM request, an embedding, a bulk chunk, ...)."""
+    with _lock:
+        _calls[call]["latencies"].append(seconds)
+
+def record_retry(call):
+    with _lock:
+        _calls[call]["retries"] += 1
+
+def record_error(call):
+    with _lock:
+        _calls[call]["errors"] += 1
+
+def increment(counter, value=1):
+    with _lock:
+        _counters[counter] += value
+
+@contextmanager
+def timer(call):
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        record_error(call)
+        raise
+    finally:
+        observe(call, time.perf_counter() - start)
+
+class Stage:
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+
+    def add(self, items=1):
+        self.items += items
+
+@contextmanager
+def stage(name):
+    """
+    Times a pipeline stage. Call `.add(n)` on the yielded object for every item the stage
+    handles to get its throughput.
+    """
+    current = Stage(name)
+    start = time.perf_counter()
+    try:
+        yield current
+    finally:
+        seconds = time.perf_counter() - start
+        with _lock:
+            _stages.append({
+                "stage": name,
+                "seconds": seconds,
+                "items": current.items,
+                "items_per_second": current.items / seconds if seconds else 0.0,
+                "peak_memory_bytes": peak_memory_bytes(),
+            })
+
+class TokenUsageHandler(BaseCallbackHandler):
+    """Counts input/output tokens of every chat model response (cached responses carry no usage)."""
+    def on_llm_end(self, response, **kwargs):
+        usage = (response.llm_output or {}).get("usage") or {}
+        input_tokens = usage.get("prompt_tokens", 0)
+        output_tokens = usage.get("completion_tokens", 0)
+        if not usage:
+            for generations in response.generations:
+                for generation in generations:
+                    metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                    input_tokens += metadata.get("input_tokens", 0)
+                    output_tokens += metadata.get("output_tokens", 0)
+        increment("llm_input_tokens", input_tokens)
+        increment("llm_output_tokens", output_tokens)
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def summarize_latencies(latencies):
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "sum_seconds": sum(values),
+        "p50_seconds": percentile(values, 50),
+        "p95_seconds": percentile(values, 95),
+        "p99_seconds": percentile(values, 99),
+        "max_seconds": values[-1] if values else 0.0,
+    }
+
+def build_report(script, started, finished):
+    with _lock:
+        calls = {
+            call: {**summarize_latencies(data["latencies"]), "retries": data["retries"], "errors": data["errors"]}
+            for call, data in _calls.items()
+        }
+        return {
+            "script": script,
+            "started": started,
+            "finished": finished,
+            "seconds": finished - started,
+            "peak_memory_bytes": peak_memory_bytes(),
+            "stages": list(_stages),
+            "calls": calls,
+            "counters": dict(_counters),
+        }
+
+def format_prometheus(script, latencies):
+    """Prometheus text exposition of the current metrics; `latencies` maps call -> raw latencies."""
+    label = f'script="{script}"'
+    lines = []
+
+    def family(name, kind, help_text):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    with _lock:
+        family("pipeline_stage_seconds", "gauge", "Wall time of each pipeline stage.")
+        lines.extend(f'pipeline_stage_seconds{{{label},stage="{s["stage"]}"}} {s["seconds"]}' for s in _stages)
+        family("pipeline_stage_items", "gauge", "Items processed by each pipeline stage.")
+        lines.extend(f'pipeline_stage_items{{{label},stage="{s["stage"]}"}} {s["items"]}' for s in _stages)
+
+        family("pipeline_call_latency_seconds", "histogram", "Latency of individual calls.")
+        for call, values in latencies.items():
+            call_label = f'{label},call="{call}"'
+            for bucket in LATENCY_BUCKETS:
+                count = sum(1 for value in values if value <= bucket)
+                lines.append(f'pipeline_call_latency_seconds_bucket{{{call_label},le="{bucket}"}} {count}')
+            lines.append(f'pipeline_call_latency_seconds_bucket{{{call_label},le="+Inf"}} {len(values)}')
+            lines.append(f'pipeline_call_latency_seconds_sum{{{call_label}}} {sum(values)}')
+            lines.append(f'pipeline_call_latency_seconds_count{{{call_label}}} {len(values)}')
+
+        family("pipeline_call_retries_total", "counter", "Throttled or rejected calls that were retried.")
+        lines.extend(f'pipeline_call_retries_total{{{label},call="{call}"}} {data["retries"]}' for call, data in _calls.items())
+        family("pipeline_call_errors_total", "counter", "Calls that failed.")
+        lines.extend(f'pipeline_call_errors_total{{{label},call="{call}"}} {data["errors"]}' for call, data in _calls.items())
+
+        for counter, value in sorted(_counters.items()):
+            family(f"pipeline_{counter}_total", "counter", f"{counter.replace('_', ' ')}.")
+            lines.append(f"pipeline_{counter}_total{{{label}}} {value}")
+
+    peak = peak_memory_bytes()
+    if peak is not None:
+        family("pipeline_peak_memory_bytes", "gauge", "Peak resident set size of the run.")
+        lines.append(f"pipeline_peak_memory_bytes{{{label}}} {peak}")
+    return "\n".join(lines) + "\n"
+
+def write_atomic(path, content):
+    # textfile collectors may read at any time, so never expose a half-written file
+    with open(path + ".tmp", 'w', encoding='utf-8') as file:
+        file.write(content)
+    os.replace(path + ".tmp", path)
+
+def write_reports(script, started, finished, report_dir=REPORT_DIR):
+    os.makedirs(report_dir, exist_ok=True)
+    report = build_report(script, started, finished)
+    with _lock:
+        latencies = {call: list(data["latencies"]) for call, data in _calls.items()}
+
+    json_path = os.path.join(report_dir, f"{script}.json")
+    write_atomic(json_path, json.dumps(report, indent=4))
+    write_atomic(os.path.join(report_dir, f"{script}.prom"), format_prometheus(script, latencies))
+    print(f"Run report written to {json_path}")
+    return report
+
+def run(script, main, profile=PROFILE, report_dir=REPORT_DIR):
+    """
+    Runs `main()` and writes the run report for `script`, also when `main` fails.
+    With `profile`, the run is profiled and the slowest functions are printed.
+    """
+    reset()
+    profiler = cProfile.Profile() if profile else None
+    started = time.time()
+    try:
+        if profiler:
+            profiler.enable()
+        with stage("total"):
+            return main()
+    finally:
+        if profiler:
+            profiler.disable()
+            os.makedirs(report_dir, exist_ok=True)
+            profile_path = os.path.join(report_dir, f"{script}.prof")
+            profiler.dump_stats(profile_path)
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(20)
+            print(f"Profile written to {profile_path}")
+        write_reports(script, started, time.time(), report_dir)
@@ -0,0 +1,212 @@
+import hashlib
+import json
+import random
+import time
+import yaml
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from opensearchpy import OpenSearch, RequestsHttpConnection, helpers
+from opensearchpy.exceptions import ConnectionError, TransportError
+import metrics
+
+OPENSEARCH_CONFIG_PATH = "./metadata/opensearch.yml"
+
+MAX_CHUNK_BYTES = 10 * 1024 * 1024
+MAX_CHUNK_DOCS = 500
+MAX_RETRIES = 5
+INITIAL_BACKOFF = 2.0
+MAX_BACKOFF = 60.0
+
+# Item statuses worth retrying; anything else (e.g. a mapping error) fails the same way again
+RETRYABLE_STATUS = (429, 502, 503, 504)
+
+def load_opensearch_config(file_path=OPENSEARCH_CONFIG_PATH):
+    with open(file_path, 'r', encoding='utf-8') as file:
+        return yaml.safe_load(file)
+
+def create_os_client(config):
+    """
+    Builds a client from the `opensearch-auth` section. An `http://host:port` endpoint
+    connects without TLS, which allows pointing the loaders at a local stand-in.
+    """
+    endpoint = config['opensearch-auth']['domain_endpoint']
+    http_auth = (config['opensearch-auth']['user_id'], config['opensearch-auth']['user_password'])
+
+    url = urlparse(endpoint if "://" in endpoint else "https://" + endpoint)
+    use_ssl = url.scheme == "https"
+
+    return OpenSearch(
+            hosts=[{'host': url.hostname, 'port': url.port or (443 if use_ssl else 80)}],
+            http_auth=http_auth if any(http_auth) else None,
+            use_ssl=use_ssl,
+            verify_certs=use_ssl,
+            timeout=300,
+            connection_class=RequestsHttpConnection
+    )
+
+def fingerprint(*parts):
+    """Content hash of JSON-serializable values, independent of dict key order."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(json.dumps(part, ensure_ascii=False, sort_keys=True, default=str).encode('utf-8'))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+def fetch_fingerprints(os_client, index_name):
+    """Returns {_id: fingerprint} for every document in the index (empty if it does not exist)."""
+    if not os_client.indices.exists(index=index_name):
+        return {}
+    hits = helpers.scan(os_client, index=index_name, query={"query": {"match_all": {}}}, _source=["fingerprint"])
+    return {hit["_id"]: hit["_source"].get("fingerprint") for hit in hits}
+
+def mapping_differences(os_client, index_name, mappings):
+    """
+    Top-level fields of `mappings` whose type (or vector dimension) differs in the live index,
+    e.g. a vector field that an older version left mapped as a plain float.
+    """
+    live = os_client.indices.get_mapping(index=index_name)
+    properties = next(iter(live.values()), {}).get("mappings", {}).get("properties", {})
+    return [
+        field for field, expected in mappings["properties"].items()
+        if any(properties.get(field, {}).get(key) != expected[key] for key in ("type", "dimension") if key in expected)
+    ]
+
+def prepare_index(os_client, index_name, mapping, rebuild=False):
+    """
+    Creates the index, or deletes and recreates it when `rebuild` is set or its live mapping
+    is outdated. Returns {_id: fingerprint} of the documents it keeps, so that only new or
+    changed documents are indexed.
+    """
+    exists = os_client.indices.exists(index=index_name)
+
+    if exists and not rebuild:
+        outdated = mapping_differences(os_client, index_name, mapping["mappings"])
+        if not outdated:
+            print("Index exists, only changed documents will be updated.")
+            return fetch_fingerprints(os_client, index_name)
+        print(f"Index mapping of {', '.join(outdated)} is outdated, rebuilding the index.")
+
+    if exists:
+        os_client.indices.delete(index=index_name)
+        print("Existing index has been deleted. Create new one.")
+    else:
+        print("Index does not exist, Create one.")
+
+    os_client.indices.create(index=index_name, body=mapping)
+    return {}
+
+def to_delete_entry(index_name, doc_id):
+    return json.dumps({"delete": {"_index": index_name, "_id": doc_id}}, ensure_ascii=False) + "\n"
+
+def to_bulk_entry(action, doc):
+    return json.dumps(action, ensure_ascii=False) + "\n" + json.dumps(doc, ensure_ascii=False) + "\n"
+
+def read_bulk_file(file_path):
+    """Yields action/source line pairs of an NDJSON bulk file without parsing them."""
+    with open(file_path, 'r', encoding='utf-8') as file:
+        for action in file:
+            yield action + next(file)
+
+def iter_chunks(entries, max_chunk_bytes=MAX_CHUNK_BYTES, max_chunk_docs=MAX_CHUNK_DOCS):
+    chunk = []
+    size = 0
+    for entry in entries:
+        entry_size = len(entry.encode('utf-8'))
+        if chunk and (size + entry_size > max_chunk_bytes or len(chunk) >= max_chunk_docs):
+            yield chunk
+            chunk = []
+            size = 0
+        chunk.append(entry)
+        size += entry_size
+    if chunk:
+        yield chunk
+
+def backoff(attempt):
+    return min(MAX_BACKOFF, INITIAL_BACKOFF * (2 ** attempt)) * random.uniform(0.5, 1.0)
+
+def send_chunk(os_client, chunk, max_retries=MAX_RETRIES):
+    """
+    Sends one chunk and resends only the items rejected with a retryable status.
+    Returns (number of indexed items, list of error reasons).
+    """
+    pending = chunk
+    indexed = 0
+    errors = []
+
+    for attempt in range(max_retries + 1):
+        try:
+            response = os_client.bulk(body="".join(pending))
+        except (ConnectionError, TransportError) as e:
+            if isinstance(e, ConnectionError) or e.status_code in RETRYABLE_STATUS:
+                if attempt < max_retries:
+                    metrics.record_retry("bulk_chunk")
+                    time.sleep(backoff(attempt))
+                    continue
+            errors.extend(str(e) for _ in pending)
+            return indexed, errors
+
+        retry = []
+        for entry, item in zip(pending, response["items"]):
+            operation, result = next(iter(item.items()))
+            # deleting a document that is already gone is not an error
+            if result["status"] < 300 or (operation == "delete" and result["status"] == 404):
+                indexed += 1
+            elif result["status"] in RETRYABLE_STATUS and attempt < max_retries:
+                retry.append(entry)
+            else:
+                errors.append(result.get("error", {}).get("reason", str(result.get("error"))))
+
+        if not retry:
+            break
+        print(f"Retrying {len(retry)} rejected items")
+        metrics.record_retry("bulk_chunk")
+        time.sleep(backoff(attempt))
+        pending = retry
+
+    return indexed, errors
+
+def bulk_load(os_client, entries, max_chunk_bytes=MAX_CHUNK_BYTES, max_chunk_docs=MAX_CHUNK_DOCS, parallel=1, max_retries=MAX_RETRIES):
+    """
+    Streams bulk entries (see to_bulk_entry / read_bulk_file) to OpenSearch in size-capped chunks.
+    At most `parallel` chunks are in flight; the entry generator is not advanced further
+    until one of them completes.
+    """
+    def timed_send(chunk):
+        start = time.perf_counter()
+        indexed, errors = send_chunk(os_client, chunk, max_retries)
+        elapsed = time.perf_counter() - start
+        metrics.observe("bulk_chunk", elapsed)
+        return len(chunk), sum(len(entry.encode('utf-8')) for entry in chunk), elapsed, indexed, errors
+
+    total_indexed = 0
+    all_errors = []
+
+    def report(number, future):
+        nonlocal total_indexed
+        docs, size, elapsed, indexed, errors = future.result()
+        total_indexed += indexed
+        all_errors.extend(errors)
+        metrics.increment("bulk_docs", indexed)
+        metrics.increment("bulk_bytes", size)
+        metrics.increment("bulk_errors", len(errors))
+        print(f"Chunk {number}: {indexed}/{docs} docs, {size / 1024 / 1024:.1f} MB in {elapsed:.2f}s "
+              f"({docs / elapsed if elapsed else 0:.0f} docs/s)")
+
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        in_flight = deque()
+        for number, chunk in enumerate(iter_chunks(entries, max_chunk_bytes, max_chunk_docs)):
+            if len(in_flight) >= parallel:
+                report(*in_flight.popleft())
+            in_flight.append((number, executor.submit(timed_send, chunk)))
+        while in_flight:
+            report(*in_flight.popleft())
+
+    if all_errors:
+        print("There were errors during bulk indexing:")
+        for reason in all_errors:
+            print(f"Error: {reason}")
+    else:
+        print(f"Bulk-inserted all {total_indexed} items successfully.")
+
+    return total_indexed, all_errors
@@ -0,0 +1,332 @@
+import argparse
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts.chat import ChatPromptTemplate
+import metrics
+import query_translator
+import table_summarizer
+from catalog import Table, load_catalog
+from embedder import EMBEDDING_CACHE_PATH, MAX_CACHE_BYTES, embed_texts
+from json_stream import read_records, write_record
+from llm_cache import DiskCache, enable_llm_cache
+from llm_executor import AdaptiveLimiter
+from opensearch_utils import bulk_load, fingerprint, load_opensearch_config, to_bulk_entry, to_delete_entry
+from sql_parser import iter_sql_statements, referenced_tables
+from vector_store import VECTOR_DTYPE, load_vectors, save_vectors
+
+# Items buffered between two stages; a stage blocks while the queue it feeds is full
+QUEUE_SIZE = 64
+# Tables summarized concurrently (the limit is lowered while Bedrock throttles)
+SUMMARY_WORKERS = 8
+# Texts embedded together; a stage embeds whatever has arrived, up to this many
+EMBED_BATCH_SIZE = 16
+# Documents per bulk request, small so that documents are searchable soon after they are embedded
+BULK_CHUNK_DOCS = 50
+
+class PipelineAborted(Exception):
+    """Raised in a stage when another stage has failed."""
+
+class Channel:
+    """
+    Bounded queue between two stages. The producer closes it when it is done;
+    every blocked put or get gives up as soon as any stage has failed.
+    """
+    _CLOSED = object()
+
+    def __init__(self, name, failed, maxsize=QUEUE_SIZE):
+        self.name = name
+        self.failed = failed
+        self.queue = queue.Queue(maxsize)
+
+    def put(self, item):
+        waited = False
+        while True:
+            if self.failed.is_set():
+                raise PipelineAborted()
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                if not waited:
+                    # the consuming stage is the bottleneck
+                    metrics.increment(f"{self.name}_queue_full")
+                    waited = True
+
+    def close(self):
+        self.put(self._CLOSED)
+
+    def _get(self):
+        while True:
+            if self.failed.is_set():
+                raise PipelineAborted()
+            try:
+                return self.queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+    def batches(self, max_items):
+        """Yields lists of up to `max_items` queued items without waiting for a batch to fill up."""
+        while True:
+            item = self._get()
+            if item is self._CLOSED:
+                # leave the marker for the other consumers
+                self.queue.put(item)
+                return
+            batch = [item]
+            while len(batch) < max_items:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is self._CLOSED:
+                    self.queue.put(item)
+                    yield batch
+                    return
+                batch.append(item)
+            yield batch
+
+    def __iter__(self):
+        for batch in self.batches(1):
+            yield batch[0]
+
+def start_stage(name, function, failed, errors):
+    """Runs `function(stage)` in a thread, timed as metrics stage `name`."""
+    def target():
+        try:
+            with metrics.stage(name) as stage:
+                function(stage)
+        except PipelineAborted:
+            pass
+        except BaseException as e:
+            errors.append((name, e))
+            failed.set()
+
+    thread = threading.Thread(target=target, name=name, daemon=True)
+    thread.start()
+    return thread
+
+def as_stored(vector):
+    # the vector as it is read back from the saved vector file, so that both runners index the same values
+    return np.asarray(vector, dtype=VECTOR_DTYPE).tolist()
+
+def count_table_queries(table_lookup):
+    """{table: number of statements in the SQL file that reference it}."""
+    pending = dict.fromkeys(table_lookup.values(), 0)
+    with open(query_translator.SQL_FILE, 'r') as file:
+        for sql in iter_sql_statements(file):
+            for table_name in referenced_tables(sql.strip(), table_lookup):
+                pending[table_name] += 1
+    return pending
+
+def run_pipeline(catalog, summary_workers=SUMMARY_WORKERS, embed_batch_size=EMBED_BATCH_SIZE, bulk_chunk_docs=BULK_CHUNK_DOCS):
+    """
+    Translates, summarizes, embeds and indexes as one streaming graph:
+
+        translate_queries -> embed_queries -> index_queries
+                 \\-> summarize_tables -> embed_summaries -> index_summaries
+
+    A table is summarized as soon as the last statement that references it has been translated.
+    Writes the same files and index contents as query_translator.py followed by table_summarizer.py.
+    """
+    chain1, chain2, chain3, emb_model = query_translator.init_chains()
+    chat_model, _ = table_summarizer.init_model()
+    summary_chain = ChatPromptTemplate.from_template(table_summarizer.PROMPT_TEMPLATE) | chat_model | StrOutputParser()
+
+    # initialize opensearch indexes (cluster should be pre-created)
+    config = load_opensearch_config()
+    query_client, indexed_queries = query_translator.init_opensearch(config)
+    table_client, indexed_tables = table_summarizer.init_opensearch(config)
+
+    previous_translations = query_translator.load_translations(query_translator.FILE_PATH_1)
+    previous_query_vectors = load_vectors(query_translator.VECTOR_PATH)
+    previous_summaries = table_summarizer.load_previous_summaries(table_summarizer.OUTPUT_FILE_PATH2)
+    previous_table_vectors = load_vectors(table_summarizer.OUTPUT_VECTOR_PATH)
+
+    table_lookup = {table.name.lower(): table.name for table in catalog}
+    pending = count_table_queries(table_lookup)
+    table_queries = {table_name: [] for table_name in pending}
+
+    # one connection to the embedding cache, shared by both embedding stages
+    embedding_store = DiskCache(EMBEDDING_CACHE_PATH, MAX_CACHE_BYTES)
+    failed = threading.Event()
+    errors = []
+    translated = Channel("translated", failed)
+    ready_tables = Channel("ready_tables", failed)
+    query_docs = Channel("query_docs", failed)
+    summaries = Channel("summaries", failed)
+    table_docs = Channel("table_docs", failed)
+
+    query_vectors = {}
+    doc_ids = set()
+    table_vectors = {}
+    counts = {"changed_queries": 0, "reused_summaries": 0, "changed_tables": 0}
+
+    def translate(stage):
+        for table_name, count in pending.items():
+            if count == 0:
+                ready_tables.put(table_name)
+        if os.path.exists(query_translator.FILE_PATH_1):
+            os.remove(query_translator.FILE_PATH_1)
+        with open(query_translator.SQL_FILE, 'r') as file, open(query_translator.FILE_PATH_1, 'a') as output_file:
+            records = query_translator.translate_queries(catalog, iter_sql_statements(file), chain1, chain2, chain3,
+                                                         previous=previous_translations)
+            for data in records:
+                write_record(output_file, data)
+                translated.put(data)
+                stage.add()
+                for table_name in referenced_tables(data["query"], table_lookup):
+                    table_queries[table_name].append({"input": data["input"], "query": data["query"]})
+                    pending[table_name] -= 1
+                    if pending[table_name] == 0:
+                        ready_tables.put(table_name)
+        translated.close()
+        ready_tables.close()
+
+    def embed_queries(stage):
+        with open(query_translator.FILE_PATH_2, 'w') as bulk_file:
+            for batch in translated.batches(embed_batch_size):
+                missing = []
+                for data in batch:
+                    query_fingerprint = data["fingerprint"]
+                    if query_fingerprint in query_vectors:
+                        continue
+                    if previous_query_vectors is not None and query_fingerprint in previous_query_vectors:
+                        query_vectors[query_fingerprint] = previous_query_vectors.get(query_fingerprint).copy()
+                    else:
+                        missing.append(data)
+                if missing:
+                    for data, vector in zip(missing, embed_texts(emb_model, [data["input"] for data in missing], embedding_store)):
+                        query_vectors[data["fingerprint"]] = vector
+
+                for data in batch:
+                    doc_id = fingerprint(data["query"])
+                    doc_ids.add(doc_id)
+                    if indexed_queries.get(doc_id) == data["fingerprint"]:
+                        continue
+                    counts["changed_queries"] += 1
+                    action = {"index": {"_index": query_translator.INDEX_NAME, "_id": doc_id}}
+                    body = {"input": data["input"], "query": data["query"], "fingerprint": data["fingerprint"]}
+                    bulk_file.write(to_bulk_entry(action, body))
+                    query_docs.put(to_bulk_entry(action, {**body, "input_v": as_stored(query_vectors[data["fingerprint"]])}))
+                stage.add(len(batch))
+        query_docs.close()
+
+    def index_documents(client, channel):
+        def index(stage):
+            indexed_docs, _ = bulk_load(client, channel, max_chunk_docs=bulk_chunk_docs)
+            stage.add(indexed_docs)
+        return index
+
+    def summarize(stage):
+        limiter = AdaptiveLimiter(summary_workers)
+        lock = threading.Lock()
+
+        def worker():
+            for table_name in ready_tables:
+                table = catalog.get(table_name)
+                matched = table_summarizer.select_sample_queries(table_queries[table_name])
+                table_fingerprint = fingerprint(table.to_dict(), matched)
+                record, reused = table_summarizer.summary_record(table, matched, table_fingerprint, summary_chain,
+                                                                 previous_summaries, limiter)
+                summaries.put(record)
+                with lock:
+                    counts["reused_summaries"] += reused
+                    stage.add()
+
+        with ThreadPoolExecutor(max_workers=summary_workers) as executor:
+            for future in [executor.submit(worker) for _ in range(summary_workers)]:
+                future.result()
+        summaries.close()
+
+    def embed_summaries(stage):
+        with open(table_summarizer.OUTPUT_FILE_PATH1, 'w', encoding='utf-8') as output_file:
+            for batch in summaries.batches(embed_batch_size):
+                missing = []
+                for record in batch:
+                    write_record(output_file, record)
+                    table_name, table_data = next(iter(record.items()))
+                    prev = previous_summaries.get(table_name)
+                    if (prev and prev.fingerprint == table_data["fingerprint"]
+                            and previous_table_vectors is not None and table_name in previous_table_vectors):
+                        table_vectors[table_name] = previous_table_vectors.get(table_name).copy()
+                    else:
+                        missing.append((table_name, table_data["table_summary"]))
+                if missing:
+                    for (table_name, _), vector in zip(missing, embed_texts(emb_model, [summary for _, summary in missing], embedding_store)):
+                        table_vectors[table_name] = vector
+
+                for record in batch:
+                    table_name, table_data = next(iter(record.items()))
+                    if indexed_tables.get(table_name) == table_data["fingerprint"]:
+                        continue
+                    counts["changed_tables"] += 1
+                    table_docs.put(table_summarizer.to_bulk_doc(Table.from_dict(table_name, table_data), as_stored(table_vectors[table_name])))
+                stage.add(len(batch))
+        table_docs.close()
+
+    threads = [
+        start_stage("translate_queries", translate, failed, errors),
+        start_stage("embed_queries", embed_queries, failed, errors),
+        start_stage("index_queries", index_documents(query_client, query_docs), failed, errors),
+        start_stage("summarize_tables", summarize, failed, errors),
+        start_stage("embed_summaries", embed_summaries, failed, errors),
+        start_stage("index_summaries", index_documents(table_client, table_docs), failed, errors),
+    ]
+    for thread in threads:
+        thread.join()
+    embedding_store.close()
+    if errors:
+        name, error = errors[0]
+        print(f"Stage {name} failed: {type(error).__name__}: {error}")
+        raise error
+
+    with metrics.stage("finalize"):
+        print(f"{counts['changed_queries']}/{len(doc_ids)} queries were new or changed")
+        print(f"Reused {counts['reused_summaries']} unchanged table summaries, "
+              f"{counts['changed_tables']}/{len(catalog)} tables were new or changed")
+        metrics.increment("reused_summaries", counts["reused_summaries"])
+
+        fingerprints = list(dict.fromkeys(data["fingerprint"] for data in read_records(query_translator.FILE_PATH_1)))
+        del previous_query_vectors
+        save_vectors(query_translator.VECTOR_PATH, fingerprints, [query_vectors[fp] for fp in fingerprints])
+
+        # summaries finish out of order; the output keeps the order of the schema file
+        records = {next(iter(record)): record for record in read_records(table_summarizer.OUTPUT_FILE_PATH1)}
+        table_names = [table_name for table_name in catalog.table_names() if table_name in records]
+        with open(table_summarizer.OUTPUT_FILE_PATH2 + ".tmp", 'w', encoding='utf-8') as output_file:
+            for table_name in table_names:
+                write_record(output_file, records[table_name])
+        os.replace(table_summarizer.OUTPUT_FILE_PATH2 + ".tmp", table_summarizer.OUTPUT_FILE_PATH2)
+        os.remove(table_summarizer.OUTPUT_FILE_PATH1)
+        del previous_table_vectors
+        save_vectors(table_summarizer.OUTPUT_VECTOR_PATH, table_names, [table_vectors[table_name] for table_name in table_names])
+
+        stale = indexed_queries.keys() - doc_ids
+        if stale:
+            print(f"Deleting {len(stale)} queries that no longer exist")
+            bulk_load(query_client, (to_delete_entry(query_translator.INDEX_NAME, doc_id) for doc_id in sorted(stale)))
+        stale = indexed_tables.keys() - set(table_names)
+        if stale:
+            print(f"Deleting {len(stale)} tables that no longer exist")
+            bulk_load(table_client, (to_delete_entry(table_summarizer.INDEX_NAME, table_name) for table_name in sorted(stale)))
+
+def main(summary_workers=SUMMARY_WORKERS, embed_batch_size=EMBED_BATCH_SIZE, bulk_chunk_docs=BULK_CHUNK_DOCS):
+    # replay identical Bedrock calls from earlier (or crashed) runs
+    enable_llm_cache()
+
+    with metrics.stage("load_schema") as stage:
+        catalog = load_catalog(table_summarizer.SCHEMA_FILE_PATH)
+        stage.add(len(catalog))
+    run_pipeline(catalog, summary_workers, embed_batch_size, bulk_chunk_docs)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run query translation and table summarization as one streaming pipeline.")
+    parser.add_argument("--summary-workers", type=int, default=SUMMARY_WORKERS)
+    parser.add_argument("--embed-batch-size", type=int, default=EMBED_BATCH_SIZE)
+    parser.add_argument("--bulk-chunk-docs", type=int, default=BULK_CHUNK_DOCS)
+    args = parser.parse_args()
+    metrics.run("pipeline", lambda: main(args.summary_workers, args.embed_batch_size, args.bulk_chunk_docs))
@@ -1,47 +1,82 @@
+import argparse
 import json
+from json_stream import iter_json_array
+from sharding import parse_shard, shard_path
 
-with open('spider_inputs.json', 'r') as infile:
-    data = json.load(infile)
+INPUT_FILE_PATH = 'spider_inputs.json'
+OUTPUT_FILE_PATH = 'spider_tables.json'
 
-def parse_data(data):
-    parsed = {}
-    
+def flatten_keys(keys):
+    # composite primary keys are listed as nested lists in newer Spider exports
+    flat = set()
+    for key in keys:
+        if isinstance(key, list):
+            flat.update(key)
+        else:
+            flat.add(key)
+    return flat
+
+def parse_db(db):
+    db_id = db['db_id']
+
+    table_names = db['table_names']
+    column_names = db['column_names']
+    column_names_original = db['column_names_original']
+    column_types = db['column_types']
+    primary_keys = flatten_keys(db['primary_keys'])
+    foreign_keys = db['foreign_keys']
+
+    table_keys = [f"{db_id}_{table.replace(' ', '_')}" for table in table_names]
+    tables = [{"db_id": db_id, "cols": [], "table_desc": table, "foreign_keys": []} for table in table_names]
+
+    # one pass over the columns, grouped by their table index
+    for j, (table_index, col_desc) in enumerate(column_names):
+        if table_index < 0:
+            continue
+        tables[table_index]["cols"].append({
+            "col": column_names_original[j][1],
+            "format": column_types[j],
+            "col_desc": col_desc,
+            "pk": j in primary_keys
+        })
+
+    for col_index, ref_index in foreign_keys:
+        table_index = column_names[col_index][0]
+        ref_table_index = column_names[ref_index][0]
+        tables[table_index]["foreign_keys"].append({
+            "col": column_names_original[col_index][1],
+            "ref_table": table_keys[ref_table_index],
+            "ref_col": column_names_original[ref_index][1]
+        })
+
+    return zip(table_keys, tables)
+
+def parse_data(data, shard=None):
     for db in data:
-        db_id = db['db_id']
-        
-        table_names = db['table_names']
-        column_names = db['column_names']
-        column_names_original = db['column_names_original']
-        column_types = db['column_types']
-        primary_keys = db['primary_keys']
-        foreign_keys = db['foreign_keys']
-
-        for i, table in enumerate(table_names):
-            table_key = f"{db_id}_{table.replace(' ', '_')}" 
-            parsed[table_key] = {
-                "cols": [],
-                "table_desc": table
-            }
-            
-            for j, col in enumerate(column_names):
-                if col[0] == i:
-                    col_name = column_names_original[j][1]
-                    col_desc = col[1]
-                    col_format = column_types[j]
-                    pk = j in primary_keys
-
-                    parsed[table_key]["cols"].append({
-                        "col": col_name,
-                        "format": col_format,
-                        "col_desc": col_desc,
-                        "pk": pk
-                    })
-
-    return parsed
-
-parsed_data = parse_data(data)
-
-with open('spider_tables.json', 'w') as outfile:
-    json.dump(parsed_data, outfile, indent=4)
-
-print("Data successfully parsed and saved to spider_tables.json")
+        if shard is None or shard.owns(db['db_id']):
+            yield from parse_db(db)
+
+def write_tables(file_path, items):
+    """Writes (table key, table) pairs as one JSON object, a table per line. Returns the number of tables."""
+    count = 0
+    with open(file_path, 'w') as outfile:
+        outfile.write('{')
+        for table_key, table in items:
+            if count:
+                outfile.write(',\n')
+            outfile.write(json.dumps(table_key) + ':' + json.dumps(table, separators=(',', ':')))
+            count += 1
+        outfile.write('}\n')
+    return count
+
+def main(shard=None):
+    output_file_path = shard_path(OUTPUT_FILE_PATH, shard)
+    with open(INPUT_FILE_PATH, 'r') as infile:
+        count = write_tables(output_file_path, parse_data(iter_json_array(infile), shard))
+
+    print(f"Data successfully parsed and saved to {output_file_path} ({count} tables)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert the Spider tables.json export into spider_tables.json.")
+    parser.add_argument("--shard", type=parse_shard, help="i/N: only the databases of shard i of N (merge with merge_shards.py)")
+    main(parser.parse_args().shard)
@@ -1,12 +1,21 @@
+import argparse
 import json
 import os
-import time
-import yaml
+import re
 from langchain_aws import ChatBedrock
-from opensearchpy import OpenSearch, RequestsHttpConnection
 from langchain_community.embeddings import BedrockEmbeddings
 from langchain_core.prompts.chat import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
+from llm_cache import enable_llm_cache
+import metrics
+from catalog import load_catalog
+from embedder import embed_texts
+from llm_executor import AdaptiveLimiter, invoke_with_backoff
+from json_stream import read_records, write_record
+from sharding import parse_shard, shard_name, shard_path, statement_shard, table_databases
+from sql_parser import extract_tables_and_columns, iter_sql_statements, normalize_sql, tokenize
+from vector_store import load_vectors, save_vectors
+from opensearch_utils import bulk_load, create_os_client, fingerprint, load_opensearch_config, prepare_index, read_bulk_file, to_delete_entry
 
 
 output_language = "Korean"
@@ -53,6 +62,13 @@ Query to retrieve the count of products processed on May 22, 2024.
 </example>
 """.format(output_language=output_language)
 
+SYS_PROMPT_TEMPLATE3 = """
+You rewrite a natural language request so that it matches a new SQL query.
+The new query has the same structure as the original query and only differs in literal values or alias names.
+Change only the values that differ and keep everything else word for word.
+Skip the preamble and only provide the rewritten request.
+"""
+
 USR_PROMPT_TEMPLATE1="""
 SQL: {sql}
 """
@@ -66,13 +82,40 @@ SQL: {sql}
 """
 
 
+USR_PROMPT_TEMPLATE3="""
+<original_sql>
+{original_sql}
+</original_sql>
+
+<request>
+{request}
+</request>
+
+SQL: {sql}
+"""
+
 INDEX_NAME = "example_queries"
 REGION_NAME = "us-east-1"
 
+# db_id of every table, which decides the shard of a statement
+TABLE_FILE = "spider_tables.json"
 SCHEMA_FILE = "./metadata/spider_schemas.json"
 SQL_FILE = "./metadata/spider.sql"
 FILE_PATH_1 = "./metadata/spider_example_queries_temp.json"
 FILE_PATH_2 = "./metadata/spider_example_queries.json"
+# input_v of every translated query, keyed by its fingerprint (see vector_store)
+VECTOR_PATH = "./metadata/spider_example_queries_vectors"
+
+# Delete and recreate the index instead of updating only the changed documents
+REBUILD_INDEX = False
+
+# Statements that only differ from an earlier one in literals or aliases (same normalize_sql text):
+# "substitute" rewrites the earlier translation with the new literals, locally when the old values appear
+# in it unambiguously and otherwise with a short LLM call; "reuse" takes the translation over unchanged;
+# "full" translates every statement on its own
+TEMPLATE_POLICY = "substitute"
+MODEL_ID = "anthropic.claude-3-sonnet-20240229-v1:0"
+SUBSTITUTION_MODEL_ID = "anthropic.claude-3-haiku-20240307-v1:0"
 
 model_kwargs =  { 
     "max_tokens": 100000,
@@ -81,148 +124,316 @@ model_kwargs =  {
     "top_p": 1
 }
 
-model_kwargs["system"] = SYS_PROMPT_TEMPLATE1
-model1 = ChatBedrock(model_id="anthropic.claude-3-sonnet-20240229-v1:0", region_name=REGION_NAME, model_kwargs=model_kwargs)
+def init_models():
+    model1 = ChatBedrock(model_id=MODEL_ID, region_name=REGION_NAME, model_kwargs={**model_kwargs, "system": SYS_PROMPT_TEMPLATE1},
+                         callbacks=[metrics.TokenUsageHandler()])
+    model2 = ChatBedrock(model_id=MODEL_ID, region_name=REGION_NAME, model_kwargs={**model_kwargs, "system": SYS_PROMPT_TEMPLATE2},
+                         callbacks=[metrics.TokenUsageHandler()])
+    model3 = ChatBedrock(model_id=SUBSTITUTION_MODEL_ID, region_name=REGION_NAME,
+                         model_kwargs={**model_kwargs, "system": SYS_PROMPT_TEMPLATE3, "max_tokens": 4096},
+                         callbacks=[metrics.TokenUsageHandler()])
+    emb_model = BedrockEmbeddings(model_id="amazon.titan-embed-text-v2:0", region_name=REGION_NAME, model_kwargs={"dimensions":1024})
+    return model1, model2, model3, emb_model
 
-model_kwargs["system"] = SYS_PROMPT_TEMPLATE2
-model2 = ChatBedrock(model_id="anthropic.claude-3-sonnet-20240229-v1:0", region_name=REGION_NAME, model_kwargs=model_kwargs)
+def init_chains():
+    model1, model2, model3, emb_model = init_models()
 
-emb_model = BedrockEmbeddings(model_id="amazon.titan-embed-text-v2:0", region_name=REGION_NAME, model_kwargs={"dimensions":1024}) 
-
-def load_opensearch_config():
-    with open("./metadata/opensearch.yml", 'r', encoding='utf-8') as file:
-        return yaml.safe_load(file)
-
-def create_os_index(os_client, mapping):
-    exists = os_client.indices.exists(INDEX_NAME)
-
-    if exists:
-        os_client.indices.delete(index=INDEX_NAME)
-        print("Existing index has been deleted. Create new one.")
-    else:
-        print("Index does not exist, Create one.")
-
-    os_client.indices.create(INDEX_NAME, body=mapping)
-
-def init_opensearch(config):
-    mapping = {"settings": config['settings'], "mappings": config['mappings-schema']}
-    endpoint = config['opensearch-auth']['domain_endpoint']
-    http_auth = (config['opensearch-auth']['user_id'], config['opensearch-auth']['user_password'])
-
-    os_client = OpenSearch(
-            hosts=[{'host': endpoint.replace("https://", ""),'port': 443}],
-            http_auth=http_auth, 
-            use_ssl=True,
-            verify_certs=True,
-            timeout=300,
-            connection_class=RequestsHttpConnection
-    )
+    prompt1 = ChatPromptTemplate.from_template(USR_PROMPT_TEMPLATE1)
+    chain1 = prompt1 | model1 | StrOutputParser()
 
-    create_os_index(os_client, mapping)
-    return os_client
+    prompt2 = ChatPromptTemplate.from_template(USR_PROMPT_TEMPLATE2)
+    chain2 = prompt2 | model2 | StrOutputParser()
 
-def extract_descriptions(table_info, tables, columns):
-    tables_lower = {table.lower() for table in tables}
+    prompt3 = ChatPromptTemplate.from_template(USR_PROMPT_TEMPLATE3)
+    chain3 = prompt3 | model3 | StrOutputParser()
+    return chain1, chain2, chain3, emb_model
+
+def chain_parameters(chain):
+    """
+    Prompt templates and model parameters (model id, system prompt, sampling) of a
+    prompt | model | parser chain; a translation is redone when any of them changes.
+    """
+    return [step.pretty_repr() if isinstance(step, ChatPromptTemplate) else getattr(step, "_identifying_params", type(step).__name__)
+            for step in getattr(chain, "steps", [chain])]
+
+def init_opensearch(config, rebuild=REBUILD_INDEX):
+    """Returns the client and {_id: fingerprint} of the documents already in the index."""
+    mapping = {"settings": config['settings'], "mappings": config['mappings-sql']}
+    os_client = create_os_client(config)
+    return os_client, prepare_index(os_client, INDEX_NAME, mapping, rebuild)
+
+def extract_descriptions(catalog, tables, columns):
     columns_lower = {column.lower() for column in columns}
-    
+
     description = {
         "table": {},
         "column": {}
     }
-    
-    for table_schema in table_info:
-        for table_name, table_info in table_schema.items():
-            if table_name.lower() in tables_lower:
-                description["table"][table_name] = table_info["table_desc"]
-                for col in table_info["cols"]:
-                    col_name = col["col"]
-                    if col_name.lower() in columns_lower:
-                        description["column"][col_name] = col["col_desc"]
-    return description
 
-def query_translation(table_info, queries, chain1, chain2):
-    if os.path.exists(FILE_PATH_1):
-        os.remove(FILE_PATH_1)
+    # Keep schema order so that the prompt (and its cache key) does not depend on set ordering
+    for table_name in sorted({table.lower() for table in tables if table in catalog}, key=catalog.position):
+        table = catalog.get(table_name)
+        description["table"][table.name] = table.desc
+        for column in table.columns:
+            if column.name.lower() in columns_lower:
+                description["column"][column.name] = column.desc
+    return description
 
-    with open(FILE_PATH_1, 'a') as output_file:
-        for query in queries:
-            sql = query.strip()
-            
+def load_translations(file_path):
+    """Translations of the previous run keyed by fingerprint."""
+    translations = {}
+    if os.path.exists(file_path):
+        for data in read_records(file_path):
+            if "fingerprint" in data:
+                translations[data["fingerprint"]] = data["input"]
+    return translations
+
+# Numbers with fewer digits (`x = 1`) too often also appear in a translation for another reason ("상위 1개")
+MIN_SUBSTITUTED_DIGITS = 3
+
+def literal_values(sql):
+    return [(kind, value[1:-1] if kind == "string" else value) for kind, value in tokenize(sql) if kind in ("string", "number")]
+
+def substitute_literals(text, original_sql, sql):
+    """
+    Rewrites `text`, the translation of `original_sql`, for `sql` by replacing the literals that differ.
+    Returns None unless every changed value is a string or a number of at least MIN_SUBSTITUTED_DIGITS
+    digits and occurs exactly once in `text`.
+    """
+    original, new = literal_values(original_sql), literal_values(sql)
+    if len(original) != len(new):
+        return None
+    replacements = {}
+    for (kind, old_value), (_, new_value) in zip(original, new):
+        if old_value == new_value:
+            continue
+        if replacements.get(old_value, new_value) != new_value or not old_value:
+            return None
+        if kind == "number" and len(old_value.replace(".", "")) < MIN_SUBSTITUTED_DIGITS:
+            return None
+        replacements[old_value] = new_value
+    if not replacements:
+        return text
+
+    def occurrences(value):
+        # `30` must not match inside `2030`, but may be followed by Korean particles (`30세`)
+        return re.compile(rf"(?<![0-9A-Za-z]){re.escape(value)}(?![0-9A-Za-z])")
+
+    patterns = {value: occurrences(value) for value in replacements}
+    if any(len(pattern.findall(text)) != 1 for pattern in patterns.values()):
+        return None
+    combined = re.compile("|".join(pattern.pattern for pattern in sorted(patterns.values(), key=lambda p: -len(p.pattern))))
+    return combined.sub(lambda match: replacements[match.group()], text)
+
+def translate_queries(catalog, queries, chain1, chain2, chain3=None, policy=TEMPLATE_POLICY, previous=None):
+    """
+    Yields {"input", "query", "fingerprint"} for every statement of `queries`, in order.
+    `previous` maps fingerprints to translations that can be reused.
+    """
+    previous = previous or {}
+    lookup = catalog.column_lookup()
+    templates = {}      # normalize_sql text -> {"sql", "schema", "input"} of its first statement
+    llm_fallbacks = 0
+    reused = 0
+    total = 0
+    shared = {"local": 0, "llm": 0, "reuse": 0}
+    # queries are translated one at a time; throttled calls are retried
+    limiter = AdaptiveLimiter(1)
+    translation = chain_parameters(chain2)
+    substitution = chain_parameters(chain3) if chain3 is not None and policy == "substitute" else None
+
+    for query in queries:
+        sql = query.strip()
+        total += 1
+        template = normalize_sql(sql)
+        representative = templates.get(template) if policy != "full" else None
+
+        if representative is not None:
+            # same tables and columns as the statement the template was first seen with
+            schema = representative["schema"]
+        else:
+            # Resolve tables/columns locally; only statements the parser can't handle go to the LLM
+            schema = extract_tables_and_columns(sql, lookup)
+        if schema is None:
+            llm_fallbacks += 1
+            response = invoke_with_backoff(chain1, {"sql": sql}, limiter, call="llm_extract")
             try:
-                response = chain1.invoke({"sql": sql})
                 schema = json.loads(response)
             except json.JSONDecodeError:
-                print(response)
-                time.sleep(1)  
-
-            description = extract_descriptions(table_info, schema["table"], schema["column"])
-            
-            input = chain2.invoke({"sql": sql, "description": description})
-            # Write input and query to the file in JSON format
-            data = {"input": input, "query": sql}
-            output_file.write(json.dumps(data, ensure_ascii=False) + "\n")
-
-def input_embedding(emb_model):
-    num = 0
+                print(f"Could not extract tables and columns: {response}")
+                schema = {"table": [], "column": []}
+
+        description = extract_descriptions(catalog, schema["table"], schema["column"])
+
+        # the translation only depends on the SQL, the descriptions it is given and the translation chain
+        # (and, for a statement sharing a template, on how it is derived from the first one)
+        if representative is None:
+            query_fingerprint = fingerprint(sql, description, translation)
+        else:
+            query_fingerprint = fingerprint(sql, description, translation, policy, representative["sql"], substitution)
+
+        if query_fingerprint in previous:
+            input = previous[query_fingerprint]
+            reused += 1
+        elif representative is None or (policy == "substitute" and chain3 is None):
+            input = invoke_with_backoff(chain2, {"sql": sql, "description": description}, limiter, call="llm_translate")
+        elif policy == "reuse":
+            input = representative["input"]
+            shared["reuse"] += 1
+        else:
+            input = substitute_literals(representative["input"], representative["sql"], sql)
+            if input is not None:
+                shared["local"] += 1
+            else:
+                shared["llm"] += 1
+                input = invoke_with_backoff(chain3, {"original_sql": representative["sql"], "request": representative["input"], "sql": sql},
+                                            limiter, call="llm_substitute")
+
+        if representative is None and policy != "full":
+            templates[template] = {"sql": sql, "schema": schema, "input": input}
+        yield {"input": input, "query": sql, "fingerprint": query_fingerprint}
+
+    print(f"Extracted tables and columns locally for {total - llm_fallbacks}/{total} queries")
+    print(f"Reused {reused}/{total} unchanged translations")
+    if policy != "full":
+        print(f"{len(templates)} distinct templates; {shared['local']} statements substituted locally, "
+              f"{shared['llm']} with the LLM, {shared['reuse']} reused")
+    metrics.increment("parser_fallbacks", llm_fallbacks)
+    metrics.increment("reused_translations", reused)
+    metrics.increment("template_substitutions_local", shared["local"])
+    metrics.increment("template_substitutions_llm", shared["llm"])
+    metrics.increment("template_reuses", shared["reuse"])
+
+def query_translation(catalog, queries, chain1, chain2, chain3=None, policy=TEMPLATE_POLICY, file_path=FILE_PATH_1):
+    previous = load_translations(file_path)
+    if os.path.exists(file_path):
+        os.remove(file_path)
+
+    total = 0
+    with open(file_path, 'a') as output_file:
+        for data in translate_queries(catalog, queries, chain1, chain2, chain3, policy, previous):
+            write_record(output_file, data)
+            total += 1
+    return total
+
+def embed_translations(emb_model, file_path=FILE_PATH_1, vector_path=VECTOR_PATH):
+    """Saves the vector of every translation in `file_path` to `vector_path` and returns the translations."""
+    records = list(read_records(file_path))
+
+    # keep the vectors of unchanged translations, embed the rest
+    previous_vectors = load_vectors(vector_path)
+    fingerprints = list(dict.fromkeys(data['fingerprint'] for data in records))
+    vectors = {}
+    if previous_vectors is not None:
+        vectors = {fp: previous_vectors.get(fp).copy() for fp in fingerprints if fp in previous_vectors}
+        del previous_vectors
+    missing = [data for data in records if data['fingerprint'] not in vectors]
+    for data, vector in zip(missing, embed_texts(emb_model, [data['input'] for data in missing])):
+        vectors[data['fingerprint']] = vector
+
+    save_vectors(vector_path, fingerprints, [vectors[fp] for fp in fingerprints])
+    return records
+
+def input_embedding(emb_model, indexed=None):
+    """
+    Writes bulk actions for the queries that are new or changed compared with `indexed`
+    ({_id: fingerprint} of the live index) and returns the ids of all current queries.
+    """
+    indexed = indexed or {}
     if os.path.exists(FILE_PATH_2):
         os.remove(FILE_PATH_2)
 
-    with open(FILE_PATH_1, 'r') as input_file, open(FILE_PATH_2, 'a') as output_file:
-        for line in input_file:
-            data = json.loads(line)
-            input = data['input']
-            query = data['query']
-            
-            # Data part
-            body = { "input": input, "query": query, "input_v": emb_model.embed_query(input) }
+    records = embed_translations(emb_model)
+
+    doc_ids = [fingerprint(data['query']) for data in records]
+    changed = [(doc_id, data) for doc_id, data in zip(doc_ids, records) if indexed.get(doc_id) != data['fingerprint']]
+    print(f"{len(changed)}/{len(records)} queries are new or changed")
+
+    with open(FILE_PATH_2, 'a') as output_file:
+        for doc_id, data in changed:
+            # Data part (input_v is stored in VECTOR_PATH and added when the documents are loaded)
+            body = { "input": data['input'], "query": data['query'], "fingerprint": data['fingerprint'] }
 
             # Action part
-            action = { "index": { "_index": INDEX_NAME, "_id": str(num) } }
+            action = { "index": { "_index": INDEX_NAME, "_id": doc_id } }
 
             # Write action and body to the file in correct bulk format
             output_file.write(json.dumps(action, ensure_ascii=False) + "\n")
             output_file.write(json.dumps(body, ensure_ascii=False) + "\n")
 
-            num += 1    
-
-def main():   
-    # load the schema description
-    with open(SCHEMA_FILE, 'r') as file:
-        table_info = json.load(file)
-
-    # load the example SQLs
-    with open(SQL_FILE, 'r') as file:
-        data = file.read()
-    queries = [query.strip() for query in data.split(';') if query.strip()]
+    return set(doc_ids)
+
+def iter_bulk_entries(file_path, vector_path):
+    vectors = load_vectors(vector_path)
+    for entry in read_bulk_file(file_path):
+        action, body = entry.splitlines()
+        doc = json.loads(body)
+        doc["input_v"] = vectors.as_list(doc["fingerprint"])
+        yield action + "\n" + json.dumps(doc, ensure_ascii=False) + "\n"
+
+def translate_shard(shard, chain1, chain2, chain3, emb_model):
+    """
+    Translates and embeds the statements of the shard's databases into the shard's own files.
+    Nothing is indexed; merge_shards.py combines the shards for --index-only.
+    """
+    with metrics.stage("load_schema") as stage:
+        catalog = load_catalog(shard_path(SCHEMA_FILE, shard))
+        databases = table_databases(load_catalog(TABLE_FILE))
+        stage.add(len(catalog))
+
+    file_path = shard_path(FILE_PATH_1, shard)
+    with metrics.stage("translate_queries") as stage, open(SQL_FILE, 'r') as file:
+        queries = (sql for sql in iter_sql_statements(file) if statement_shard(sql, databases, shard.count) == shard.index)
+        stage.add(query_translation(catalog, queries, chain1, chain2, chain3, file_path=file_path))
+
+    with metrics.stage("embed_queries") as stage:
+        stage.add(len(embed_translations(emb_model, file_path, shard_path(VECTOR_PATH, shard))))
+
+def main(shard=None, index_only=False):
+    # replay identical Bedrock calls from earlier (or crashed) runs
+    enable_llm_cache()
+
+    chain1, chain2, chain3, emb_model = init_chains()
+    if shard is not None:
+        translate_shard(shard, chain1, chain2, chain3, emb_model)
+        return
 
-    prompt1 = ChatPromptTemplate.from_template(USR_PROMPT_TEMPLATE1)
-    chain1 = prompt1 | model1 | StrOutputParser()
+    # initialize opensearch index (cluster should be pre-created)
+    os_client, indexed = init_opensearch(load_opensearch_config())
 
-    prompt2 = ChatPromptTemplate.from_template(USR_PROMPT_TEMPLATE2)
-    chain2 = prompt2 | model2 | StrOutputParser()
+    if not index_only:
+        # load the schema description
+        with metrics.stage("load_schema") as stage:
+            catalog = load_catalog(SCHEMA_FILE)
+            stage.add(len(catalog))
 
-    query_translation(table_info, queries, chain1, chain2)
-    input_embedding(emb_model)
+        # stream the example SQLs; translation starts before the whole file has been read
+        with metrics.stage("translate_queries") as stage, open(SQL_FILE, 'r') as file:
+            stage.add(query_translation(catalog, iter_sql_statements(file), chain1, chain2, chain3))
 
-    # initialize opensearch index (cluster should be pre-created)
-    config = load_opensearch_config()
-    os_client = init_opensearch(config)
-
-    with open(FILE_PATH_2, 'r') as file:
-        bulk_data = file.read()
-
-    response = os_client.bulk(body=bulk_data)
-
-    if response["errors"]:
-        print("There were errors during bulk indexing:")
-        for item in response["items"]:
-            if 'index' in item and item['index']['status'] >= 400:
-                print(f"Error: {item['index']['error']['reason']}")
-    else:
-        print("Bulk-inserted all items successfully.")
-    
-if __name__ == "__main__":
-    main()
+    with metrics.stage("embed_queries") as stage:
+        doc_ids = input_embedding(emb_model, indexed)
+        stage.add(len(doc_ids))
 
+    with metrics.stage("bulk_index") as stage:
+        indexed_docs, _ = bulk_load(os_client, iter_bulk_entries(FILE_PATH_2, VECTOR_PATH))
+        stage.add(indexed_docs)
 
+        stale = indexed.keys() - doc_ids
+        if stale:
+            print(f"Deleting {len(stale)} queries that no longer exist")
+            bulk_load(os_client, (to_delete_entry(INDEX_NAME, doc_id) for doc_id in sorted(stale)))
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Translate the example SQL statements into requests and index them.")
+    parser.add_argument("--shard", type=parse_shard,
+                        help="i/N: only translate and embed the statements on the databases of shard i of N (merge with merge_shards.py)")
+    parser.add_argument("--index-only", action="store_true",
+                        help="index the existing translations (e.g. merged from shards) without translating")
+    args = parser.parse_args()
+    if args.shard and args.index_only:
+        parser.error("--index-only indexes the merged translations and does not take --shard")
+    if args.index_only and not os.path.exists(FILE_PATH_1):
+        parser.error(f"--index-only needs {FILE_PATH_1}; run query_translator.py without "
+                     "--index-only first (or merge_shards.py after sharded runs)")
+    metrics.run(shard_name("query_translator", args.shard), lambda: main(args.shard, args.index_only))
@@ -0,0 +1,197 @@
+import argparse
+import heapq
+import numpy as np
+from catalog import load_catalog
+from json_stream import read_records
+from opensearch_utils import load_opensearch_config
+from vector_store import load_vectors
+
+SCHEMA_FILE_PATH = "./metadata/spider_detailed_schema.json"
+SCHEMA_VECTOR_PATH = "./metadata/spider_detailed_schema_vectors"
+QUERY_FILE_PATH = "./metadata/spider_example_queries_temp.json"
+QUERY_VECTOR_PATH = "./metadata/spider_example_queries_vectors"
+
+# defaults of the knn_vector mappings in opensearch.yml
+DEFAULT_M = 16
+DEFAULT_EF_CONSTRUCTION = 512
+DEFAULT_EF_SEARCH = 512
+
+def l2_score(distance):
+    # score OpenSearch reports for space_type l2 (distance is the squared L2 distance)
+    return 1.0 / (1.0 + distance)
+
+class ExactIndex:
+    """Brute-force squared-L2 search over all vectors."""
+    def __init__(self, vectors):
+        self.vectors = np.asarray(vectors, dtype=np.float32)
+        self.norms = np.einsum('ij,ij->i', self.vectors, self.vectors)
+
+    def search(self, query, k):
+        query = np.asarray(query, dtype=np.float32)
+        distances = np.maximum(self.norms - 2 * (self.vectors @ query) + query @ query, 0)
+        k = min(k, len(distances))
+        if k == 0:
+            return []
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top])]
+        return list(zip(top.tolist(), distances[top].tolist()))
+
+class HNSWIndex:
+    """
+    Hierarchical navigable small world graph with the same parameters as the faiss engine:
+    `m` links per node on the upper layers, 2 * `m` on layer 0.
+    """
+    def __init__(self, vectors, m=DEFAULT_M, ef_construction=DEFAULT_EF_CONSTRUCTION, ef_search=DEFAULT_EF_SEARCH, seed=0):
+        self.vectors = np.asarray(vectors, dtype=np.float32)
+        self.m = m
+        self.m0 = 2 * m
+        self.level_mult = 1 / np.log(m)
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.graph = []         # per layer: node -> list of neighbours
+        self.entry = None
+        self.max_level = -1
+
+        rng = np.random.default_rng(seed)
+        for node in range(len(self.vectors)):
+            self._insert(node, int(-np.log(1.0 - rng.random()) * self.level_mult))
+
+    def _distances(self, query, nodes):
+        diff = self.vectors[nodes] - query
+        return np.einsum('ij,ij->i', diff, diff)
+
+    def _search_layer(self, query, entry_points, ef, level):
+        visited = set(entry_points)
+        distances = self._distances(query, entry_points)
+        candidates = [(d, n) for d, n in zip(distances.tolist(), entry_points)]
+        heapq.heapify(candidates)
+        results = [(-d, n) for d, n in candidates]
+        heapq.heapify(results)
+        while len(results) > ef:
+            heapq.heappop(results)
+
+        layer = self.graph[level]
+        while candidates:
+            distance, node = heapq.heappop(candidates)
+            if distance > -results[0][0]:
+                break
+            neighbours = [n for n in layer[node] if n not in visited]
+            if not neighbours:
+                continue
+            visited.update(neighbours)
+            for d, n in zip(self._distances(query, neighbours).tolist(), neighbours):
+                if len(results) < ef or d < -results[0][0]:
+                    heapq.heappush(candidates, (d, n))
+                    heapq.heappush(results, (-d, n))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+
+        return sorted((-d, n) for d, n in results)
+
+    def _insert(self, node, level):
+        while len(self.graph) <= level:
+            self.graph.append({})
+        for layer in range(level + 1):
+            self.graph[layer][node] = []
+
+        if self.entry is None:
+            self.entry, self.max_level = node, level
+            return
+
+        query = self.vectors[node]
+        entry_points = [self.entry]
+        for layer in range(self.max_level, level, -1):
+            entry_points = [self._search_layer(query, entry_points, 1, layer)[0][1]]
+
+        for layer in range(min(level, self.max_level), -1, -1):
+            found = self._search_layer(query, entry_points, self.ef_construction, layer)
+            max_links = self.m0 if layer == 0 else self.m
+            self.graph[layer][node] = [n for _, n in found[:self.m]]
+            for neighbour in self.graph[layer][node]:
+                links = self.graph[layer][neighbour]
+                links.append(node)
+                if len(links) > max_links:
+                    keep = np.argsort(self._distances(self.vectors[neighbour], links))[:max_links]
+                    self.graph[layer][neighbour] = [links[i] for i in keep]
+            entry_points = [n for _, n in found]
+
+        if level > self.max_level:
+            self.entry, self.max_level = node, level
+
+    def search(self, query, k, ef_search=None):
+        if self.entry is None:
+            return []
+        query = np.asarray(query, dtype=np.float32)
+        entry_points = [self.entry]
+        for layer in range(self.max_level, 0, -1):
+            entry_points = [self._search_layer(query, entry_points, 1, layer)[0][1]]
+        found = self._search_layer(query, entry_points, max(ef_search or self.ef_search, k), 0)
+        return [(n, d) for d, n in found[:k]]
+
+class LocalRetriever:
+    """Top-k kNN over generated documents and their vectors, without an OpenSearch cluster."""
+    def __init__(self, ids, vectors, documents, mode="exact", **hnsw_params):
+        self.ids = ids
+        self.documents = documents
+        if mode == "exact":
+            self.index = ExactIndex(vectors)
+        elif mode == "hnsw":
+            self.index = HNSWIndex(vectors, **hnsw_params)
+        else:
+            raise ValueError(f"Unknown retrieval mode: {mode}")
+
+    def search(self, query_vector, k=5, **search_params):
+        return [
+            {"_id": self.ids[row], "_score": l2_score(distance), "_source": self.documents[row]}
+            for row, distance in self.index.search(query_vector, k, **search_params)
+        ]
+
+def hnsw_params(config, mapping_key, vector_field):
+    """Reads m / ef_construction / ef_search the way the index is configured in opensearch.yml."""
+    method = config[mapping_key]['properties'][vector_field]['method']
+    parameters = method.get('parameters', {})
+    return {
+        "m": parameters.get('m', DEFAULT_M),
+        "ef_construction": parameters.get('ef_construction', DEFAULT_EF_CONSTRUCTION),
+        "ef_search": config['settings'].get('index.knn.algo_param.ef_search', DEFAULT_EF_SEARCH),
+    }
+
+def load_schema_retriever(mode="exact", config=None, **overrides):
+    catalog = load_catalog(SCHEMA_FILE_PATH)
+    store = load_vectors(SCHEMA_VECTOR_PATH)
+    params = {}
+    if mode == "hnsw":
+        params = {**hnsw_params(config or load_opensearch_config(), 'mappings-detailed-schema', 'table_summary_v'), **overrides}
+    documents = [{"table_name": table_name, **catalog.get(table_name).to_dict()} for table_name in store.ids]
+    return LocalRetriever(store.ids, store.vectors, documents, mode, **params)
+
+def load_query_retriever(mode="exact", config=None, **overrides):
+    queries = {}
+    for data in read_records(QUERY_FILE_PATH):
+        queries.setdefault(data['fingerprint'], {"input": data['input'], "query": data['query']})
+    store = load_vectors(QUERY_VECTOR_PATH)
+    params = {}
+    if mode == "hnsw":
+        params = {**hnsw_params(config or load_opensearch_config(), 'mappings-sql', 'input_v'), **overrides}
+    documents = [queries[fp] for fp in store.ids]
+    return LocalRetriever(store.ids, store.vectors, documents, mode, **params)
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the generated artifacts without OpenSearch.")
+    parser.add_argument("text", help="natural language request")
+    parser.add_argument("--index", choices=["schema", "queries"], default="schema")
+    parser.add_argument("--mode", choices=["exact", "hnsw"], default="exact")
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    from table_summarizer import init_model
+    _, emb_model = init_model()
+
+    load = load_schema_retriever if args.index == "schema" else load_query_retriever
+    retriever = load(args.mode)
+    for hit in retriever.search(emb_model.embed_query(args.text), args.k):
+        source = hit["_source"]
+        print(f"{hit['_score']:.4f}  {source.get('table_name') or source.get('query')}")
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,16 @@
+import argparse
 import json
 import os
 from langchain_aws import ChatBedrock
 from langchain_core.prompts.chat import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-
-_SYS_PROMPT_TEMPLATE_1 = """
-You are a helpful assistant tasked with writing table creation (DDL) statements to create the tables for the provided schema. 
-Skip the preambles and only provide the output in the desired format.
-Finish a statement with ";\n".
-"""
+from llm_executor import invoke_all
+from llm_cache import enable_llm_cache
+from catalog import load_catalog
+from json_stream import read_records, resume_records, write_record
+from sharding import parse_shard, select_tables, shard_name, shard_path
+from validation import column_signature, table_signature, tables_to_regenerate, validate
+import metrics
 
 _SYS_PROMPT_TEMPLATE_2 = """
 You are a helpful assistant that reformats the given table info into JSON following the 'output_format'.
@@ -48,6 +50,39 @@ Column Names: {columns}
 DB Dialect: {dialect}
 """
 
+_BATCH_INSTRUCTIONS = """
+Several tables may be given, each in its own <table_info> block.
+Describe every one of them and return a single JSON object with one key per table, in the given order.
+"""
+
+_BATCH_USER_PROMPT_TEMPLATE = """
+{tables}
+
+DB Dialect: {dialect}
+"""
+
+_TABLE_INFO_TEMPLATE = """<table_info>
+Table Name: {table}
+Column Names: {columns}
+</table_info>"""
+
+MODEL_ID = "anthropic.claude-3-sonnet-20240229-v1:0"
+REGION_NAME = "us-east-1"
+
+TABLE_FILE_PATH = "spider_tables.json"
+# one {table: description} record per line
+OUTPUT_FILE_PATH = "./metadata/spider_schemas.json"
+
+# Upper bound on concurrent Bedrock requests; lowered automatically while throttled
+MAX_IN_FLIGHT = 8
+
+# Tables of the same db_id are described together until their estimated response size
+# reaches this many tokens (Claude 3 responses are capped at 4096); 0 sends one table per request
+BATCH_TOKEN_BUDGET = 3000
+# rough response size of one table description and of each of its columns
+TABLE_TOKENS = 50
+COLUMN_TOKENS = 40
+
 model_kwargs =  { 
     "max_tokens": 200000,
     "temperature": 0.0,
@@ -55,37 +90,209 @@ model_kwargs =  {
     "top_p": 1
 }
 
-with open('spider_tables.json', 'r', encoding='utf-8') as file:
-    table_info = json.load(file)
+def init_chain():
+    # User Prompt Template
+    usr_prompt = ChatPromptTemplate.from_template(_USER_PROMPT_TEMPLATE)
+    model = ChatBedrock(model_id=MODEL_ID, region_name=REGION_NAME, model_kwargs={**model_kwargs, "system": _SYS_PROMPT_TEMPLATE_2},
+                        callbacks=[metrics.TokenUsageHandler()])
+    return usr_prompt | model | StrOutputParser()
+
+def init_batch_chain():
+    usr_prompt = ChatPromptTemplate.from_template(_BATCH_USER_PROMPT_TEMPLATE)
+    model = ChatBedrock(model_id=MODEL_ID, region_name=REGION_NAME, model_kwargs={**model_kwargs, "system": _SYS_PROMPT_TEMPLATE_2 + _BATCH_INSTRUCTIONS},
+                        callbacks=[metrics.TokenUsageHandler()])
+    return usr_prompt | model | StrOutputParser()
+
+def build_inputs(tables):
+    inputs_list = []
+    for table in tables:
+        all_columns = "".join(column.name + ", " for column in table.columns)
+        inputs_list.append({"table": table.name.lower(), "columns": all_columns.lower(), "dialect": "SQLite"})
+    return inputs_list
+
+def build_batches(tables, inputs_list, token_budget=BATCH_TOKEN_BUDGET):
+    """
+    Groups consecutive tables of the same db_id into batches whose estimated response
+    stays within `token_budget`. Returns lists of indexes into `inputs_list`.
+    """
+    batches = []
+    current = []
+    current_db = None
+    current_tokens = 0
+    for index, table in enumerate(tables):
+        tokens = TABLE_TOKENS + COLUMN_TOKENS * len(table.columns)
+        db_id = table.db_id
+        if current and (db_id != current_db or current_tokens + tokens > token_budget):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(index)
+        current_db = db_id
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+def build_batch_inputs(inputs_list, batch):
+    tables = "\n".join(_TABLE_INFO_TEMPLATE.format(**inputs_list[index]) for index in batch)
+    return {"tables": tables, "dialect": inputs_list[batch[0]]["dialect"]}
+
+def parse_response(response):
+    """Returns the JSON object in a model response keyed by lower-cased table name, or {} if there is none."""
+    start = response.find('{')
+    if start < 0:
+        return {}
+    try:
+        data, _ = json.JSONDecoder().raw_decode(response, start)
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    return {table_name.lower(): table_data for table_name, table_data in data.items()}
+
+def columns_match(table_data, inputs):
+    # same check as validation.py: the column sets must be identical, in any order
+    return table_signature(table_data) == column_signature(col for col in inputs["columns"].split(", ") if col)
+
+def to_record(inputs, response):
+    """Validated {table: description} record of a single-table response, or None if it can't be parsed."""
+    table_data = parse_response(response).get(inputs["table"])
+    if table_data is None:
+        print(f"Could not parse the description of '{inputs['table']}'")
+        return None
+    if not columns_match(table_data, inputs):
+        print(f"Column list of '{inputs['table']}' does not match the input")
+    return {inputs["table"]: table_data}
+
+def describe_individually(inputs_list, max_in_flight=MAX_IN_FLIGHT, chain=None):
+    if chain is None:
+        chain = init_chain()
+    for inputs, response in zip(inputs_list, invoke_all(chain, inputs_list, max_in_flight=max_in_flight)):
+        yield to_record(inputs, response)
+
+def describe_tables(tables, inputs_list, max_in_flight=MAX_IN_FLIGHT, token_budget=BATCH_TOKEN_BUDGET):
+    """
+    Yields one {table: description} record per table (None if the response can't be parsed), in
+    table order, as soon as the table's batch is done. Tables are sent in batches; tables missing
+    from a batch response or with a wrong column list are retried alone before the batch is yielded.
+    """
+    if not token_budget:
+        yield from describe_individually(inputs_list, max_in_flight)
+        return
+
+    batches = build_batches(tables, inputs_list, token_budget)
+    chain = init_batch_chain()
+    single_chain = init_chain()
+    retried = 0
+    for batch, response in zip(batches, invoke_all(chain, [build_batch_inputs(inputs_list, batch) for batch in batches], max_in_flight=max_in_flight)):
+        described = parse_response(response)
+        records = {}
+        failed = []
+        for index in batch:
+            inputs = inputs_list[index]
+            table_data = described.get(inputs["table"])
+            if table_data is not None and columns_match(table_data, inputs):
+                records[index] = {inputs["table"]: table_data}
+            else:
+                failed.append(index)
+
+        for index, record in zip(failed, describe_individually([inputs_list[index] for index in failed], max_in_flight, single_chain)):
+            records[index] = record
+        retried += len(failed)
+        metrics.increment("batched_requests")
+        metrics.increment("batch_validation_failures", len(failed))
+
+        # batches hold consecutive tables, so yielding batch by batch keeps the table order
+        for index in batch:
+            yield records[index]
+
+    print(f"Described {len(inputs_list) - retried}/{len(inputs_list)} tables in {len(batches)} batched requests, "
+          f"retried {retried} tables alone")
+
+def merge_records(file_path, table_names, records):
+    """
+    Streams the output into a new file, replacing the descriptions of the tables in `records`
+    ({table: record}) and dropping tables that are no longer in `table_names` or are described
+    twice. Tables that had no description yet are appended; without an output file, only they are written.
+    """
+    written = set()
+    with open(file_path + ".tmp", 'w', encoding='utf-8') as output_file:
+        for record in read_records(file_path) if os.path.exists(file_path) else ():
+            table_name = next(iter(record), "").lower()
+            if table_name not in table_names or table_name in written:
+                continue
+            write_record(output_file, records.pop(table_name, record))
+            written.add(table_name)
+        for record in records.values():
+            write_record(output_file, record)
+    os.replace(file_path + ".tmp", file_path)
+
+def main(max_in_flight=MAX_IN_FLIGHT, token_budget=BATCH_TOKEN_BUDGET, regenerate=None, shard=None):
+    # replay identical Bedrock calls from earlier (or crashed) runs
+    enable_llm_cache()
+
+    # a shard describes the tables of its databases into its own output file
+    output_file_path = shard_path(OUTPUT_FILE_PATH, shard)
+    with metrics.stage("load_tables") as stage:
+        catalog = select_tables(load_catalog(TABLE_FILE_PATH), shard)
+        stage.add(len(catalog))
+
+    if not os.path.exists('metadata'):
+        os.makedirs('metadata')
 
-if not os.path.exists('metadata'):
-    os.makedirs('metadata')
+    table_names = {table_name.lower() for table_name in catalog.table_names()}
 
-# User Prompt Template
-usr_prompt = ChatPromptTemplate.from_template(_USER_PROMPT_TEMPLATE)
+    if regenerate is not None:
+        tables = [table for table in catalog if table.name.lower() in regenerate]
+        unknown = regenerate - table_names
+        if unknown and shard is None:
+            print(f"Skipping tables that are not in {TABLE_FILE_PATH}: {', '.join(sorted(unknown))}")
+        print(f"Regenerating {len(tables)} tables")
+        records = {}
+        with metrics.stage("describe_tables") as stage:
+            for record in describe_tables(tables, build_inputs(tables), max_in_flight, token_budget):
+                if record is not None:
+                    records[next(iter(record))] = record
+                    stage.add()
+        with metrics.stage("write_output"):
+            merge_records(output_file_path, table_names, records)
+        return
 
-model_kwargs["system"] = _SYS_PROMPT_TEMPLATE_1
-model1 = ChatBedrock(model_id="anthropic.claude-3-sonnet-20240229-v1:0", region_name='us-east-1', model_kwargs=model_kwargs)
-chain1 = usr_prompt | model1 | StrOutputParser()
+    # keep the tables an earlier (possibly crashed) run already described; delete the output to start over
+    described = set()
 
-model_kwargs["system"] = _SYS_PROMPT_TEMPLATE_2
-model = ChatBedrock(model_id="anthropic.claude-3-sonnet-20240229-v1:0", region_name='us-east-1', model_kwargs=model_kwargs)
-chain2 = usr_prompt | model | StrOutputParser()
+    def keep(record):
+        table_name = next(iter(record), None)
+        if len(record) != 1 or table_name not in table_names or table_name in described:
+            return False
+        described.add(table_name)
+        return True
 
-for table_name, columns in table_info.items():
-    all_columns = ""
-    for col in columns['cols']:
-        all_columns += col['col'] + ", "
-    response2 = chain2.invoke({"table":table_name.lower(), "columns":all_columns.lower(), "dialect": "SQLite"})    
-    with open('./metadata/spider_schemas.json', 'a') as output_file:
-        output_file.write(response2)
+    output_file, kept = resume_records(output_file_path, keep)
+    if kept:
+        print(f"Resuming: {kept}/{len(catalog)} tables are already described")
+    tables = [table for table in catalog if table.name.lower() not in described]
+    inputs_list = build_inputs(tables)
 
-file_path = './metadata/spider_schemas.json'
-with open(file_path, 'r') as file:
-    content = file.read()
+    # Records arrive in table order, so the output is identical to a sequential run
+    with metrics.stage("describe_tables") as stage, output_file:
+        for record in describe_tables(tables, inputs_list, max_in_flight, token_budget):
+            if record is not None:
+                write_record(output_file, record)
+                stage.add()
 
-content = content.replace('}{', '},{')
-content = '[' + content + ']'
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Describe the tables of TABLE_FILE_PATH.")
+    parser.add_argument("--fix", action="store_true",
+                        help="only regenerate the tables validation.py reports as missing, mismatched or duplicated")
+    parser.add_argument("--tables", nargs="+", help="only regenerate these tables")
+    parser.add_argument("--shard", type=parse_shard, help="i/N: only the databases of shard i of N (merge with merge_shards.py)")
+    args = parser.parse_args()
 
-with open(file_path, 'w') as file:
-    file.write(content)
\ No newline at end of file
+    regenerate = None
+    output_file_path = shard_path(OUTPUT_FILE_PATH, args.shard)
+    if args.tables:
+        regenerate = {table_name.lower() for table_name in args.tables}
+    elif args.fix and os.path.exists(output_file_path):
+        # tables of other shards are reported missing, but only the shard's own tables are regenerated
+        regenerate = tables_to_regenerate(validate(TABLE_FILE_PATH, output_file_path))
+    metrics.run(shard_name("schema_loader", args.shard), lambda: main(regenerate=regenerate, shard=args.shard))
@@ -0,0 +1,72 @@
+import argparse
+import hashlib
+import os
+from catalog import Catalog
+from sql_parser import referenced_tables
+
+class Shard:
+    """
+    Shard `index` of `count`. Databases are assigned to shards by a hash of their db_id, so every
+    process and machine agrees on the assignment without coordination.
+    """
+    __slots__ = ("index", "count")
+
+    def __init__(self, index, count):
+        if count < 1 or not 0 <= index < count:
+            raise ValueError(f"Invalid shard {index}/{count}")
+        self.index = index
+        self.count = count
+
+    def __str__(self):
+        return f"{self.index}/{self.count}"
+
+    def owns(self, db_id):
+        return shard_of(db_id, self.count) == self.index
+
+    def name(self, base):
+        return f"{base}.shard-{self.index}-of-{self.count}"
+
+    def path(self, file_path):
+        """`file_path` with the shard inserted before the extension: spider_schemas.shard-0-of-4.json."""
+        root, ext = os.path.splitext(file_path)
+        return self.name(root) + ext
+
+def parse_shard(spec):
+    """argparse type for "i/N"."""
+    try:
+        index, count = (int(part) for part in spec.split("/"))
+        return Shard(index, count)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/N with 0 <= i < N, got {spec!r}")
+
+def shard_of(db_id, count):
+    # not hash(): string hashes differ between processes
+    return int.from_bytes(hashlib.sha256(db_id.encode('utf-8')).digest()[:8], "big") % count
+
+def shard_path(file_path, shard=None):
+    return file_path if shard is None else shard.path(file_path)
+
+def shard_name(base, shard=None):
+    return base if shard is None else shard.name(base)
+
+def all_shards(count):
+    return [Shard(index, count) for index in range(count)]
+
+def select_tables(catalog, shard=None):
+    """The tables of `catalog` (a table file with db_ids) whose database belongs to `shard`."""
+    if shard is None:
+        return catalog
+    return Catalog(table for table in catalog if shard.owns(table.db_id))
+
+def statement_shard(sql, databases, count):
+    """
+    Shard index of a SQL statement: the shard of the database of the tables it references
+    (the smallest db_id if they span several), or 0 if it references no known table.
+    `databases` maps lower-cased table names to db_ids.
+    """
+    # referenced_tables returns the lookup's values, here the db_ids
+    db_ids = set(referenced_tables(sql, databases))
+    return shard_of(min(db_ids), count) if db_ids else 0
+
+def table_databases(catalog):
+    return {table.name.lower(): table.db_id for table in catalog}
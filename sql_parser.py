@@ -0,0 +1,388 @@
+import re
+
+TOKEN_PATTERN = re.compile(r"""
+    (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<string>'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*")
+  | (?P<quoted>`[^`]*`|\[[^\]]*\])
+  | (?P<number>\d+(?:\.\d+)?)
+  | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+  | (?P<punct><=|>=|<>|!=|\|\||[().,;*=<>+\-/%])
+  | (?P<space>\s+)
+""", re.VERBOSE | re.DOTALL)
+
+KEYWORDS = {
+    "select", "from", "where", "join", "inner", "left", "right", "full", "outer", "cross", "natural",
+    "on", "using", "as", "and", "or", "not", "in", "is", "null", "like", "between", "exists", "any",
+    "some", "all", "distinct", "group", "by", "order", "having", "limit", "offset", "asc", "desc",
+    "union", "intersect", "except", "minus", "case", "when", "then", "else", "end", "true", "false",
+    "with", "interval", "escape", "collate", "glob", "regexp",
+}
+
+IDENTIFIER_PATTERN = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+STRING_LITERAL_PATTERN = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"")
+
+SET_OPERATORS = {"union", "intersect", "except", "minus"}
+CLAUSE_KEYWORDS = {"where", "group", "order", "having", "limit", "on", "using", "union", "intersect", "except", "minus"}
+
+class Scope:
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.aliases = {}   # alias -> table name, or None for a derived table
+        self.tables = []
+
+    def chain(self):
+        scope = self
+        while scope is not None:
+            yield scope
+            scope = scope.parent
+
+def tokenize(sql):
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(sql):
+        kind = match.lastgroup
+        if kind in ("comment", "space"):
+            continue
+        value = match.group()
+        if kind == "quoted":
+            kind, value = "word", value[1:-1]
+        tokens.append((kind, value))
+    return tokens
+
+class _Parser:
+    def __init__(self, tokens, catalog):
+        self.tokens = tokens
+        self.catalog = catalog
+        self.consumed = set()
+        self.scope_of = [None] * len(tokens)
+        self.column_aliases = set()
+        self.tables = []
+
+    def word(self, i):
+        if i < len(self.tokens) and self.tokens[i][0] == "word":
+            return self.tokens[i][1]
+        return None
+
+    def value(self, i):
+        return self.tokens[i][1].lower() if i < len(self.tokens) else None
+
+    def read_name(self, i):
+        # schema.table -> table
+        parts = [self.word(i)]
+        while self.value(i + 1) == "." and self.word(i + 2):
+            i += 2
+            parts.append(self.word(i))
+        return parts[-1], i
+
+    def read_table_ref(self, i, scope, from_parens):
+        """Reads `table [AS] alias` or `(subquery) [AS] alias` starting at i; returns the next index."""
+        if self.value(i) == "(":
+            from_parens.add(i)
+            return i
+        if self.word(i) is None or self.value(i) in KEYWORDS:
+            return i
+        start = i
+        name, i = self.read_name(i)
+        self.consumed.update(range(start, i + 1))
+        table = name.lower()
+        if table not in self.catalog:
+            raise ValueError(f"unknown table {name}")
+        scope.tables.append(table)
+        scope.aliases[table] = table
+        if table not in self.tables:
+            self.tables.append(table)
+        return self.read_alias(i + 1, scope, table)
+
+    def read_alias(self, i, scope, table):
+        if self.value(i) == "as":
+            self.consumed.add(i)
+            i += 1
+        alias = self.word(i)
+        if alias is not None and alias.lower() not in KEYWORDS:
+            self.consumed.add(i)
+            scope.aliases[alias.lower()] = table
+            i += 1
+        return i
+
+    def build_scopes(self):
+        root = Scope()
+        scope = root
+        parens = []         # (opened a scope, was a FROM subquery)
+        from_parens = set()
+        in_from = False
+        i = 0
+        while i < len(self.tokens):
+            kind, value = self.tokens[i]
+            lower = value.lower()
+            self.scope_of[i] = scope
+
+            if value == "(":
+                opens = self.value(i + 1) in ("select", "with")
+                parens.append((opens, i in from_parens))
+                if opens:
+                    scope = Scope(scope)
+                in_from = False
+            elif value == ")":
+                opens, derived = parens.pop() if parens else (False, False)
+                if opens:
+                    scope = scope.parent
+                self.scope_of[i] = scope
+                if derived:
+                    i = self.read_alias(i + 1, scope, None)
+                    in_from = True
+                    continue
+            elif kind == "word" and lower in SET_OPERATORS:
+                scope = Scope(scope.parent)
+                in_from = False
+            elif kind == "word" and lower in ("from", "join"):
+                in_from = True
+                i = self.read_table_ref(i + 1, scope, from_parens)
+                continue
+            elif value == "," and in_from:
+                i = self.read_table_ref(i + 1, scope, from_parens)
+                continue
+            elif kind == "word" and lower in CLAUSE_KEYWORDS:
+                in_from = False
+            elif kind == "word" and lower == "as" and self.word(i + 1):
+                # column alias, e.g. SELECT count(*) AS cnt ... ORDER BY cnt
+                self.consumed.update((i, i + 1))
+                self.column_aliases.add(self.value(i + 1))
+                i += 2
+                continue
+            i += 1
+
+    def resolve(self):
+        columns = []
+
+        def add(column):
+            if column not in columns:
+                columns.append(column)
+
+        i = 0
+        while i < len(self.tokens):
+            kind, value = self.tokens[i]
+            if i in self.consumed or kind != "word":
+                i += 1
+                continue
+
+            if self.value(i + 1) == "." and self.value(i + 2) == "*":
+                i += 3
+                continue
+
+            name, end = self.read_name(i)
+            scope = self.scope_of[i]
+            if end > i:
+                qualifier = self.word(end - 2).lower()
+                table = next((s.aliases[qualifier] for s in scope.chain() if qualifier in s.aliases), qualifier)
+                if table in self.catalog:
+                    column = self.catalog[table].get(name.lower())
+                    if column is None:
+                        raise ValueError(f"unknown column {qualifier}.{name}")
+                    add(column)
+                else:
+                    # column of a derived table; resolve it against the base tables if possible
+                    column = self.lookup(name, self.tables)
+                    if column is not None:
+                        add(column)
+                i = end + 1
+                continue
+
+            lower = value.lower()
+            if lower in KEYWORDS or self.value(i + 1) == "(":
+                i += 1
+                continue
+
+            visible = [table for s in scope.chain() for table in s.tables]
+            column = self.lookup(value, visible) or self.lookup(value, self.tables)
+            if column is not None:
+                add(column)
+            elif lower not in self.column_aliases:
+                raise ValueError(f"unresolved identifier {value}")
+            i += 1
+
+        return columns
+
+    def lookup(self, name, tables):
+        for table in tables:
+            column = self.catalog[table].get(name.lower())
+            if column is not None:
+                return column
+        return None
+
+def extract_tables_and_columns(sql, catalog):
+    """
+    Extracts the tables and columns referenced by `sql`, resolving aliases (T1, T2, ...)
+    and subqueries against `catalog`, a mapping of lowercased table name to a mapping of
+    lowercased column name -> column name.
+
+    Returns {"table": [...], "column": [...]} in the same shape the LLM extraction produced,
+    or None when the statement references something outside the catalog or cannot be parsed.
+    """
+    parser = _Parser(tokenize(sql), catalog)
+    try:
+        parser.build_scopes()
+        columns = parser.resolve()
+    except (ValueError, IndexError):
+        return None
+    if not parser.tables:
+        return None
+    return {"table": parser.tables, "column": columns}
+
+def referenced_tables(sql, table_lookup):
+    """Tables of `table_lookup` ({lower-cased name: name}) named in `sql` as a whole identifier outside string literals."""
+    sql = STRING_LITERAL_PATTERN.sub("''", sql)
+    referenced = {token.lower() for token in IDENTIFIER_PATTERN.findall(sql)}
+    return [table_lookup[table_name_lower] for table_name_lower in referenced & table_lookup.keys()]
+
+def find_aliases(tokens):
+    """Lower-cased table and column aliases of a token list, in order of appearance."""
+    aliases = []
+    in_from = False
+    # for each open parenthesis, whether it belongs to a function call: AS in CAST(x AS type) names a type
+    calls = []
+    for i, (kind, value) in enumerate(tokens):
+        lower = value.lower()
+        if value == "(":
+            calls.append(i > 0 and tokens[i - 1][0] == "word" and tokens[i - 1][1].lower() not in KEYWORDS)
+            continue
+        if value == ")":
+            if calls:
+                calls.pop()
+            continue
+        if kind == "word" and lower == "as":
+            if not (calls and calls[-1]) and i + 1 < len(tokens) and tokens[i + 1][0] == "word":
+                aliases.append(tokens[i + 1][1].lower())
+            continue
+        if kind == "word" and lower in ("from", "join"):
+            in_from = True
+        elif kind == "word" and (lower in CLAUSE_KEYWORDS or lower == "select"):
+            in_from = False
+            continue
+        elif value != "," or not in_from:
+            continue
+
+        # `FROM table alias` without AS
+        j = i + 1
+        if j >= len(tokens) or tokens[j][0] != "word" or tokens[j][1].lower() in KEYWORDS:
+            continue
+        while j + 2 < len(tokens) and tokens[j + 1][1] == "." and tokens[j + 2][0] == "word":
+            j += 2
+        if j + 1 < len(tokens) and tokens[j + 1][0] == "word" and tokens[j + 1][1].lower() not in KEYWORDS:
+            aliases.append(tokens[j + 1][1].lower())
+    return aliases
+
+def normalize_tokens(sql):
+    """
+    Tokens of `sql` with string and number literals replaced by ("literal", "?"), literal lists of
+    IN (...) collapsed to one, aliases renamed to ("alias", "a1"), ("alias", "a2"), ... in order of
+    appearance (without the optional AS), and words lower-cased.
+    """
+    tokens = tokenize(sql)
+    aliases = {}
+    for alias in find_aliases(tokens):
+        aliases.setdefault(alias, f"a{len(aliases) + 1}")
+
+    normalized = []
+    depth = 0
+    in_lists = set()    # parenthesis depths opened by IN (
+    for i, (kind, value) in enumerate(tokens):
+        if kind == "word" and value.lower() == "as" and i + 1 < len(tokens) and tokens[i + 1][1].lower() in aliases:
+            # `people AS T1` and `people p` have the same shape
+            continue
+        if kind in ("string", "number"):
+            # IN (1, 2, 3) and IN (4) have the same shape, but SELECT a, 1, 2 and LIMIT 10, 20 keep every literal
+            if depth in in_lists and normalized[-1][1] == "," and normalized[-2][0] == "literal":
+                normalized.pop()
+                continue
+            normalized.append(("literal", "?"))
+        elif kind == "word":
+            lower = value.lower()
+            normalized.append(("alias", aliases[lower]) if lower in aliases else ("word", lower))
+        else:
+            if value == "(":
+                depth += 1
+                if normalized and normalized[-1] == ("word", "in"):
+                    in_lists.add(depth)
+            elif value == ")":
+                in_lists.discard(depth)
+                depth -= 1
+            normalized.append((kind, value))
+    return normalized
+
+def normalize_sql(sql):
+    """Canonical text of `sql`: statements that only differ in literals, aliases, case or whitespace are equal."""
+    return " ".join(value for _, value in normalize_tokens(sql))
+
+CHUNK_SIZE = 64 * 1024
+NORMAL_PATTERN = re.compile(r"[;'\"`]|--|/\*")
+COMMENT_END = {"--": "\n", "/*": "*/"}
+
+def iter_sql_statements(file, chunk_size=CHUNK_SIZE, backslash_escapes=True):
+    """
+    Reads SQL text from `file` in chunks and yields complete statements (without the trailing `;`).
+    Semicolons inside quoted strings, backtick identifiers and `--` / `/* */` comments do not end a
+    statement, and empty statements (`;;`) are skipped. Only the current statement is held in memory.
+    """
+    pieces = []
+    has_code = False
+    state = None
+    buffer = ""
+    eof = False
+
+    while not eof:
+        chunk = file.read(chunk_size)
+        eof = not chunk
+        buffer += chunk
+        # keep one character of lookahead so that `--`, `/*`, `*/`, `''` and `\'` are never split
+        limit = len(buffer) if eof else len(buffer) - 1
+        start = pos = 0
+
+        while pos < limit:
+            if state is None:
+                match = NORMAL_PATTERN.search(buffer, pos, limit + 1 if eof else len(buffer))
+                if match is None or match.start() >= limit:
+                    has_code = has_code or bool(buffer[pos:limit].strip())
+                    pos = limit
+                    break
+                has_code = has_code or bool(buffer[pos:match.start()].strip())
+                token = match.group()
+                pos = match.end()
+                if token == ";":
+                    pieces.append(buffer[start:match.start()])
+                    if has_code:
+                        yield "".join(pieces).strip()
+                    pieces, has_code, start = [], False, pos
+                elif token in COMMENT_END:
+                    state = token
+                else:
+                    state = token
+                    has_code = True
+            elif state in COMMENT_END:
+                end = buffer.find(COMMENT_END[state], pos)
+                if end < 0 or end >= limit:
+                    pos = limit
+                    break
+                pos = end + len(COMMENT_END[state])
+                state = None
+            else:
+                quote = state
+                index = pos
+                while index < limit:
+                    char = buffer[index]
+                    if char == "\\" and backslash_escapes and quote != "`":
+                        index += 2
+                    elif char == quote:
+                        if index + 1 < len(buffer) and buffer[index + 1] == quote:
+                            index += 2
+                        else:
+                            state = None
+                            index += 1
+                            break
+                    else:
+                        index += 1
+                pos = index
+
+        pieces.append(buffer[start:pos])
+        buffer = buffer[pos:]
+
+    if has_code:
+        yield "".join(pieces).strip()
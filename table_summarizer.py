@@ -1,11 +1,21 @@
+import argparse
+import itertools
 import os
 import json
-import yaml
 from langchain_aws import ChatBedrock
-from opensearchpy import OpenSearch, RequestsHttpConnection
 from langchain_community.embeddings import BedrockEmbeddings
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts.chat import ChatPromptTemplate
+from llm_cache import enable_llm_cache
+import metrics
+from catalog import Catalog, load_catalog
+from embedder import embed_texts
+from llm_executor import AdaptiveLimiter, invoke_with_backoff
+from json_stream import read_records, resume_records, write_record
+from sharding import parse_shard, shard_name, shard_path
+from sql_parser import KEYWORDS, normalize_tokens, referenced_tables
+from vector_store import load_vectors, save_vectors
+from opensearch_utils import bulk_load, create_os_client, fingerprint, load_opensearch_config, prepare_index, to_bulk_entry, to_delete_entry
 
 
 REGION_NAME = "us-east-1"
@@ -16,6 +26,15 @@ SAMPLE_QUERY_FILE_PATH = "./metadata/spider_example_queries_temp.json"
 
 OUTPUT_FILE_PATH1 = "./metadata/spider_detailed_schema_temp.json"
 OUTPUT_FILE_PATH2 = "./metadata/spider_detailed_schema.json"
+# table_summary_v of every table in OUTPUT_FILE_PATH2 (see vector_store)
+OUTPUT_VECTOR_PATH = "./metadata/spider_detailed_schema_vectors"
+
+# Delete and recreate the index instead of updating only the changed documents
+REBUILD_INDEX = False
+
+# Estimated tokens of sample queries put into one summarize_table prompt
+SAMPLE_QUERY_TOKEN_BUDGET = 2000
+CHARS_PER_TOKEN = 4
 
 SYS_PROMPT = """
 You are a data analyst that can help summarize SQL tables.
@@ -42,18 +61,11 @@ PROMPT_TEMPLATE = """
 """
 
 def load_schema(file_path):
-    with open(file_path, 'r', encoding='utf-8') as file:
-        schema = json.load(file)
-    return schema
+    return load_catalog(file_path)
 
 def load_queries(file_path):
-    with open(file_path, 'r', encoding='utf-8') as file:
-        queries = file.readlines()
-    return queries
-
-def load_opensearch_config():
-    with open("./metadata/opensearch.yml", 'r', encoding='utf-8') as file:
-        return yaml.safe_load(file)
+    """Lazily reads the translated queries ({"input", "query", ...} records)."""
+    return read_records(file_path)
 
 def init_model():
     model_kwargs =  { 
@@ -67,141 +79,229 @@ def init_model():
     chat_model = ChatBedrock(
         model_id="anthropic.claude-3-sonnet-20240229-v1:0",
         region_name=REGION_NAME,
-        model_kwargs=model_kwargs
+        model_kwargs=model_kwargs,
+        callbacks=[metrics.TokenUsageHandler()]
     )
 
     emb_model = BedrockEmbeddings(model_id="amazon.titan-embed-text-v2:0", region_name=REGION_NAME, model_kwargs={"dimensions":1024}) 
     return chat_model, emb_model
 
-def create_os_index(os_client, mapping):
-    exists = os_client.indices.exists(INDEX_NAME)
-
-    if exists:
-        os_client.indices.delete(index=INDEX_NAME)
-        print("Existing index has been deleted. Create new one.")
-    else:
-        print("Index does not exist, Create one.")
-
-    os_client.indices.create(INDEX_NAME, body=mapping)
-
-def init_opensearch(config):
+def init_opensearch(config, rebuild=REBUILD_INDEX):
+    """Returns the client and {_id: fingerprint} of the documents already in the index."""
     mapping = {"settings": config['settings'], "mappings": config['mappings-detailed-schema']}
-    endpoint = config['opensearch-auth']['domain_endpoint']
-    http_auth = (config['opensearch-auth']['user_id'], config['opensearch-auth']['user_password'])
-
-    os_client = OpenSearch(
-            hosts=[{'host': endpoint.replace("https://", ""),'port': 443}],
-            http_auth=http_auth, 
-            use_ssl=True,
-            verify_certs=True,
-            timeout=300,
-            connection_class=RequestsHttpConnection
-    )
-
-    create_os_index(os_client, mapping)
-
-    return os_client
-
-def search_table_queries(queries, table_name):
-    table_name_lower = table_name.lower()
-    matched_queries = []
-
-    for line in queries:
-        try:
-            query_data = json.loads(line)
-            if table_name_lower in query_data['query'].lower():
-                matched_queries.append(query_data)
-        except json.JSONDecodeError:
-            print(f"Invalid JSON line: {line}")
-    
-    return matched_queries
-
-def summarize_table(table_name, table_data, queries, chain):
-    table_summary = chain.invoke({"table_schema": table_data, "sample_queries": queries})
+    os_client = create_os_client(config)
+    return os_client, prepare_index(os_client, INDEX_NAME, mapping, rebuild)
+
+def build_table_query_index(queries, table_names):
+    """
+    Reads the sample query records once and maps each table name to the queries that reference it.
+    Only whole identifiers outside string literals count, so `people` does not match `people_id`.
+    """
+    table_lookup = {table_name.lower(): table_name for table_name in table_names}
+    index = {table_name: [] for table_name in table_names}
+
+    for query_data in queries:
+        for table_name in referenced_tables(query_data['query'], table_lookup):
+            index[table_name].append({"input": query_data["input"], "query": query_data["query"]})
+
+    return index
+
+def select_sample_queries(queries, token_budget=SAMPLE_QUERY_TOKEN_BUDGET):
+    """
+    Drops queries whose SQL only differs in literals, aliases or formatting, then picks queries
+    round-robin over their column pattern (the set of tables and columns they use) until
+    `token_budget` is reached, so that every pattern is represented before any gets a second query.
+    The selection keeps the original order.
+    """
+    patterns = {}
+    seen = set()
+    for position, query in enumerate(queries):
+        tokens = normalize_tokens(query["query"])
+        template = " ".join(value for _, value in tokens)
+        if template in seen:
+            continue
+        seen.add(template)
+        pattern = frozenset(value for kind, value in tokens if kind == "word" and value not in KEYWORDS)
+        patterns.setdefault(pattern, []).append((position, query))
+
+    selected = []
+    used = 0
+    for candidates in itertools.zip_longest(*patterns.values()):
+        for candidate in candidates:
+            if candidate is None:
+                continue
+            tokens = len(json.dumps(candidate[1], ensure_ascii=False)) // CHARS_PER_TOKEN + 1
+            if used + tokens <= token_budget:
+                selected.append(candidate)
+                used += tokens
+    return [query for _, query in sorted(selected, key=lambda candidate: candidate[0])]
+
+def summarize_table(table_name, table_data, queries, chain, limiter=None):
+    table_summary = invoke_with_backoff(chain, {"table_schema": table_data, "sample_queries": queries}, limiter or AdaptiveLimiter(1),
+                                        call="llm_summarize")
     table_data['table_summary'] = table_summary 
     summary_output = {table_name: table_data}
     return summary_output
 
-def embedding_summary(emb_model):
-    with open(OUTPUT_FILE_PATH1, 'r', encoding='utf-8') as input_file:
-        data_list = json.load(input_file)
-
-    for data in data_list:
-        table_name = list(data.keys())[0]
-        table_summary = data[table_name]["table_summary"]
-        data[table_name]["table_summary_v"] = emb_model.embed_query(table_summary)
-    
-    with open(OUTPUT_FILE_PATH2, 'w', encoding='utf-8') as output_file:
-        json.dump(data_list, output_file, ensure_ascii=False, indent=4)
-
-def load_detailed_schema_descriptions(os_client):
-
-    with open(OUTPUT_FILE_PATH2, 'r') as file:
-        schema_data = json.load(file)
-
-    bulk_data = []
-    for table in schema_data:
-        for table_name, table_info in table.items():
-            table_doc = {
-                "table_name": table_name,
-                "table_desc": table_info["table_desc"],
-                "columns": [{"col_name": col["col"], "col_desc": col["col_desc"]} for col in table_info["cols"]],
-                "table_summary": table_info["table_summary"],
-                "table_summary_v": table_info["table_summary_v"]
-            }
-            bulk_data.append({"index": {"_index": INDEX_NAME, "_id": table_name}})
-            bulk_data.append(table_doc)
-    
-    bulk_data_str = '\n'.join(json.dumps(item) for item in bulk_data) + '\n'
-
-    response = os_client.bulk(body=bulk_data_str)
-    if response["errors"]:
-        print("There were errors during bulk indexing:")
-        for item in response["items"]:
-            if 'index' in item and item['index']['status'] >= 400:
-                print(f"Error: {item['index']['error']['reason']}")
+def summary_record(table, queries, table_fingerprint, chain, previous, limiter=None):
+    """
+    Returns ({table: data with table_summary and fingerprint}, whether the summary was reused).
+    The summary of the previous run is reused when the table's fingerprint is unchanged.
+    """
+    table_data = table.to_dict()
+    prev = previous.get(table.name)
+    reused = bool(prev and prev.fingerprint == table_fingerprint)
+    if reused:
+        table_data['table_summary'] = prev.summary
+        record = {table.name: table_data}
     else:
-        print("Bulk-inserted all items successfully.")
-
-def main():
-    schema = load_schema(SCHEMA_FILE_PATH)
-    queries = load_queries(SAMPLE_QUERY_FILE_PATH)
+        record = summarize_table(table.name, table_data, queries, chain, limiter)
+    table_data['fingerprint'] = table_fingerprint
+    return record, reused
+
+def load_previous_summaries(file_path):
+    """Final output of the previous run keyed by table name, used to skip unchanged tables."""
+    if not os.path.exists(file_path):
+        return Catalog([])
+    # rewritten on every run, so a snapshot would never be reused
+    return load_catalog(file_path, snapshot_dir=None)
+
+def embedding_summary(emb_model, previous=None, temp_file_path=OUTPUT_FILE_PATH1, output_file_path=OUTPUT_FILE_PATH2,
+                      vector_path=OUTPUT_VECTOR_PATH):
+    previous = previous or Catalog([])
+    previous_vectors = load_vectors(vector_path)
+
+    # only tables whose fingerprint changed need a new vector
+    table_names = []
+    vectors = {}
+    changed = []
+    for data in read_records(temp_file_path):
+        table_name, table_data = next(iter(data.items()))
+        table_names.append(table_name)
+        prev = previous.get(table_name)
+        if prev and prev.fingerprint == table_data["fingerprint"] and previous_vectors and table_name in previous_vectors:
+            # copy the row: the file it is mapped from is replaced below
+            vectors[table_name] = previous_vectors.get(table_name).copy()
+        else:
+            changed.append((table_name, table_data["table_summary"]))
+
+    for (table_name, _), vector in zip(changed, embed_texts(emb_model, [summary for _, summary in changed])):
+        vectors[table_name] = vector
+    del previous_vectors
+
+    save_vectors(vector_path, table_names, [vectors[table_name] for table_name in table_names])
+    # the finished temp file becomes the final output
+    os.replace(temp_file_path, output_file_path)
+
+def to_bulk_doc(table, vector):
+    table_doc = {
+        "table_name": table.name,
+        "table_desc": table.desc,
+        "columns": [{"col_name": column.name, "col_desc": column.desc} for column in table.columns],
+        "table_summary": table.summary,
+        "fingerprint": table.fingerprint,
+        "table_summary_v": vector
+    }
+    return to_bulk_entry({"index": {"_index": INDEX_NAME, "_id": table.name}}, table_doc)
+
+def iter_bulk_entries(tables, vectors):
+    for table in tables:
+        yield to_bulk_doc(table, vectors.as_list(table.name))
+
+def load_detailed_schema_descriptions(os_client, indexed=None):
+    """Indexes new or changed tables and deletes tables that no longer exist."""
+    indexed = indexed or {}
+
+    catalog = load_catalog(OUTPUT_FILE_PATH2, snapshot_dir=None)
+    table_names = set(catalog.table_names())
+    changed = [table for table in catalog if indexed.get(table.name) != table.fingerprint]
+    print(f"{len(changed)}/{len(table_names)} tables are new or changed")
+    indexed_docs, _ = bulk_load(os_client, iter_bulk_entries(changed, load_vectors(OUTPUT_VECTOR_PATH)))
+
+    stale = indexed.keys() - table_names
+    if stale:
+        print(f"Deleting {len(stale)} tables that no longer exist")
+        bulk_load(os_client, (to_delete_entry(INDEX_NAME, table_name) for table_name in sorted(stale)))
+    return indexed_docs
+
+def summarize_schema(shard=None):
+    """Summarizes and embeds the tables of SCHEMA_FILE_PATH, or of the shard's own files with `shard`."""
+    temp_file_path = shard_path(OUTPUT_FILE_PATH1, shard)
+    output_file_path = shard_path(OUTPUT_FILE_PATH2, shard)
+
+    with metrics.stage("load_inputs") as stage:
+        catalog = load_schema(shard_path(SCHEMA_FILE_PATH, shard))
+        queries = load_queries(shard_path(SAMPLE_QUERY_FILE_PATH, shard))
+        stage.add(len(catalog))
     chat_model, emb_model = init_model()
-
-    # Initialize the output file as a JSON array
-    if os.path.exists(OUTPUT_FILE_PATH1):
-        os.remove(OUTPUT_FILE_PATH1)
-    
-    with open(OUTPUT_FILE_PATH1, 'w', encoding='utf-8') as output_file:
-        output_file.write('[\n')
-
-    for table_info in schema:
-        for table_name, table_data in table_info.items():
-            globals()[table_name] = table_data
-            matched_queries = search_table_queries(queries, table_name)
-            prompt = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
-            chain = prompt | chat_model | StrOutputParser()
-
-            table_summary = summarize_table(table_name, table_data, matched_queries, chain)
-            
-            with open(OUTPUT_FILE_PATH1, 'a', encoding='utf-8') as output_file:
-                output_file.write(json.dumps(table_summary, ensure_ascii=False, indent=4) + ',\n')
-
-    with open(OUTPUT_FILE_PATH1, 'rb+') as output_file:
-        output_file.seek(-2, os.SEEK_END) 
-        output_file.truncate() 
-        output_file.write(b'\n]')
-
-    if os.path.exists(OUTPUT_FILE_PATH2):
-        os.remove(OUTPUT_FILE_PATH2)
-
-    embedding_summary(emb_model)
+    previous = load_previous_summaries(output_file_path)
+
+    with metrics.stage("summarize_tables") as stage:
+        table_queries = {table_name: select_sample_queries(matched)
+                         for table_name, matched in build_table_query_index(queries, catalog.table_names()).items()}
+        fingerprints = {table.name: fingerprint(table.to_dict(), table_queries[table.name]) for table in catalog}
+
+        # tables summarized by a crashed run are kept if their fingerprint is still current
+        summarized = set()
+
+        def keep(record):
+            table_name, table_data = next(iter(record.items()), (None, None))
+            if len(record) != 1 or table_name in summarized or fingerprints.get(table_name) != table_data.get("fingerprint"):
+                return False
+            summarized.add(table_name)
+            return True
+
+        output_file, kept = resume_records(temp_file_path, keep)
+        if kept:
+            print(f"Resuming: {kept}/{len(fingerprints)} tables are already summarized")
+        reused = 0
+
+        chain = ChatPromptTemplate.from_template(PROMPT_TEMPLATE) | chat_model | StrOutputParser()
+        with output_file:
+            for table in catalog:
+                if table.name in summarized:
+                    continue
+                table_summary, was_reused = summary_record(table, table_queries[table.name], fingerprints[table.name], chain, previous)
+                reused += was_reused
+                stage.add()
+
+                write_record(output_file, table_summary)
+
+    print(f"Reused {reused} unchanged table summaries")
+    metrics.increment("reused_summaries", reused)
+
+    with metrics.stage("embed_summaries") as stage:
+        embedding_summary(emb_model, previous, temp_file_path, output_file_path, shard_path(OUTPUT_VECTOR_PATH, shard))
+        stage.add(len(catalog))
+
+def main(shard=None, index_only=False):
+    # replay identical Bedrock calls from earlier (or crashed) runs
+    enable_llm_cache()
+
+    # a shard only writes its own files; merge_shards.py combines them for --index-only
+    if shard is not None:
+        summarize_schema(shard)
+        return
 
     # initialize opensearch index (cluster should be pre-created)
-    config = load_opensearch_config()
-    os_client = init_opensearch(config)
+    os_client, indexed = init_opensearch(load_opensearch_config())
+
+    if not index_only:
+        summarize_schema()
 
-    load_detailed_schema_descriptions(os_client)
+    with metrics.stage("bulk_index") as stage:
+        stage.add(load_detailed_schema_descriptions(os_client, indexed))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Summarize the described tables with their sample queries and index them.")
+    parser.add_argument("--shard", type=parse_shard,
+                        help="i/N: only summarize the tables of shard i of N (merge with merge_shards.py)")
+    parser.add_argument("--index-only", action="store_true",
+                        help="index the existing summaries (e.g. merged from shards) without summarizing")
+    args = parser.parse_args()
+    if args.shard and args.index_only:
+        parser.error("--index-only indexes the merged summaries and does not take --shard")
+    if args.index_only and (not os.path.exists(OUTPUT_FILE_PATH2) or load_vectors(OUTPUT_VECTOR_PATH) is None):
+        parser.error(f"--index-only needs {OUTPUT_FILE_PATH2} and its vectors; run table_summarizer.py without "
+                     "--index-only first (or merge_shards.py after sharded runs)")
+    metrics.run(shard_name("table_summarizer", args.shard), lambda: main(args.shard, args.index_only))
\ No newline at end of file
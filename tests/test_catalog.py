@@ -0,0 +1,69 @@
+import json
+import os
+import pytest
+import catalog as catalog_module
+from catalog import load_catalog, parse_catalog, snapshot_path
+
+SPIDER_TABLES = {
+    "Singer": {"db_id": "concert", "cols": [{"col": "Singer_ID", "format": "int", "pk": True}, {"col": "Name", "format": "text"}],
+               "table_desc": None, "foreign_keys": []},
+    "concert": {"db_id": "concert", "cols": [{"col": "Singer_ID", "format": "int"}], "table_desc": None,
+                "foreign_keys": [{"col": "Singer_ID", "ref_table": "Singer", "ref_col": "Singer_ID"}]},
+    "pets": {"db_id": "pets_1", "cols": [{"col": "PetID", "format": "int"}], "table_desc": None, "foreign_keys": []},
+}
+
+DESCRIPTIONS = [
+    {"singer": {"table_desc": "Singers.", "cols": [{"col": "singer_id", "col_desc": "Id."}], "table_summary": "S", "fingerprint": "f1"}},
+    {"pets": {"table_desc": "Pets.", "cols": [{"col": "petid", "col_desc": "Id."}]}},
+]
+
+def write(path, text):
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(text)
+    return str(path)
+
+def test_spider_tables_round_trip(tmp_path):
+    catalog = parse_catalog(write(tmp_path / "tables.json", json.dumps(SPIDER_TABLES, indent=2)))
+    assert catalog.table_names() == ["Singer", "concert", "pets"]
+    assert {table.name: table.to_dict() for table in catalog} == SPIDER_TABLES
+    assert [table.name for table in catalog.database("concert")] == ["Singer", "concert"]
+    assert catalog.database("missing") == []
+
+def test_description_formats_are_equivalent(tmp_path):
+    jsonl = parse_catalog(write(tmp_path / "a.json", "".join(json.dumps(record) + "\n" for record in DESCRIPTIONS)))
+    array = parse_catalog(write(tmp_path / "b.json", json.dumps(DESCRIPTIONS, indent=4)))
+    for catalog in (jsonl, array):
+        assert [{table.name: table.to_dict()} for table in catalog] == DESCRIPTIONS
+
+def test_empty_file_is_an_empty_catalog(tmp_path):
+    assert len(parse_catalog(write(tmp_path / "empty.json", ""))) == 0
+
+def test_case_insensitive_lookups(tmp_path):
+    catalog = parse_catalog(write(tmp_path / "tables.json", json.dumps(SPIDER_TABLES)))
+    assert "SINGER" in catalog and catalog.get("singer").name == "Singer" and catalog.get("nope") is None
+    assert catalog.position("CONCERT") == 1
+    assert catalog.get("singer").column("singer_id").pk is True
+    assert [table.name for table in catalog.tables_with_column("SINGER_ID")] == ["Singer", "concert"]
+    assert catalog.column_lookup()["singer"] == {"singer_id": "Singer_ID", "name": "Name"}
+
+def test_snapshot_is_reused_until_the_file_changes(tmp_path, monkeypatch):
+    snapshots = str(tmp_path / "snapshots")
+    path = write(tmp_path / "tables.json", json.dumps(SPIDER_TABLES))
+    first = load_catalog(path, snapshot_dir=snapshots)
+    assert os.path.exists(snapshot_path(path, snapshots))
+
+    parse = catalog_module.parse_catalog
+    monkeypatch.setattr(catalog_module, "parse_catalog", lambda file_path: pytest.fail("snapshot not used"))
+    second = load_catalog(path, snapshot_dir=snapshots)
+    assert [table.to_dict() for table in second] == [table.to_dict() for table in first]
+
+    monkeypatch.setattr(catalog_module, "parse_catalog", parse)
+    write(path, json.dumps({"pets": SPIDER_TABLES["pets"]}))
+    assert load_catalog(path, snapshot_dir=snapshots).table_names() == ["pets"]
+
+def test_corrupt_snapshot_is_ignored(tmp_path):
+    snapshots = str(tmp_path / "snapshots")
+    path = write(tmp_path / "tables.json", json.dumps(SPIDER_TABLES))
+    load_catalog(path, snapshot_dir=snapshots)
+    write(snapshot_path(path, snapshots), "garbage")
+    assert len(load_catalog(path, snapshot_dir=snapshots)) == 3
@@ -0,0 +1,39 @@
+import os
+import sqlite3
+from catalog import Catalog, Column, ForeignKey, Table, load_catalog
+from ddl_generator import column_formats, generate_ddl, quote, quote_string, table_order
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_quoting():
+    assert quote("mysql", "a`b") == "`a``b`"
+    assert quote("sqlite", 'a"b') == '"a""b"'
+    assert quote_string("it's \\") == "'it''s \\\\'"
+
+CYCLE = Catalog([
+    Table("a", "db", columns=[Column("id", "number", pk=True), Column("b_id", "text")],
+          foreign_keys=[ForeignKey("b_id", "b", "id")]),
+    Table("b", "db", columns=[Column("id", "number", pk=True), Column("a_id", "number")],
+          foreign_keys=[ForeignKey("a_id", "a", "id")]),
+    Table("c", "db", columns=[Column("a_id", "number")], foreign_keys=[ForeignKey("a_id", "A", "id")]),
+    Table("d", "db", columns=[Column("x", "time")]),
+])
+
+def test_cycles_follow_in_file_order_and_defer_their_foreign_keys():
+    assert table_order(CYCLE) == ["d", "a", "b", "c"]
+    statements = list(generate_ddl(CYCLE, "mysql"))
+    assert statements[-1] == "ALTER TABLE `a` ADD FOREIGN KEY (`b_id`) REFERENCES `b` (`id`);"
+    assert "FOREIGN KEY (`a_id`) REFERENCES `a` (`id`)" in statements[2]
+
+def test_foreign_key_columns_take_the_referenced_format():
+    formats = column_formats(CYCLE)
+    assert formats[("a", "b_id")] == "number" and formats[("d", "x")] == "time"
+
+def test_spider_catalog_creates_in_sqlite():
+    catalog = load_catalog(os.path.join(ROOT, "spider_tables.json"), snapshot_dir=None)
+    connection = sqlite3.connect(":memory:")
+    connection.execute("PRAGMA foreign_keys = ON")
+    for statement in generate_ddl(catalog, "sqlite"):
+        connection.execute(statement)
+    created = connection.execute("SELECT count(*) FROM sqlite_master WHERE type = 'table'").fetchone()[0]
+    assert created == len(catalog)
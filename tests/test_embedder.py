@@ -0,0 +1,32 @@
+import embedder
+from fake_backends import FakeEmbeddings
+from llm_cache import DiskCache
+
+def test_embed_texts_caches_and_closes_its_own_store(tmp_path, monkeypatch):
+    opened = []
+
+    class RecordingCache(DiskCache):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.closed = False
+            opened.append(self)
+
+        def close(self):
+            super().close()
+            self.closed = True
+
+    monkeypatch.setattr(embedder, "DiskCache", RecordingCache)
+    monkeypatch.setattr(embedder, "EMBEDDING_CACHE_PATH", str(tmp_path / "embeddings.db"))
+    model = FakeEmbeddings(dimensions=8)
+
+    first = embedder.embed_texts(model, ["a", "b", "a"])
+    assert first[0] == first[2] and first[0] != first[1]
+    assert embedder.embed_texts(model, ["b"]) == [first[1]]
+    assert len(opened) == 2 and all(store.closed for store in opened)
+
+def test_embed_texts_leaves_a_passed_store_open(tmp_path):
+    store = DiskCache(str(tmp_path / "embeddings.db"))
+    model = FakeEmbeddings(dimensions=8)
+    embedder.embed_texts(model, ["a"], store)
+    assert store.stats()["entries"] == 1
+    store.close()
@@ -0,0 +1,70 @@
+import sqlite3
+from init_database import batch_inserts, create_tables, dependency_levels, execute_statements, is_value_list, statement_groups
+
+def test_is_value_list():
+    assert is_value_list("(1, 'a'), (2, 'b,(c)')")
+    assert is_value_list("(1)")
+    assert not is_value_list("(1) ON CONFLICT DO NOTHING")
+    assert not is_value_list("(1), ")
+    assert not is_value_list("(1) (2)")
+
+def test_batch_inserts_folds_runs_of_the_same_table():
+    statements = [
+        "INSERT INTO a VALUES (1)",
+        "INSERT  INTO a\n VALUES (2)",
+        "INSERT INTO a VALUES (3) ON CONFLICT DO NOTHING",
+        "INSERT INTO b (x) VALUES ('y')",
+        "UPDATE b SET x = 'z'",
+        "INSERT INTO b (x) VALUES ('w')",
+    ]
+    assert list(batch_inserts(statements)) == [
+        ("INSERT INTO a VALUES (1),(2)", statements[:2]),
+        (statements[2], [statements[2]]),
+        (statements[3], [statements[3]]),
+        (statements[4], [statements[4]]),
+        (statements[5], [statements[5]]),
+    ]
+
+def test_batch_inserts_caps_rows_and_bytes():
+    statements = [f"INSERT INTO a VALUES ({i})" for i in range(7)]
+    assert [len(originals) for _, originals in batch_inserts(statements, batch_size=3)] == [3, 3, 1]
+    size = len(statements[0])
+    assert [len(originals) for _, originals in batch_inserts(statements, max_batch_bytes=2 * size)] == [2, 2, 2, 1]
+
+def test_failed_batch_is_replayed_row_by_row():
+    connection = sqlite3.connect(":memory:")
+    connection.execute("CREATE TABLE a (id INTEGER PRIMARY KEY)")
+    statements = [f"INSERT INTO a VALUES ({i})" for i in (1, 2, 2, 3)]
+    assert execute_statements(connection, statements) == (3, 1)
+    assert [row[0] for row in connection.execute("SELECT id FROM a ORDER BY id")] == [1, 2, 3]
+
+def test_statement_groups_keep_other_statements_as_barriers():
+    statements = ["CREATE TABLE a (x)", "CREATE TABLE b (y)", "CREATE INDEX i ON a (x)", "", "CREATE TABLE c (z)"]
+    assert list(statement_groups(statements)) == [
+        ("create", statements[:2]), ("other", statements[2]), ("create", [statements[4]]),
+    ]
+
+def test_dependency_levels():
+    statements = [
+        "CREATE TABLE orders (id, customer REFERENCES customers(id), item REFERENCES items(id))",
+        "CREATE TABLE customers (id)",
+        "CREATE TABLE items (id, parent REFERENCES items(id))",
+        "CREATE TABLE x (id, y REFERENCES y(id))",
+        "CREATE TABLE y (id, x REFERENCES x(id))",
+    ]
+    # self references don't count; the x/y cycle forms the last level
+    assert dependency_levels(statements) == [statements[1:3], [statements[0]], statements[3:]]
+
+def test_create_tables_on_sqlite(tmp_path):
+    credentials = {"backend": "sqlite", "database": str(tmp_path / "db.sqlite")}
+    statements = [
+        "CREATE TABLE child (id, parent_id REFERENCES parent(id))",
+        "CREATE TABLE parent (id)",
+        "CREATE INDEX child_parent ON child (parent_id)",
+        "CREATE TABLE parent (id)",
+    ]
+    assert create_tables(credentials, statements) == (3, 1)
+    connection = sqlite3.connect(credentials["database"])
+    names = {row[0] for row in connection.execute("SELECT name FROM sqlite_master")}
+    assert names == {"child", "parent", "child_parent"}
+    connection.close()
@@ -0,0 +1,81 @@
+import io
+import json
+import os
+import pytest
+from json_stream import iter_json_array, iter_json_object, read_records, resume_records, write_record
+
+ARRAYS = [
+    '[12.5e3]',
+    '[1, -20, 3.25E-2, true, false, null]',
+    ' [ "a,]b" , {"x": [1, 2]}, [], {}, 1234567 ] ',
+    '[]',
+    '[\n0,\n"\\u00e9\\"",\n[[-1e10]]\n]',
+]
+
+@pytest.mark.parametrize("text", ARRAYS)
+def test_array_matches_json_loads_for_every_chunk_size(text):
+    for chunk_size in range(1, len(text) + 2):
+        assert list(iter_json_array(io.StringIO(text), chunk_size)) == json.loads(text), chunk_size
+
+def test_array_number_cut_at_every_boundary():
+    # each element is split at every possible offset by some chunk size
+    values = [12345, -0.5, 6.02e23, 7e-9, 100]
+    text = json.dumps(values)
+    for chunk_size in range(1, 12):
+        assert list(iter_json_array(io.StringIO(text), chunk_size)) == values
+
+def test_array_is_lazy():
+    elements = iter_json_array(io.StringIO('[1, 2, oops'), chunk_size=4)
+    assert next(elements) == 1
+    assert next(elements) == 2
+    with pytest.raises(ValueError):
+        next(elements)
+
+@pytest.mark.parametrize("text", ['{"a": 1}', ', [1]', '[1, 2', ''])
+def test_array_rejects_invalid_input(text):
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO(text), chunk_size=2))
+
+OBJECTS = [
+    '{"a": 12.5e3}',
+    '{"n": -7, "t": true, "f": false, "z": null, "s": "x:}", "o": {"k": [1, 2]}}',
+    ' { } ',
+    '{"e\\u00e9": [12345, 6.5], "last": 99}',
+]
+
+@pytest.mark.parametrize("text", OBJECTS)
+def test_object_matches_json_loads_for_every_chunk_size(text):
+    for chunk_size in range(1, len(text) + 2):
+        assert dict(iter_json_object(io.StringIO(text), chunk_size)) == json.loads(text), chunk_size
+
+@pytest.mark.parametrize("text", ['[1]', '{1: 2}', '{"a": 1', '{"a"}', '{"a": 1, "b"}'])
+def test_object_rejects_invalid_input(text):
+    with pytest.raises(ValueError):
+        list(iter_json_object(io.StringIO(text), chunk_size=3))
+
+def test_resume_keeps_accepted_records_after_rejected_ones(tmp_path):
+    path = str(tmp_path / "out.json")
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write('{"a": 1}\n{"b": 2}\nnot json\n[1]\n{"c": 3}\n{"d": 4')
+    output_file, kept = resume_records(path, keep=lambda record: "b" not in record)
+    with output_file:
+        write_record(output_file, {"e": 5})
+    assert kept == 2
+    assert list(read_records(path)) == [{"a": 1}, {"c": 3}, {"e": 5}]
+    assert not os.path.exists(path + ".tmp")
+
+def test_resume_appends_to_complete_file(tmp_path):
+    path = str(tmp_path / "out.json")
+    with open(path, 'w', encoding='utf-8') as file:
+        write_record(file, {"a": 1})
+    output_file, kept = resume_records(path)
+    with output_file:
+        write_record(output_file, {"b": 2})
+    assert kept == 1
+    assert list(read_records(path)) == [{"a": 1}, {"b": 2}]
+
+def test_resume_creates_missing_file(tmp_path):
+    path = str(tmp_path / "out.json")
+    output_file, kept = resume_records(path)
+    output_file.close()
+    assert kept == 0 and os.path.exists(path)
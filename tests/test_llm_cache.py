@@ -0,0 +1,78 @@
+import itertools
+import types
+import pytest
+import llm_cache
+from langchain_core.outputs import Generation
+from llm_cache import DiskCache, LLMResponseCache
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    # strictly increasing access times, so LRU order does not depend on the clock resolution
+    ticks = itertools.count(1)
+    monkeypatch.setattr(llm_cache, "time", types.SimpleNamespace(time=lambda: float(next(ticks))))
+
+def test_put_get_and_overwrite(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache.db"), max_bytes=1000)
+    assert cache.get("k") is None
+    cache.put("k", b"one")
+    cache.put("k", b"three")
+    assert cache.get("k") == b"three"
+    assert cache.total == 5 and cache.stats() == {"entries": 1, "bytes": 5, "max_bytes": 1000}
+    cache.close()
+
+def test_evicts_least_recently_used_down_to_90_percent(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache.db"), max_bytes=100)
+    for key in "abcde":
+        cache.put(key, b"x" * 20)
+    # reading "a" makes "b" and "c" the least recently used entries; 120 bytes are trimmed to 80
+    assert cache.get("a") is not None
+    cache.put("f", b"x" * 20)
+    assert [key for key in "abcdef" if cache.get(key) is not None] == ["a", "d", "e", "f"]
+    assert cache.total == cache.stats()["bytes"] == 80
+
+    cache.put("g", b"x" * 50)
+    assert [key for key in "adefg" if cache.get(key) is not None] == ["e", "f", "g"]
+    assert cache.total == 90
+    cache.close()
+
+def test_access_times_survive_reopening(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = DiskCache(path, max_bytes=60)
+    for key in "abc":
+        cache.put(key, b"x" * 20)
+    cache.get("a")
+    # buffered access times are written on close
+    cache.close()
+
+    cache = DiskCache(path, max_bytes=60)
+    assert cache.total == 60
+    cache.put("d", b"x" * 20)
+    assert cache.get("a") is not None and cache.get("b") is None
+    cache.close()
+
+def test_access_times_are_flushed_in_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, "ACCESS_FLUSH_EVERY", 2)
+    cache = DiskCache(str(tmp_path / "cache.db"))
+    cache.put("a", b"1")
+    cache.put("b", b"2")
+    cache.get("a")
+    assert cache.accessed
+    cache.get("b")
+    assert not cache.accessed
+    cache.close()
+
+def test_clear(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache.db"))
+    cache.put("a", b"1")
+    cache.clear()
+    assert cache.get("a") is None and cache.total == 0
+    cache.close()
+
+def test_response_cache_round_trip(tmp_path):
+    store = DiskCache(str(tmp_path / "cache.db"))
+    cache = LLMResponseCache(store)
+    assert cache.lookup("prompt", "model") is None
+    cache.update("prompt", "model", [Generation(text="réponse")])
+    assert [generation.text for generation in cache.lookup("prompt", "model")] == ["réponse"]
+    assert cache.lookup("prompt", "other model") is None
+    store.close()
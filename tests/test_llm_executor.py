@@ -0,0 +1,78 @@
+import threading
+import time
+import pytest
+from langchain_core.runnables import RunnableLambda
+import llm_executor
+from llm_executor import AdaptiveLimiter, invoke_all, invoke_with_backoff
+
+# the backoff sleeps are patched out; the fake calls still take real time
+sleep = time.sleep
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(llm_executor.time, "sleep", lambda seconds: None)
+
+def test_limiter_halves_on_throttle_and_recovers():
+    limiter = AdaptiveLimiter(8, recovery=2)
+    limiter.acquire()
+    limiter.release(throttled=True)
+    assert limiter.limit == 4
+    for _ in range(4):
+        limiter.acquire()
+        limiter.release()
+    assert limiter.limit == 6
+
+def test_invoke_all_keeps_input_order_and_caps_concurrency():
+    lock = threading.Lock()
+    state = {"running": 0, "peak": 0}
+
+    def call(n):
+        with lock:
+            state["running"] += 1
+            state["peak"] = max(state["peak"], state["running"])
+        sleep(0.002)
+        with lock:
+            state["running"] -= 1
+        return n * n
+
+    assert list(invoke_all(RunnableLambda(call), list(range(50)), max_in_flight=4)) == [n * n for n in range(50)]
+    assert state["peak"] <= 4
+
+def test_throttled_calls_are_retried():
+    attempts = []
+
+    def call(n):
+        attempts.append(n)
+        if len(attempts) < 3:
+            raise RuntimeError("ThrottlingException: rate exceeded")
+        return n
+
+    limiter = AdaptiveLimiter(4)
+    assert invoke_with_backoff(RunnableLambda(call), 7, limiter) == 7
+    assert len(attempts) == 3 and limiter.limit == 1
+
+def test_other_errors_are_raised_without_retry():
+    attempts = []
+
+    def call(n):
+        attempts.append(n)
+        raise ValueError("ValidationException: bad input")
+
+    with pytest.raises(ValueError):
+        invoke_with_backoff(RunnableLambda(call), 1, AdaptiveLimiter(1))
+    assert attempts == [1]
+
+def test_invoke_all_drops_queued_calls_after_an_error():
+    calls = []
+
+    def call(n):
+        calls.append(n)
+        if n == 0:
+            raise ValueError("ValidationException: bad input")
+        sleep(0.01)
+        return n
+
+    with pytest.raises(ValueError):
+        list(invoke_all(RunnableLambda(call), list(range(200)), max_in_flight=2))
+    sleep(0.1)
+    assert len(calls) < 20
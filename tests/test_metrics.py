@@ -0,0 +1,79 @@
+import json
+import pytest
+import metrics
+
+@pytest.fixture(autouse=True)
+def clean():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+def test_percentile():
+    values = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
+    assert metrics.percentile([], 50) == 0.0
+    assert metrics.percentile([7], 99) == 7
+    assert metrics.percentile(values, 0) == 1
+    assert metrics.percentile(values, 50) == 5
+    assert metrics.percentile(values, 95) == 10
+    assert metrics.percentile(values, 100) == 10
+
+def test_summarize_latencies():
+    assert metrics.summarize_latencies([]) == {
+        "count": 0, "sum_seconds": 0, "p50_seconds": 0.0, "p95_seconds": 0.0, "p99_seconds": 0.0, "max_seconds": 0.0}
+    summary = metrics.summarize_latencies([0.3, 0.1, 0.2])
+    assert summary["count"] == 3 and summary["p50_seconds"] == 0.2 and summary["max_seconds"] == 0.3
+
+def test_timer_records_errors_and_latency():
+    with pytest.raises(RuntimeError):
+        with metrics.timer("llm"):
+            raise RuntimeError("down")
+    with metrics.timer("llm"):
+        pass
+    metrics.record_retry("llm")
+    report = metrics.build_report("script", 0.0, 1.0)
+    assert report["calls"]["llm"]["count"] == 2
+    assert report["calls"]["llm"]["errors"] == 1 and report["calls"]["llm"]["retries"] == 1
+
+def test_prometheus_histogram_is_cumulative():
+    metrics.increment("llm_input_tokens", 12)
+    text = metrics.format_prometheus("script", {"embed": [0.02, 0.2, 3.0]})
+    assert 'pipeline_call_latency_seconds_bucket{script="script",call="embed",le="0.01"} 0' in text
+    assert 'pipeline_call_latency_seconds_bucket{script="script",call="embed",le="0.05"} 1' in text
+    assert 'pipeline_call_latency_seconds_bucket{script="script",call="embed",le="0.25"} 2' in text
+    assert 'pipeline_call_latency_seconds_bucket{script="script",call="embed",le="5"} 3' in text
+    assert 'pipeline_call_latency_seconds_bucket{script="script",call="embed",le="+Inf"} 3' in text
+    assert 'pipeline_call_latency_seconds_count{script="script",call="embed"} 3' in text
+    assert "# TYPE pipeline_llm_input_tokens_total counter" in text
+    assert 'pipeline_llm_input_tokens_total{script="script"} 12' in text
+
+def test_run_writes_reports(tmp_path):
+    def main():
+        with metrics.stage("work") as work:
+            work.add(4)
+        metrics.observe("bulk", 0.5)
+        return "done"
+
+    assert metrics.run("job", main, profile=False, report_dir=str(tmp_path)) == "done"
+    report = json.loads((tmp_path / "job.json").read_text())
+    assert [stage["stage"] for stage in report["stages"]] == ["work", "total"]
+    assert report["stages"][0]["items"] == 4
+    assert report["calls"]["bulk"]["count"] == 1
+    prom = (tmp_path / "job.prom").read_text()
+    assert 'pipeline_stage_items{script="job",stage="work"} 4' in prom
+    assert not list(tmp_path.glob("*.tmp"))
+
+def test_run_writes_reports_when_main_fails(tmp_path):
+    def main():
+        metrics.record_error("llm")
+        raise ValueError("broken")
+
+    with pytest.raises(ValueError):
+        metrics.run("job", main, profile=False, report_dir=str(tmp_path))
+    report = json.loads((tmp_path / "job.json").read_text())
+    assert report["calls"]["llm"]["errors"] == 1
+    assert [stage["stage"] for stage in report["stages"]] == ["total"]
+
+def test_run_writes_profile(tmp_path, capsys):
+    metrics.run("job", lambda: None, profile=True, report_dir=str(tmp_path))
+    assert (tmp_path / "job.prof").exists()
+    assert "Profile written to" in capsys.readouterr().out
@@ -0,0 +1,71 @@
+import json
+import pytest
+import opensearch_utils
+from fake_backends import FakeOpenSearch, FaultInjector, serving
+from opensearch_utils import bulk_load, create_os_client, fetch_fingerprints, iter_chunks, to_bulk_entry, to_delete_entry
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(opensearch_utils, "INITIAL_BACKOFF", 0.0)
+
+def client_for(server):
+    return create_os_client({"opensearch-auth": {"domain_endpoint": server.endpoint, "user_id": "", "user_password": ""}})
+
+def entries(count, index="docs"):
+    return [to_bulk_entry({"index": {"_index": index, "_id": str(i)}}, {"n": i, "fingerprint": f"fp{i}"}) for i in range(count)]
+
+def test_iter_chunks_respects_both_caps():
+    docs = entries(10)
+    size = len(docs[0].encode('utf-8'))
+    assert [len(chunk) for chunk in iter_chunks(docs, max_chunk_docs=4)] == [4, 4, 2]
+    assert [len(chunk) for chunk in iter_chunks(docs, max_chunk_bytes=3 * size)] == [3, 3, 3, 1]
+    # an entry larger than the byte cap is sent on its own rather than dropped
+    assert [len(chunk) for chunk in iter_chunks(docs[:2], max_chunk_bytes=1)] == [1, 1]
+
+def test_bulk_load_over_http_in_capped_chunks():
+    with serving() as server:
+        os_client = client_for(server)
+        indexed, errors = bulk_load(os_client, iter(entries(25)), max_chunk_docs=10, parallel=2)
+        assert (indexed, errors) == (25, [])
+        assert sorted(body.count("\n") // 2 for body in server.bulk_requests) == [5, 10, 10]
+        assert fetch_fingerprints(os_client, "docs") == {str(i): f"fp{i}" for i in range(25)}
+
+        indexed, errors = bulk_load(os_client, [to_delete_entry("docs", "3"), to_delete_entry("docs", "missing")])
+        assert (indexed, errors) == (2, [])
+        assert "3" not in fetch_fingerprints(os_client, "docs")
+
+def test_bulk_load_retries_unavailable_cluster():
+    with serving() as server:
+        server.unavailable = 2
+        indexed, errors = bulk_load(client_for(server), entries(3))
+        assert (indexed, errors) == (3, [])
+        assert len(server.bulk_requests) == 3
+
+def test_bulk_load_resends_only_throttled_items():
+    with serving(FakeOpenSearch(FaultInjector(throttle_rate=0.5, seed=3))) as server:
+        indexed, errors = bulk_load(client_for(server), entries(40), max_retries=20)
+        assert (indexed, errors) == (40, [])
+        sent = [json.loads(line)["index"]["_id"] for body in server.bulk_requests for line in body.splitlines()[::2]]
+        assert len(sent) > 40 and set(sent) == {str(i) for i in range(40)}
+        # the first request carries every item, the retries only the rejected ones
+        assert len(server.bulk_requests[0].splitlines()) == 80
+        assert all(len(body.splitlines()) < 80 for body in server.bulk_requests[1:])
+
+def test_bulk_load_reports_non_retryable_errors():
+    with serving(FakeOpenSearch(FaultInjector(error_rate=1.0))) as server:
+        indexed, errors = bulk_load(client_for(server), entries(3))
+        assert indexed == 0 and errors == ["injected bulk failure"] * 3
+        assert len(server.bulk_requests) == 1
+
+def test_index_management_over_http():
+    with serving() as server:
+        os_client = client_for(server)
+        assert fetch_fingerprints(os_client, "docs") == {}
+        mappings = {"properties": {"v": {"type": "knn_vector", "dimension": 4}}}
+        os_client.indices.create(index="docs", body={"mappings": mappings})
+        assert os_client.indices.exists(index="docs")
+        assert opensearch_utils.mapping_differences(os_client, "docs", mappings) == []
+        changed = {"properties": {"v": {"type": "knn_vector", "dimension": 8}}}
+        assert opensearch_utils.mapping_differences(os_client, "docs", changed) == ["v"]
+        os_client.indices.delete(index="docs")
+        assert not os_client.indices.exists(index="docs")
@@ -0,0 +1,76 @@
+import os
+import threading
+import pytest
+from langchain_core.globals import set_llm_cache
+import benchmark_pipeline
+import metrics
+import pipeline
+import query_translator
+import schema_loader
+import table_summarizer
+from fake_backends import installed
+from pipeline import Channel, PipelineAborted
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_channel_batches_without_waiting_and_closes_for_every_consumer():
+    channel = Channel("test", threading.Event(), maxsize=10)
+    for item in range(5):
+        channel.put(item)
+    channel.close()
+    assert list(channel.batches(3)) == [[0, 1, 2], [3, 4]]
+    # the close marker stays queued for the other consumers
+    assert list(channel) == []
+
+def test_channel_gives_up_when_a_stage_failed():
+    failed = threading.Event()
+    channel = Channel("test", failed, maxsize=1)
+    channel.put(1)
+    failed.set()
+    with pytest.raises(PipelineAborted):
+        channel.put(2)
+    with pytest.raises(PipelineAborted):
+        next(iter(channel))
+
+def test_stage_errors_are_collected():
+    failed = threading.Event()
+    errors = []
+
+    def stage(_):
+        raise RuntimeError("boom")
+
+    pipeline.start_stage("broken", stage, failed, errors).join()
+    assert failed.is_set() and [(name, str(error)) for name, error in errors] == [("broken", "boom")]
+
+def run_scripts(workdir, mains, monkeypatch):
+    """Runs the scripts' mains in `workdir` against the fakes; returns the output files and index contents."""
+    monkeypatch.chdir(workdir)
+    with installed() as os_client:
+        for name, main in mains:
+            metrics.run(name, main, report_dir=os.path.join(workdir, "reports"))
+    set_llm_cache(None)
+    outputs = {}
+    for path in (query_translator.FILE_PATH_1, table_summarizer.OUTPUT_FILE_PATH2):
+        with open(path, 'rb') as file:
+            outputs[path] = file.read()
+    return outputs, {name: index["docs"] for name, index in os_client.indexes.items()}
+
+def test_streaming_pipeline_matches_the_scripts(tmp_path, monkeypatch):
+    monkeypatch.chdir(ROOT)
+    tables, statements = benchmark_pipeline.select_inputs(6)
+    results = []
+    for name, mains in (
+        ("sequential", [("schema_loader", schema_loader.main), ("query_translator", query_translator.main),
+                        ("table_summarizer", table_summarizer.main)]),
+        ("streaming", [("schema_loader", schema_loader.main), ("pipeline", pipeline.main)]),
+    ):
+        workdir = str(tmp_path / name)
+        monkeypatch.chdir(ROOT)
+        benchmark_pipeline.prepare_workdir(workdir, tables, statements)
+        results.append(run_scripts(workdir, mains, monkeypatch))
+
+    (sequential_files, sequential_index), (streaming_files, streaming_index) = results
+    assert sequential_files == streaming_files
+    assert sequential_index == streaming_index
+    assert len(streaming_index[table_summarizer.INDEX_NAME]) == len(tables)
+    assert len(streaming_index[query_translator.INDEX_NAME]) == len({sql.strip() for sql in statements})
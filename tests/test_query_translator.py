@@ -0,0 +1,66 @@
+import pytest
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts.chat import ChatPromptTemplate
+from catalog import Catalog, Column, Table
+from fake_backends import FakeChatModel
+from query_translator import (
+    SYS_PROMPT_TEMPLATE1, SYS_PROMPT_TEMPLATE2, SYS_PROMPT_TEMPLATE3,
+    USR_PROMPT_TEMPLATE1, USR_PROMPT_TEMPLATE2, USR_PROMPT_TEMPLATE3,
+    substitute_literals, translate_queries,
+)
+
+@pytest.mark.parametrize("text, original, sql, expected", [
+    ("Orders of customer 1234 in Seoul", "SELECT * FROM o WHERE c = 1234 AND city = 'Seoul'",
+     "SELECT * FROM o WHERE c = 5678 AND city = 'Busan'", "Orders of customer 5678 in Busan"),
+    # followed by a Korean particle, but not inside a longer number
+    ("Age over 300세", "SELECT * FROM p WHERE age > 300", "SELECT * FROM p WHERE age > 450", "Age over 450세"),
+    ("Year 2030 and 203", "SELECT * FROM p WHERE a = 203 AND y = 2030", "SELECT * FROM p WHERE a = 204 AND y = 2030", "Year 2030 and 204"),
+    ("unchanged", "SELECT 1", "SELECT 1", "unchanged"),
+    # short numbers are too ambiguous to replace locally
+    ("Age over 30", "SELECT * FROM p WHERE age > 30", "SELECT * FROM p WHERE age > 45", None),
+    # the old value must occur exactly once
+    ("a, or a", "SELECT 'a'", "SELECT 'b'", None),
+    ("absent", "SELECT 'a'", "SELECT 'b'", None),
+    # one old value can't become two new ones
+    ("a", "SELECT 'a', 'a'", "SELECT 'b', 'c'", None),
+    ("a", "SELECT 1", "SELECT 1, 2", None),
+])
+def test_substitute_literals(text, original, sql, expected):
+    assert substitute_literals(text, original, sql) == expected
+
+def chain(template, system, model_id="fake-chat"):
+    return ChatPromptTemplate.from_template(template) | FakeChatModel(model_id=model_id, system=system) | StrOutputParser()
+
+CATALOG = Catalog([Table("orders", desc="Orders.", columns=[Column("id", desc="Id."), Column("city", desc="City.")])])
+QUERIES = [
+    "SELECT id FROM orders WHERE city = 'Seoul'",
+    "SELECT id FROM orders WHERE city = 'Busan'",
+    "SELECT city FROM orders",
+]
+
+def translate(policy="substitute", model_id="fake-chat", previous=None):
+    chains = (chain(USR_PROMPT_TEMPLATE1, SYS_PROMPT_TEMPLATE1), chain(USR_PROMPT_TEMPLATE2, SYS_PROMPT_TEMPLATE2, model_id),
+              chain(USR_PROMPT_TEMPLATE3, SYS_PROMPT_TEMPLATE3))
+    return list(translate_queries(CATALOG, QUERIES, *chains, policy=policy, previous=previous))
+
+def test_template_variants_are_derived_from_the_first_statement():
+    records = translate()
+    assert [record["query"] for record in records] == QUERIES
+    assert records[0]["input"] == "Request for " + QUERIES[0]
+    # the fake translation echoes the SQL, so the city is replaced locally
+    assert records[1]["input"] == "Request for " + QUERIES[1]
+    assert len({record["fingerprint"] for record in records}) == 3
+
+    reused = translate(policy="reuse")
+    assert reused[1]["input"] == reused[0]["input"]
+
+def test_fingerprints_cover_the_translation_chain():
+    records = translate()
+    assert [record["fingerprint"] for record in translate()] == [record["fingerprint"] for record in records]
+    other_model = translate(model_id="other-model")
+    assert not {record["fingerprint"] for record in records} & {record["fingerprint"] for record in other_model}
+    assert translate(policy="full")[1]["fingerprint"] != records[1]["fingerprint"]
+
+def test_unchanged_translations_are_reused():
+    previous = {record["fingerprint"]: f"stored {i}" for i, record in enumerate(translate())}
+    assert [record["input"] for record in translate(previous=previous)] == ["stored 0", "stored 1", "stored 2"]
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from retriever import ExactIndex, HNSWIndex, LocalRetriever, hnsw_params, l2_score
+
+def random_vectors(count, dimension=16, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, dimension)).astype(np.float32)
+
+def brute_force(vectors, query, k):
+    distances = ((vectors - query) ** 2).sum(axis=1)
+    return np.argsort(distances)[:k].tolist()
+
+def test_exact_index_matches_brute_force():
+    vectors = random_vectors(300)
+    index = ExactIndex(vectors)
+    for query in random_vectors(20, seed=1):
+        found = index.search(query, 10)
+        assert [row for row, _ in found] == brute_force(vectors, query, 10)
+        assert [distance for _, distance in found] == sorted(distance for _, distance in found)
+
+def test_exact_index_small_k_and_empty():
+    index = ExactIndex(random_vectors(3))
+    assert len(index.search(random_vectors(1)[0], 10)) == 3
+    assert index.search(random_vectors(1)[0], 0) == []
+
+def test_hnsw_recall_against_exact():
+    vectors = random_vectors(1000)
+    index = HNSWIndex(vectors, m=8, ef_construction=64, ef_search=64)
+    queries = random_vectors(50, seed=2)
+    hits = sum(len(set(row for row, _ in index.search(query, 10)) & set(brute_force(vectors, query, 10)))
+               for query in queries)
+    assert hits / (10 * len(queries)) >= 0.9
+
+def test_hnsw_finds_stored_vectors_and_respects_links():
+    vectors = random_vectors(200)
+    index = HNSWIndex(vectors, m=4, ef_construction=32)
+    for node in (0, 57, 199):
+        row, distance = index.search(vectors[node], 1)[0]
+        assert row == node and distance == pytest.approx(0.0, abs=1e-5)
+    for level, layer in enumerate(index.graph):
+        max_links = index.m0 if level == 0 else index.m
+        assert all(len(links) <= max_links and node not in links for node, links in layer.items())
+
+def test_hnsw_is_deterministic_and_handles_empty_input():
+    vectors = random_vectors(100)
+    query = random_vectors(1, seed=3)[0]
+    assert HNSWIndex(vectors, seed=5).search(query, 5) == HNSWIndex(vectors, seed=5).search(query, 5)
+    assert HNSWIndex(np.zeros((0, 4))).search(np.zeros(4), 5) == []
+
+def test_local_retriever_returns_opensearch_shaped_hits():
+    vectors = [[0.0, 0.0], [1.0, 0.0], [3.0, 0.0]]
+    retriever = LocalRetriever(["a", "b", "c"], vectors, [{"n": 0}, {"n": 1}, {"n": 3}])
+    assert retriever.search([0.9, 0.0], k=2) == [
+        {"_id": "b", "_score": pytest.approx(l2_score(0.01)), "_source": {"n": 1}},
+        {"_id": "a", "_score": pytest.approx(l2_score(0.81)), "_source": {"n": 0}},
+    ]
+    with pytest.raises(ValueError):
+        LocalRetriever([], [], [], mode="ivf")
+
+def test_hnsw_params_from_config():
+    config = {
+        "settings": {"index.knn.algo_param.ef_search": 100},
+        "mappings": {"properties": {"v": {"method": {"parameters": {"m": 24}}}}},
+    }
+    assert hnsw_params(config, "mappings", "v") == {"m": 24, "ef_construction": 512, "ef_search": 100}
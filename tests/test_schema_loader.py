@@ -0,0 +1,46 @@
+from catalog import Column, Table
+from fake_backends import installed
+from json_stream import read_records, write_record
+from schema_loader import build_batches, build_inputs, columns_match, describe_tables, merge_records, parse_response
+
+def tables(*specs):
+    return [Table(name, db_id, columns=[Column(f"c{i}") for i in range(columns)]) for name, db_id, columns in specs]
+
+def test_batches_stay_within_a_database_and_the_token_budget():
+    catalog = tables(("a", "db1", 1), ("b", "db1", 1), ("c", "db1", 1), ("d", "db2", 1), ("e", "db2", 20))
+    inputs_list = build_inputs(catalog)
+    # 90 tokens per small table
+    assert build_batches(catalog, inputs_list, token_budget=200) == [[0, 1], [2], [3], [4]]
+    assert build_batches(catalog, inputs_list, token_budget=10000) == [[0, 1, 2], [3, 4]]
+
+def test_parse_response():
+    assert parse_response('Here you go: {"Singer": {"cols": []}} done') == {"singer": {"cols": []}}
+    assert parse_response("no json") == {}
+    assert parse_response("{broken") == {}
+    assert parse_response("[1, 2]") == {}
+
+def test_columns_match_ignores_order_and_case():
+    inputs = build_inputs(tables(("t", "db", 2)))[0]
+    assert columns_match({"cols": [{"col": "C1"}, {"col": "c0"}]}, inputs)
+    assert not columns_match({"cols": [{"col": "c0"}]}, inputs)
+    assert not columns_match({"cols": None}, inputs)
+
+def test_describe_tables_yields_records_in_table_order():
+    catalog = tables(("a", "db1", 2), ("b", "db1", 3), ("c", "db2", 1), ("d", "db3", 2))
+    inputs_list = build_inputs(catalog)
+    with installed():
+        records = list(describe_tables(catalog, inputs_list, token_budget=250))
+    assert [next(iter(record)) for record in records] == ["a", "b", "c", "d"]
+    assert all(columns_match(record[inputs["table"]], inputs) for record, inputs in zip(records, inputs_list))
+
+def test_merge_records_replaces_drops_and_appends(tmp_path):
+    path = str(tmp_path / "schemas.json")
+    with open(path, 'w', encoding='utf-8') as file:
+        for record in ({"a": 1}, {"gone": 2}, {"b": 3}, {"A": 4}):
+            write_record(file, record)
+    merge_records(path, {"a", "b", "c"}, {"b": {"b": 30}, "c": {"c": 5}})
+    assert list(read_records(path)) == [{"a": 1}, {"b": 30}, {"c": 5}]
+
+    missing = str(tmp_path / "missing.json")
+    merge_records(missing, {"c"}, {"c": {"c": 5}})
+    assert list(read_records(missing)) == [{"c": 5}]
@@ -0,0 +1,132 @@
+import argparse
+import json
+import os
+import pytest
+from langchain_core.globals import set_llm_cache
+import benchmark_pipeline
+import merge_shards
+import metrics
+import preprocess
+import query_translator
+import schema_loader
+import table_summarizer
+from catalog import Catalog, Table
+from fake_backends import installed
+from json_stream import iter_json_array, read_records, write_record
+from merge_shards import keyed_records, shard_files, write_in_order
+from sharding import Shard, all_shards, parse_shard, select_tables, shard_of, shard_path, statement_shard, table_databases
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_shard_names_and_paths():
+    shard = Shard(1, 4)
+    assert str(shard) == "1/4"
+    assert shard.path("./metadata/spider_schemas.json") == "./metadata/spider_schemas.shard-1-of-4.json"
+    assert shard_path("a.json") == "a.json" and shard_path("a.json", shard) == "a.shard-1-of-4.json"
+    with pytest.raises(ValueError):
+        Shard(4, 4)
+
+@pytest.mark.parametrize("spec", ["1", "1/0", "2/2", "-1/2", "a/b", "1/2/3"])
+def test_parse_shard_rejects_invalid_specs(spec):
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_shard(spec)
+
+def test_every_database_belongs_to_exactly_one_shard():
+    db_ids = [f"db_{i}" for i in range(200)]
+    shards = all_shards(3)
+    owners = [[shard.index for shard in shards if shard.owns(db_id)] for db_id in db_ids]
+    assert all(len(owner) == 1 for owner in owners)
+    assert {owner[0] for owner in owners} == {0, 1, 2}
+    # stable across processes, unlike hash()
+    assert shard_of("concert_singer", 1000) == shard_of("concert_singer", 1000)
+
+def test_statements_follow_the_smallest_database():
+    catalog = Catalog([Table("singer", "b_db"), Table("concert", "a_db"), Table("pets", "c_db")])
+    databases = table_databases(catalog)
+    assert statement_shard("SELECT * FROM singer JOIN concert", databases, 8) == shard_of("a_db", 8)
+    assert statement_shard("SELECT * FROM pets", databases, 8) == shard_of("c_db", 8)
+    assert statement_shard("SELECT 1", databases, 8) == 0
+    shard = Shard(shard_of("c_db", 2), 2)
+    assert "pets" in select_tables(catalog, shard) and select_tables(catalog) is catalog
+
+def test_shard_files_require_every_shard(tmp_path):
+    base = str(tmp_path / "out.json")
+    shards = all_shards(2)
+    assert shard_files(base, shards) is None
+    open(shards[0].path(base), 'w').close()
+    with pytest.raises(FileNotFoundError):
+        shard_files(base, shards)
+    open(shards[1].path(base), 'w').close()
+    assert shard_files(base, shards) == [shard.path(base) for shard in shards]
+
+def test_keyed_records_and_write_in_order(tmp_path):
+    paths = [str(tmp_path / f"{i}.json") for i in range(2)]
+    for path, keys in zip(paths, (["b", "x"], ["a"])):
+        with open(path, 'w', encoding='utf-8') as file:
+            for key in keys:
+                write_record(file, {key: 1})
+    records = keyed_records(paths)
+    out = str(tmp_path / "merged.json")
+    # keys missing from the order follow in shard order
+    assert write_in_order(out, records, ["a", "b", "gone"]) == ["a", "b", "x"]
+    assert list(read_records(out)) == [{"a": 1}, {"b": 1}, {"x": 1}]
+
+    with open(paths[1], 'a', encoding='utf-8') as file:
+        write_record(file, {"b": 2})
+    with pytest.raises(ValueError):
+        keyed_records(paths)
+
+def run_in(workdir, mains, monkeypatch):
+    monkeypatch.chdir(workdir)
+    with installed() as os_client:
+        for name, main in mains:
+            metrics.run(name, main, report_dir=os.path.join(workdir, "reports"))
+    set_llm_cache(None)
+    outputs = {}
+    for path in (schema_loader.OUTPUT_FILE_PATH, query_translator.FILE_PATH_1, table_summarizer.OUTPUT_FILE_PATH2):
+        with open(path, 'rb') as file:
+            outputs[path] = file.read()
+    return outputs, {name: index["docs"] for name, index in os_client.indexes.items()}
+
+def test_merged_shards_match_an_unsharded_run(tmp_path, monkeypatch):
+    monkeypatch.chdir(ROOT)
+    tables, statements = benchmark_pipeline.select_inputs(8)
+    for name in ("unsharded", "sharded"):
+        benchmark_pipeline.prepare_workdir(str(tmp_path / name), tables, statements)
+
+    unsharded = run_in(str(tmp_path / "unsharded"), [
+        ("schema_loader", schema_loader.main), ("query_translator", query_translator.main), ("table_summarizer", table_summarizer.main),
+    ], monkeypatch)
+
+    shards = all_shards(3)
+    mains = []
+    for shard in shards:
+        mains += [(f"schema_loader-{shard.index}", lambda shard=shard: schema_loader.main(shard=shard)),
+                  (f"query_translator-{shard.index}", lambda shard=shard: query_translator.main(shard)),
+                  (f"table_summarizer-{shard.index}", lambda shard=shard: table_summarizer.main(shard))]
+    mains += [("merge", lambda: [merge(shards) for merge in (merge_shards.merge_schemas, merge_shards.merge_translations,
+                                                               merge_shards.merge_summaries)]),
+              ("query_translator", lambda: query_translator.main(index_only=True)),
+              ("table_summarizer", lambda: table_summarizer.main(index_only=True))]
+    sharded = run_in(str(tmp_path / "sharded"), mains, monkeypatch)
+
+    assert sharded == unsharded
+
+def test_merged_preprocess_shards_match_an_unsharded_run(tmp_path, monkeypatch):
+    with open(os.path.join(ROOT, preprocess.INPUT_FILE_PATH), 'r') as file:
+        databases = [db for _, db in zip(range(12), iter_json_array(file))]
+    monkeypatch.chdir(tmp_path)
+    with open(preprocess.INPUT_FILE_PATH, 'w') as file:
+        json.dump(databases, file)
+
+    preprocess.main()
+    with open(preprocess.OUTPUT_FILE_PATH, 'rb') as file:
+        unsharded = file.read()
+    os.remove(preprocess.OUTPUT_FILE_PATH)
+
+    shards = all_shards(4)
+    for shard in shards:
+        preprocess.main(shard)
+    assert merge_shards.merge_tables(shards) == sum(len(db["table_names"]) for db in databases)
+    with open(preprocess.OUTPUT_FILE_PATH, 'rb') as file:
+        assert file.read() == unsharded
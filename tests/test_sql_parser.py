@@ -0,0 +1,56 @@
+import io
+import pytest
+from sql_parser import find_aliases, iter_sql_statements, normalize_sql, referenced_tables, tokenize
+
+def test_tokenize_skips_comments_and_unquotes_identifiers():
+    assert tokenize("SELECT `a b`, 'it''s' -- c\n FROM [t] WHERE x>=1.5") == [
+        ("word", "SELECT"), ("word", "a b"), ("punct", ","), ("string", "'it''s'"), ("word", "FROM"),
+        ("word", "t"), ("word", "WHERE"), ("word", "x"), ("punct", ">="), ("number", "1.5"),
+    ]
+
+SCRIPT = "SELECT 'a;b' FROM t; -- x; y\nSELECT \"q;\" /* ; */ FROM u;;\nSELECT 'it\\'s;' FROM v"
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 8, 64])
+def test_statements_split_only_on_top_level_semicolons(chunk_size):
+    assert list(iter_sql_statements(io.StringIO(SCRIPT), chunk_size=chunk_size)) == [
+        "SELECT 'a;b' FROM t",
+        '-- x; y\nSELECT "q;" /* ; */ FROM u',
+        "SELECT 'it\\'s;' FROM v",
+    ]
+
+@pytest.mark.parametrize("text, kwargs, expected", [
+    ("", {}, []),
+    (" ;; ; ", {}, []),
+    ("SELECT 'it''s; ok' FROM t;SELECT 1", {}, ["SELECT 'it''s; ok' FROM t", "SELECT 1"]),
+    # without backslash escapes (standard SQL), \' ends the string
+    ("SELECT 'a\\';' FROM t; SELECT 2", {"backslash_escapes": False}, ["SELECT 'a\\'", "' FROM t; SELECT 2"]),
+    ("SELECT `a;b` FROM t -- ;", {}, ["SELECT `a;b` FROM t -- ;"]),
+    ("SELECT 1 /* ; unterminated", {}, ["SELECT 1 /* ; unterminated"]),
+    ("SELECT 1 -/ 2; SELECT */ 3", {}, ["SELECT 1 -/ 2", "SELECT */ 3"]),
+])
+def test_statement_splitter_edge_cases(text, kwargs, expected):
+    for chunk_size in (1, 2, 3, 64):
+        assert list(iter_sql_statements(io.StringIO(text), chunk_size=chunk_size, **kwargs)) == expected
+
+def test_normalize_collapses_only_in_lists():
+    assert normalize_sql("SELECT * FROM t WHERE id IN (1, 2, 3) AND f(1, 2) > 3") == \
+        normalize_sql("select * from t where id in (7) and f(5, 6) > 0") == \
+        "select * from t where id in ( ? ) and f ( ? , ? ) > ?"
+
+def test_normalize_renames_aliases_in_order():
+    assert normalize_sql("SELECT x.a FROM t1 x JOIN t2 AS y ON x.id = y.id") == \
+        normalize_sql("SELECT p.a FROM t1 AS p JOIN t2 q ON p.id = q.id")
+
+def test_cast_type_is_not_an_alias():
+    tokens = tokenize("SELECT CAST(t.price AS INTEGER) AS p FROM items AS t WHERE text = 'q'")
+    assert find_aliases(tokens) == ["p", "t"]
+    assert normalize_sql("SELECT CAST(x AS text) FROM a WHERE text = 'q'") == \
+        "select cast ( x as text ) from a where text = ?"
+
+def test_aliases_of_subqueries_inside_function_calls():
+    sql = "SELECT coalesce((SELECT max(b) AS m FROM c), 0) AS v FROM (SELECT y AS z FROM d) AS e"
+    assert find_aliases(tokenize(sql)) == ["m", "v", "z", "e"]
+
+def test_referenced_tables_matches_whole_identifiers():
+    lookup = {"people": "People", "pets": "Pets", "peo": "Peo", "owners": "Owners"}
+    assert sorted(referenced_tables("SELECT 'owners' FROM People p JOIN pets ON p.people_id = 1", lookup)) == ["People", "Pets"]
@@ -0,0 +1,31 @@
+import json
+from table_summarizer import CHARS_PER_TOKEN, select_sample_queries
+
+def query(sql):
+    return {"query": sql, "translation": "..."}
+
+def cost(record):
+    return len(json.dumps(record, ensure_ascii=False)) // CHARS_PER_TOKEN + 1
+
+def test_drops_queries_that_only_differ_in_literals_and_formatting():
+    queries = [
+        query("SELECT name FROM singer WHERE age > 30"),
+        query("select  name from singer where age > 45"),
+        query("SELECT name FROM singer WHERE country = 'France'"),
+    ]
+    assert select_sample_queries(queries, token_budget=10_000) == [queries[0], queries[2]]
+
+def test_every_pattern_before_a_second_query_of_one_pattern():
+    queries = [
+        query("SELECT name FROM singer WHERE age > 30"),
+        query("SELECT name FROM singer WHERE age < 30"),
+        query("SELECT name FROM singer WHERE age = 30"),
+        query("SELECT count(*) FROM concert"),
+    ]
+    budget = cost(queries[0]) + cost(queries[3])
+    # the second and third singer queries do not fit once the concert query is in, and order is kept
+    assert select_sample_queries(queries, token_budget=budget) == [queries[0], queries[3]]
+
+def test_empty_and_too_small_budget():
+    assert select_sample_queries([]) == []
+    assert select_sample_queries([query("SELECT 1")], token_budget=0) == []
@@ -0,0 +1,36 @@
+import json
+from json_stream import write_record
+from validation import tables_to_regenerate, validate
+
+TABLES = {
+    "Singer": {"db_id": "concert", "cols": [{"col": "Singer_ID"}, {"col": "Name"}], "table_desc": None, "foreign_keys": []},
+    "concert": {"db_id": "concert", "cols": [{"col": "id"}], "table_desc": None, "foreign_keys": []},
+    "pets": {"db_id": "pets_1", "cols": [{"col": "PetID"}], "table_desc": None, "foreign_keys": []},
+    "owners": {"db_id": "pets_1", "cols": [{"col": "id"}], "table_desc": None, "foreign_keys": []},
+}
+
+def test_validate_ignores_order_and_case(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open("tables.json", 'w', encoding='utf-8') as file:
+        json.dump(TABLES, file)
+    with open("schemas.json", 'w', encoding='utf-8') as file:
+        for record in (
+            {"singer": {"cols": [{"col": "name"}, {"col": "singer_id"}]}},
+            {"CONCERT": {"cols": [{"col": "id"}, {"col": "extra"}]}},
+            {"pets": {"cols": [{"col": "petid"}]}},
+            {"Pets": {"cols": [{"col": "petid"}]}},
+            {"unknown": {"cols": []}},
+        ):
+            write_record(file, record)
+
+    result = validate("tables.json", "schemas.json")
+    assert result == {"missing": {"owners"}, "columns": {"concert"}, "duplicate": {"pets"}, "extra": {"unknown"}}
+    assert tables_to_regenerate(result) == {"owners", "concert", "pets"}
+
+def test_malformed_description_counts_as_wrong_columns(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open("tables.json", 'w', encoding='utf-8') as file:
+        json.dump({"pets": TABLES["pets"]}, file)
+    with open("schemas.json", 'w', encoding='utf-8') as file:
+        write_record(file, {"pets": {"cols": "PetID"}})
+    assert validate("tables.json", "schemas.json")["columns"] == {"pets"}
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+from vector_store import load_vectors, save_vectors
+
+def test_round_trip(tmp_path):
+    base = str(tmp_path / "vectors")
+    vectors = [[0.5, -1.0, 2.0], [1.0, 0.0, 0.25]]
+    save_vectors(base, ["a", "é"], vectors)
+    store = load_vectors(base)
+    assert len(store) == 2 and "é" in store and "b" not in store
+    assert store.vectors.dtype == np.float32 and isinstance(store.vectors, np.memmap)
+    assert store.as_list("é") == [1.0, 0.0, 0.25]
+    np.testing.assert_array_equal(store.get("a"), np.array(vectors[0], dtype=np.float32))
+    with pytest.raises(KeyError):
+        store.get("b")
+
+def test_missing_vectors(tmp_path):
+    assert load_vectors(str(tmp_path / "vectors")) is None
+
+def test_empty(tmp_path):
+    base = str(tmp_path / "vectors")
+    save_vectors(base, [], [])
+    assert len(load_vectors(base)) == 0
+
+def test_overwrite_while_mapped(tmp_path):
+    base = str(tmp_path / "vectors")
+    save_vectors(base, ["a"], [[1.0, 2.0]])
+    old = load_vectors(base)
+    save_vectors(base, ["b", "a"], [[3.0, 4.0], [5.0, 6.0]], dtype="float16")
+    # the old mapping still reads the file it was opened on
+    assert old.as_list("a") == [1.0, 2.0]
+    new = load_vectors(base)
+    assert new.ids == ["b", "a"] and new.vectors.dtype == np.float16 and new.as_list("a") == [5.0, 6.0]
+    assert not any(path.endswith(".tmp") for path in map(str, tmp_path.iterdir()))
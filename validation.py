@@ -0,0 +1,69 @@
+import argparse
+import sys
+from catalog import load_catalog
+from json_stream import read_records
+
+TABLE_FILE_PATH = "spider_tables.json"
+SCHEMA_FILE_PATH = "./metadata/spider_schemas.json"
+
+def column_signature(columns):
+    """Order-independent hash of a list of column names."""
+    return hash(tuple(sorted(col.lower() for col in columns)))
+
+def table_signature(table_data):
+    try:
+        return column_signature(col["col"] for col in table_data["cols"])
+    except (KeyError, TypeError, AttributeError):
+        return None
+
+def load_expected(file_path=TABLE_FILE_PATH):
+    """{table name (lower-cased): column signature} of the input tables."""
+    return {table.name.lower(): column_signature(table.column_names()) for table in load_catalog(file_path)}
+
+def validate(table_file=TABLE_FILE_PATH, schema_file=SCHEMA_FILE_PATH):
+    """
+    Compares the generated schema descriptions with the input tables, ignoring table and column order.
+    Returns {"missing", "columns", "duplicate", "extra"}, each a set of lower-cased table names:
+    tables without a description, with a different column set, described more than once, and
+    described but not in the input.
+    """
+    expected = load_expected(table_file)
+    seen = set()
+    result = {"missing": set(), "columns": set(), "duplicate": set(), "extra": set()}
+
+    for record in read_records(schema_file):
+        for table_name, table_data in record.items():
+            table_name = table_name.lower()
+            if table_name not in expected:
+                result["extra"].add(table_name)
+            elif table_name in seen:
+                result["duplicate"].add(table_name)
+            elif table_signature(table_data) != expected[table_name]:
+                result["columns"].add(table_name)
+            seen.add(table_name)
+
+    result["missing"] = expected.keys() - seen
+    return result
+
+def tables_to_regenerate(result):
+    return result["missing"] | result["columns"] | result["duplicate"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the generated schema descriptions against the input tables.")
+    parser.add_argument("--tables", default=TABLE_FILE_PATH)
+    parser.add_argument("--schemas", default=SCHEMA_FILE_PATH)
+    args = parser.parse_args()
+
+    result = validate(args.tables, args.schemas)
+    for kind, table_names in result.items():
+        for table_name in sorted(table_names):
+            print(f"{kind}: {table_name}")
+
+    bad = tables_to_regenerate(result)
+    if bad:
+        print(f"{len(bad)} tables need to be regenerated (python schema_loader.py --fix)")
+        sys.exit(1)
+    print("All tables match")
+
+if __name__ == "__main__":
+    main()